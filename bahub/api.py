@@ -4,8 +4,6 @@ Server API connector
 
 Notice: Only E2E tests coverage
 """
-import certifi
-import pycurl
 from subprocess import Popen, PIPE
 from io import BytesIO
 from json import JSONDecodeError, loads as json_loads
@@ -39,6 +37,10 @@ class BackupRepository(object):
     #         attributes=attributes
     #     )
     #
+    #     # pycurl and certifi are imported only when the API is really used (startup time)
+    #     import certifi
+    #     import pycurl
+    #
     #     curl = pycurl.Curl()
     #     curl.setopt(pycurl.URL, url)
     #     curl.setopt(pycurl.CAINFO, certifi.where())
@@ -0,0 +1,145 @@
+"""
+Batch
+=====
+
+Runs backups of many definitions at once, in a bounded pool of workers.
+
+Transports can limit how many definitions are processed at once on the same resource
+(e.g. Kubernetes namespace or Docker host) - see TransportInterface.get_concurrency_group()
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
+from fnmatch import fnmatchcase
+from threading import BoundedSemaphore, Lock
+from time import monotonic
+from typing import List, Dict, Optional, Callable, Iterable
+from .exception import ConfigurationError
+from .notifier import format_bytes
+from .transports.base import TransportInterface
+
+
+def resolve_definition_names(patterns: Iterable[str], available: Iterable[str]) -> List[str]:
+    """
+    Resolves definition names, globs (e.g. "db_*") and "all" keyword into a list of definition names
+    Order of definitions from the configuration file is kept
+    """
+
+    available = list(available)
+    selected = []
+
+    for pattern in patterns:
+        if pattern == 'all':
+            matches = available
+        else:
+            matches = [name for name in available if fnmatchcase(name, pattern)]
+
+        if not matches:
+            raise ConfigurationError('No backup definition matches "{}"'.format(pattern))
+
+        selected += [name for name in matches if name not in selected]
+
+    return selected
+
+
+@dataclass
+class DefinitionResult(object):
+    """
+    Result of a single definition processed by the backup-maker
+    """
+
+    definition_name: str
+    success: bool
+    elapsed: float
+    transferred_bytes: Optional[int] = None
+    error: str = ''
+
+
+class ConcurrencyLimiter(object):
+    """
+    Limits how many transports from the same concurrency group can run at once
+    """
+
+    _semaphores: Dict[str, BoundedSemaphore]
+    _lock: Lock
+
+    def __init__(self):
+        self._semaphores = {}
+        self._lock = Lock()
+
+    def configure(self, transports: Iterable[TransportInterface]):
+        """
+        When transports sharing a group have different limits, then the lowest limit wins
+        """
+
+        limits: Dict[str, int] = {}
+
+        for transport in transports:
+            limit = transport.get_concurrency_limit()
+
+            if limit:
+                group = transport.get_concurrency_group()
+                limits[group] = min(limit, limits.get(group, limit))
+
+        with self._lock:
+            self._semaphores = {group: BoundedSemaphore(limit) for group, limit in limits.items()}
+
+    @contextmanager
+    def limit(self, transport: TransportInterface):
+        semaphore = self._semaphores.get(transport.get_concurrency_group())
+
+        if semaphore is None:
+            yield
+            return
+
+        with semaphore:
+            yield
+
+
+def run_batch(names: List[str], run: Callable[[str], DefinitionResult], workers: int, limiter: ConcurrencyLimiter,
+              get_transport: Callable[[str], TransportInterface]) -> List[DefinitionResult]:
+    """
+    Runs `run` for each definition in a pool of workers, results are returned in order of `names`
+    """
+
+    def run_limited(name: str) -> DefinitionResult:
+        started_at = monotonic()
+
+        try:
+            with limiter.limit(get_transport(name)):
+                return run(name)
+
+        except Exception as e:
+            return DefinitionResult(definition_name=name, success=False, elapsed=monotonic() - started_at,
+                                    error=str(e))
+
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='backup') as executor:
+        return list(executor.map(run_limited, names))
+
+
+def format_summary(results: List[DefinitionResult]) -> str:
+    """
+    Formats a summary table, one definition per row
+    """
+
+    rows = [['Definition', 'Status', 'Time', 'Size', 'Error']]
+
+    for result in results:
+        rows.append([
+            result.definition_name,
+            'OK' if result.success else 'FAILED',
+            '{:.1f}s'.format(result.elapsed),
+            format_bytes(result.transferred_bytes) if result.transferred_bytes is not None else '-',
+            result.error
+        ])
+
+    widths = [max([len(row[column]) for row in rows]) for column in range(0, len(rows[0]))]
+    lines = [' | '.join([value.ljust(width) for value, width in zip(row, widths)]).rstrip() for row in rows]
+    lines.insert(1, '-+-'.join(['-' * width for width in widths]))
+
+    succeeded = len([result for result in results if result.success])
+    lines.append('')
+    lines.append('{} of {} definitions succeeded'.format(succeeded, len(results)))
+
+    return '\n'.join(lines)
@@ -9,12 +9,21 @@ Those binaries are fetched to the local cache, then are distributed to remote fi
 """
 
 
+import json
 import os.path
-from typing import List
-from tempfile import NamedTemporaryFile
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from threading import Lock, RLock
+from typing import List, Dict, Optional
+from uuid import uuid4
 from rkd.api.inputoutput import IO
-from bahub.fs import FilesystemInterface
-from bahub.versions import BACKUP_MAKER_BIN_VERSION, TRACEXIT_BIN_VERSION
+from bahub.bincache import find_blob_digest
+from bahub.exception import DownloadError
+from bahub.fs import FilesystemInterface, FilesystemOperationsBatch
+from bahub.versions import BACKUP_MAKER_BIN_VERSION, TRACEXIT_BIN_VERSION, BIN_CHECKSUMS
+
+DOWNLOAD_WORKERS = 4
+TOOLS_MANIFEST_FILENAME = ".manifest.json"
 
 
 class RequiredBinary(object):
@@ -23,9 +32,13 @@ class RequiredBinary(object):
     """
 
     url: str
+    sha256: str
+    checksums_url: str
 
-    def __init__(self, url: str):
+    def __init__(self, url: str, sha256: str = '', checksums_url: str = ''):
         self.url = url
+        self.sha256 = sha256
+        self.checksums_url = checksums_url
 
     def get_version(self) -> str:
         return "unknown"
@@ -39,6 +52,21 @@ class RequiredBinary(object):
     def get_url(self):
         return self.url
 
+    def get_sha256(self) -> str:
+        """
+        Pinned digest of the downloaded file (archive in case of archives). Empty - not verified
+        """
+
+        return self.sha256
+
+    def get_checksums_url(self) -> str:
+        """
+        File with sha256 digests of released files (e.g. "checksums.txt" of GoReleaser),
+        used when there is no pinned digest. Empty - not verified
+        """
+
+        return self.checksums_url
+
     def is_archive(self) -> bool:
         return self.url.endswith('tar.gz')
 
@@ -51,13 +79,16 @@ class RequiredBinaryFromGithubRelease(RequiredBinary):
     version: str
     binary_name: str
 
-    def __init__(self, project_name: str, version: str, binary_name: str):
+    def __init__(self, project_name: str, version: str, binary_name: str, sha256: str = '',
+                 checksums_name: str = ''):
         self.version = version
         self.binary_name = binary_name
+        release_url = "https://github.com/{project_name}/releases/download/{version}".format(
+            project_name=project_name, version=version
+        )
 
-        super().__init__("https://github.com/{project_name}/releases/download/{version}/{binary_name}".format(
-            project_name=project_name, version=version, binary_name=binary_name
-        ))
+        super().__init__(release_url + "/" + binary_name, sha256,
+                         release_url + "/" + checksums_name if checksums_name else '')
 
     def get_version(self) -> str:
         return self.version
@@ -72,8 +103,9 @@ class RequiredBinaryFromGithubReleasePackedInArchive(RequiredBinaryFromGithubRel
     (e.g. by GoReleaser)
     """
 
-    def __init__(self, project_name: str, version: str, binary_name: str, archive_name: str):
-        super().__init__(project_name, version, archive_name)
+    def __init__(self, project_name: str, version: str, binary_name: str, archive_name: str, sha256: str = '',
+                 checksums_name: str = ''):
+        super().__init__(project_name, version, archive_name, sha256, checksums_name)
         self.binary_name = binary_name
 
     def is_archive(self) -> bool:
@@ -81,13 +113,17 @@ class RequiredBinaryFromGithubReleasePackedInArchive(RequiredBinaryFromGithubRel
 
 
 def download_required_tools(fs: FilesystemInterface, io: IO, bin_path: str,
-                            versions_path: str, binaries: List[RequiredBinary]) -> None:
+                            versions_path: str, binaries: List[RequiredBinary],
+                            workers: int = DOWNLOAD_WORKERS) -> None:
     """
     Collects all binaries VERSIONED into /bin/versions
     Does not download binary twice.
 
     Actually this method should be used to download tools into local `Backup Controller` cache at first stage.
     At later stage - tools are copied to target environment and symbolic links are used.
+
+    Missing binaries are downloaded in parallel. Archives are kept next to versions until they are unpacked,
+    so an interrupted download can be resumed by next run (when filesystem supports it - see LocalFilesystem)
     """
 
     io.debug("Preparing environment")
@@ -95,28 +131,120 @@ def download_required_tools(fs: FilesystemInterface, io: IO, bin_path: str,
     fs.force_mkdir(bin_path)
     fs.force_mkdir(versions_path)
 
+    missing = {}
+
     for binary in binaries:
         version_path = versions_path + "/" + binary.get_full_name_with_version()
 
         io.debug(f"Searching for tool {version_path}")
 
-        if not fs.file_exists(version_path):
-            io.debug(f"Downloading tool {binary.get_url()} into {version_path}")
+        if version_path not in missing and not fs.file_exists(version_path):
+            missing[version_path] = binary
+
+    if not missing:
+        return
+
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(missing)))) as executor:
+        futures = [executor.submit(_download_required_tool, fs, io, binary, versions_path, version_path)
+                   for version_path, binary in missing.items()]
+
+    # all downloads are finished at this point, the first error (if any) is raised
+    for future in futures:
+        future.result()
+
+
+def _download_required_tool(fs: FilesystemInterface, io: IO, binary: RequiredBinary,
+                            versions_path: str, version_path: str) -> None:
+    io.debug(f"Downloading tool {binary.get_url()} into {version_path}")
+    sha256 = _find_sha256(fs, io, binary, versions_path)
+
+    if binary.is_archive():
+        archive_path = versions_path + "/." + binary.get_full_name_with_version() + ".tar.gz"
+        tmp_dir = fs.find_temporary_dir_path()
+        fs.force_mkdir(tmp_dir)
+        fs.download(binary.get_url(), archive_path, sha256=sha256)
+        fs.unpack(archive_path, tmp_dir)
+        fs.move(tmp_dir + "/" + binary.get_filename(), version_path)
+        fs.make_executable(version_path)
+        fs.delete_file(archive_path)
+    else:
+        fs.download(binary.get_url(), version_path, sha256=sha256)
+        fs.make_executable(version_path)
+
+
+def _find_sha256(fs: FilesystemInterface, io: IO, binary: RequiredBinary, versions_path: str) -> str:
+    """
+    Pinned digest, or a digest published in the checksums file of the release.
+    The checksums file is optional - when it cannot be downloaded, then the file is downloaded without verification
+    """
+
+    if binary.get_sha256() or not binary.get_checksums_url():
+        return binary.get_sha256()
+
+    checksums_path = versions_path + "/." + binary.get_full_name_with_version() + ".checksums"
+
+    try:
+        fs.download(binary.get_checksums_url(), checksums_path)
+
+    except (DownloadError, AssertionError) as e:
+        io.warn(f"Cannot download checksums file, {binary.get_url()} will not be verified. {e}")
+        return ''
+
+    try:
+        digests = parse_checksums(fs.read_file(checksums_path))
+    finally:
+        fs.delete_file(checksums_path)
+
+    filename = os.path.basename(binary.get_url())
+
+    if filename not in digests:
+        raise DownloadError.from_missing_checksum(binary.get_checksums_url(), filename)
+
+    return digests[filename]
+
+
+def parse_checksums(content: str) -> Dict[str, str]:
+    """
+    Parses output of "sha256sum" (file name -> digest)
+    """
+
+    digests = {}
+
+    for line in content.splitlines():
+        parts = line.split()
 
-            if binary.is_archive():
-                tmp_dir = fs.find_temporary_dir_path()
-                fs.force_mkdir(tmp_dir)
-                fs.download(binary.get_url(), tmp_dir + "/archive.tar.gz")
-                fs.unpack(tmp_dir + "/archive.tar.gz", tmp_dir)
-                fs.move(tmp_dir + "/" + binary.get_filename(), version_path)
-                fs.make_executable(version_path)
-            else:
-                fs.download(binary.get_url(), version_path)
-                fs.make_executable(version_path)
+        if len(parts) == 2:
+            # "*" marks a file read in binary mode
+            digests[parts[1].lstrip('*')] = parts[0].lower()
+
+    return digests
+
+
+class TargetEnvironmentLocks(object):
+    """
+    Serializes preparation of the same target environment (e.g. a container) by definitions processed in parallel -
+    the second definition sees tools installed by the first one
+    """
+
+    _locks: Dict[str, RLock] = {}
+    _lock = Lock()
+
+    @classmethod
+    @contextmanager
+    def lock(cls, target: str):
+        with cls._lock:
+            if target not in cls._locks:
+                cls._locks[target] = RLock()
+
+            lock = cls._locks[target]
+
+        with lock:
+            yield
 
 
 def copy_encryption_keys_from_controller_to_target_env(src_fs: FilesystemInterface, dst_fs: FilesystemInterface,
-                                                       pub_key_path: str, private_key_path: str, io: IO) -> None:
+                                                       pub_key_path: str, private_key_path: str, io: IO,
+                                                       batch: Optional[FilesystemOperationsBatch] = None) -> None:
     """
     Copies GPG keys from source to REMOTE filesystem
 
@@ -125,24 +253,37 @@ def copy_encryption_keys_from_controller_to_target_env(src_fs: FilesystemInterfa
     :param pub_key_path:
     :param private_key_path:
     :param io:
+    :param batch: Batch of dst_fs to join (e.g. to upload keys together with tools), executed immediately if empty
     :return:
     """
 
+    if batch is None:
+        with dst_fs.batch() as batch:
+            return copy_encryption_keys_from_controller_to_target_env(src_fs, dst_fs, pub_key_path,
+                                                                      private_key_path, io, batch)
+
     io.info("Copying encryption keys")
 
     for key_type, key_path in {'key': private_key_path, 'pub': pub_key_path}.items():
         if key_path and src_fs.file_exists(key_path):
             io.debug(f"{key_path} -> /tmp/.gpg.{key_type}")
-            dst_fs.copy_to(key_path, f"/tmp/.gpg.{key_type}")
+            batch.copy_to(key_path, f"/tmp/.gpg.{key_type}")
 
 
 def copy_required_tools_from_controller_cache_to_target_env(local_cache_fs: FilesystemInterface,
                                                             dst_fs: FilesystemInterface, io: IO,
                                                             bin_path: str, versions_path: str, local_versions_path: str,
-                                                            binaries: List[RequiredBinary]):
+                                                            binaries: List[RequiredBinary],
+                                                            batch: Optional[FilesystemOperationsBatch] = None):
     """
     Pack selected binaries from local cache, send them to remote filesystem and unpack
 
+    Installed versions are listed in a manifest file at destination filesystem. When the manifest contains
+    required binaries, then the destination is up-to-date and nothing is copied (single read from dst_fs).
+    The manifest lists binaries of all definitions using the destination - new entries are merged into it.
+    Digests of local versions are names of binaries cache blobs, so local files are not read
+    Definitions processed in parallel should hold TargetEnvironmentLocks.lock() of the destination
+
     :param local_cache_fs: Local filesystem where we store cache
     :param dst_fs: Destination filesystem e.g. Kubernetes POD's FS or docker container FS
     :param io:
@@ -150,35 +291,54 @@ def copy_required_tools_from_controller_cache_to_target_env(local_cache_fs: File
     :param versions_path: dst_fs's path where the versioned binaries are stored
     :param local_versions_path:
     :param binaries:
+    :param batch: Batch of dst_fs to join, executed immediately if empty
     :return:
     """
 
+    if batch is None:
+        with dst_fs.batch() as batch:
+            return copy_required_tools_from_controller_cache_to_target_env(
+                local_cache_fs, dst_fs, io, bin_path, versions_path, local_versions_path, binaries, batch
+            )
+
     io.info("Copying required tools from scheduler to Backup Maker target environment")
-    selected_files_to_transfer = []
+    manifest_path = versions_path + "/" + TOOLS_MANIFEST_FILENAME
+    required = {
+        binary.get_full_name_with_version(): _get_local_digest(
+            local_cache_fs, local_versions_path + "/" + binary.get_full_name_with_version())
+        for binary in binaries
+    }
 
     # 1: Collect list of binaries that needs to be packed into archive
-    for binary in binaries:
-        version_path = versions_path + "/" + binary.get_full_name_with_version()
+    installed = read_tools_manifest(dst_fs.read_file(manifest_path))
+    installed_binaries = installed.get('binaries', {}) if installed.get('bin_path') == bin_path else {}
+    selected_files_to_transfer = [name for name, digest in required.items()
+                                  if not digest or installed_binaries.get(name) != digest]
+
+    if not binaries or not selected_files_to_transfer:
+        io.info(f"All binaries are up-to-date")
+        return
 
-        if not dst_fs.file_exists(version_path):
-            selected_files_to_transfer.append(binary.get_full_name_with_version())
+    # binaries installed by other definitions stay listed
+    manifest = create_tools_manifest(bin_path, {**installed_binaries, **required})
 
     io.info(f"Missing binaries: {selected_files_to_transfer}. Will be copied to target environment")
 
-    if not selected_files_to_transfer:
-        io.info(f"All binaries are up-to-date")
-        return
+    # 2: Pack everything into archive, upload together with other files of the batch
+    # files are staged under unique names - other process can install tools at the same target at the same time
+    run_id = uuid4().hex
 
-    # 2: Pack everything into archive
-    with NamedTemporaryFile() as tmp_archive_path:
-        local_cache_fs.pack(tmp_archive_path.name, local_versions_path, selected_files_to_transfer)
+    archive_path = batch.get_staging_path('backup-tools.tar.gz')
+    remote_archive_path = f'/tmp/.backup-tools.{run_id}.tar.gz'
+    local_cache_fs.pack(archive_path, local_versions_path, selected_files_to_transfer)
+    batch.copy_to(archive_path, remote_archive_path)
 
-        # 3: Unpack archive at destination filesystem
-        io.debug(f"Unpacking at {versions_path}")
-        dst_fs.copy_to(tmp_archive_path.name, '/tmp/.backup-tools.tar.gz')
-        dst_fs.force_mkdir(bin_path)
-        dst_fs.force_mkdir(versions_path)
-        dst_fs.unpack('/tmp/.backup-tools.tar.gz', versions_path)
+    # 3: Unpack archive at destination filesystem
+    io.debug(f"Unpacking at {versions_path}")
+    batch.force_mkdir(bin_path)
+    batch.force_mkdir(versions_path)
+    batch.unpack(remote_archive_path, versions_path)
+    batch.delete_file(remote_archive_path)
 
     # 3: Link versioned files into generic names e.g. "v1.2.3-pg-backuper" into "pg-backuper"
     for binary in binaries:
@@ -186,9 +346,40 @@ def copy_required_tools_from_controller_cache_to_target_env(local_cache_fs: File
         version_path = versions_path + "/" + binary.get_full_name_with_version()
 
         io.debug(f"Linking version {version_path} into {target_bin_path}")
-        dst_fs.delete_file(target_bin_path)
-        dst_fs.link(version_path, target_bin_path)
-        dst_fs.make_executable(version_path)
+        batch.delete_file(target_bin_path)
+        batch.link(version_path, target_bin_path)
+        batch.make_executable(version_path)
+
+    # 4: Put in place at last - an interrupted installation is repeated next time
+    manifest_staging_path = batch.get_staging_path(TOOLS_MANIFEST_FILENAME)
+
+    with open(manifest_staging_path, 'w') as f:
+        f.write(json.dumps(manifest, sort_keys=True))
+
+    batch.copy_to(manifest_staging_path, f'/tmp/.backup-tools-manifest.{run_id}.json')
+    batch.move(f'/tmp/.backup-tools-manifest.{run_id}.json', manifest_path)
+
+
+def _get_local_digest(local_cache_fs: FilesystemInterface, path: str) -> str:
+    return find_blob_digest(path) or local_cache_fs.checksum(path)
+
+
+def create_tools_manifest(bin_path: str, binaries: Dict[str, str]) -> dict:
+    """
+    Describes installed tools: versions with sha256 digests and where they are linked
+    """
+
+    return {'bin_path': bin_path, 'binaries': binaries}
+
+
+def read_tools_manifest(content: str) -> dict:
+    try:
+        manifest = json.loads(content) if content else {}
+
+    except ValueError:
+        return {}
+
+    return manifest if isinstance(manifest, dict) else {}
 
 
 def get_backup_maker_binaries() -> List[RequiredBinary]:
@@ -198,13 +389,17 @@ def get_backup_maker_binaries() -> List[RequiredBinary]:
             version=BACKUP_MAKER_BIN_VERSION,
             binary_name="br-backup-maker",
             # todo: support for multiple architectures
-            archive_name="br-backup-maker_0.0.4_linux_amd64.tar.gz"
+            archive_name="br-backup-maker_0.0.4_linux_amd64.tar.gz",
+            sha256=BIN_CHECKSUMS.get("br-backup-maker_0.0.4_linux_amd64.tar.gz", ""),
+            checksums_name=f"br-backup-maker_{BACKUP_MAKER_BIN_VERSION}_checksums.txt"
         ),
         RequiredBinaryFromGithubReleasePackedInArchive(
             project_name="riotkit-org/tracexit",
             version=TRACEXIT_BIN_VERSION,
             binary_name="tracexit",
             # todo: support for multiple architectures
-            archive_name=f"tracexit_{TRACEXIT_BIN_VERSION}_linux_amd64.tar.gz"
+            archive_name=f"tracexit_{TRACEXIT_BIN_VERSION}_linux_amd64.tar.gz",
+            sha256=BIN_CHECKSUMS.get(f"tracexit_{TRACEXIT_BIN_VERSION}_linux_amd64.tar.gz", ""),
+            checksums_name=f"tracexit_{TRACEXIT_BIN_VERSION}_checksums.txt"
         )
     ]
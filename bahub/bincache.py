@@ -0,0 +1,247 @@
+"""
+Binaries Cache
+==============
+
+Content-addressed store of downloaded binaries. Each file is kept once as a blob named by its sha256 digest,
+versions (e.g. "v1.1.0-tracexit") are symbolic links to blobs - so lookup of a version is a single stat
+and the same file released under multiple versions is stored only once.
+
+Least recently used versions are removed when the cache grows over its size limit.
+"""
+
+import hashlib
+import os
+import re
+from dataclasses import dataclass, field
+from threading import Lock
+from time import time
+from typing import List, Dict, Iterable, Optional
+
+SIZE_UNITS = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+
+# blob that was just created could be not linked yet by other process
+UNUSED_BLOB_GRACE_PERIOD = 60
+
+
+def parse_size(value: str) -> int:
+    """
+    Parses size e.g. "512M", "1G", "1024" (bytes)
+    """
+
+    match = re.fullmatch(r'\s*(\d+)\s*([KMG]?)B?\s*', str(value).upper())
+
+    if not match:
+        raise ValueError('Invalid size "{}", expected e.g. "512M", "1G" or number of bytes'.format(value))
+
+    return int(match.group(1)) * SIZE_UNITS[match.group(2)]
+
+
+@dataclass
+class CacheEntry(object):
+    name: str
+    digest: str
+    size: int
+    last_used: float
+
+
+@dataclass
+class CacheStats(object):
+    versions: int
+    blobs: int
+    size: int
+    deduplicated_size: int
+
+
+@dataclass
+class CollectedGarbage(object):
+    removed_versions: List[str] = field(default_factory=list)
+    removed_blobs: List[str] = field(default_factory=list)
+    freed_size: int = 0
+
+
+def find_blob_digest(version_path: str) -> Optional[str]:
+    """
+    Digest of a cached version - name of the blob it links to, the file is not read
+
+    :return: None, when the version is not a link to a blob
+    """
+
+    if not os.path.islink(version_path):
+        return None
+
+    digest = os.path.basename(os.readlink(version_path))
+
+    return digest if re.fullmatch(r'[0-9a-f]{64}', digest) else None
+
+
+class BinariesCache(object):
+    _versions_path: str
+    _blobs_path: str
+    _lock: Lock
+
+    def __init__(self, versions_path: str, blobs_path: str):
+        self._versions_path = versions_path
+        self._blobs_path = blobs_path
+        self._lock = Lock()
+
+    def store(self, name: str) -> Optional[str]:
+        """
+        Moves a downloaded version into the store (replaces it with a link to a blob). Marks version as used
+
+        :return: Digest of the blob, None if there is no such version
+        """
+
+        version_path = self._versions_path + '/' + name
+
+        with self._lock:
+            if os.path.islink(version_path):
+                digest = os.path.basename(os.readlink(version_path))
+
+            elif os.path.isfile(version_path):
+                digest = self._create_blob(version_path)
+                self._link(digest, version_path)
+
+            else:
+                return None
+
+        self.touch(name)
+
+        return digest
+
+    def touch(self, name: str):
+        """
+        Marks version as recently used - least recently used versions are removed at first
+        """
+
+        try:
+            os.utime(self._versions_path + '/' + name, follow_symlinks=False)
+
+        except FileNotFoundError:
+            pass
+
+    def entries(self) -> List[CacheEntry]:
+        entries = []
+
+        for name in self._list(self._versions_path):
+            path = self._versions_path + '/' + name
+
+            if not os.path.islink(path):
+                continue
+
+            digest = os.path.basename(os.readlink(path))
+
+            try:
+                size = os.stat(self._blobs_path + '/' + digest).st_size
+            except FileNotFoundError:
+                size = 0
+
+            entries.append(CacheEntry(name=name, digest=digest, size=size,
+                                      last_used=os.lstat(path).st_mtime))
+
+        return entries
+
+    def stats(self) -> CacheStats:
+        entries = self.entries()
+        blobs = self._get_blobs_sizes()
+        size = sum(blobs.values())
+
+        return CacheStats(
+            versions=len(entries),
+            blobs=len(blobs),
+            size=size,
+            deduplicated_size=max(0, sum([entry.size for entry in entries]) - size)
+        )
+
+    def collect_garbage(self, max_size: int, keep: Iterable[str] = ()) -> CollectedGarbage:
+        """
+        Removes broken versions, blobs not used by any version, then least recently used versions
+        until the cache fits in "max_size". Versions listed in "keep" are never removed
+        """
+
+        keep = set(keep)
+        result = CollectedGarbage()
+
+        with self._lock:
+            blobs = self._get_blobs_sizes()
+            entries = []
+
+            for entry in self.entries():
+                if entry.digest not in blobs:
+                    self._remove_version(entry.name, result)
+                    continue
+
+                entries.append(entry)
+
+            used_by: Dict[str, int] = {}
+
+            for entry in entries:
+                used_by[entry.digest] = used_by.get(entry.digest, 0) + 1
+
+            for digest in [digest for digest in blobs if digest not in used_by]:
+                if time() - os.stat(self._blobs_path + '/' + digest).st_mtime > UNUSED_BLOB_GRACE_PERIOD:
+                    self._remove_blob(digest, blobs, result)
+
+            size = sum(blobs.values())
+
+            for entry in sorted(entries, key=lambda e: e.last_used):
+                if size <= max_size:
+                    break
+
+                if entry.name in keep:
+                    continue
+
+                self._remove_version(entry.name, result)
+                used_by[entry.digest] -= 1
+
+                if not used_by[entry.digest]:
+                    size -= blobs[entry.digest]
+                    self._remove_blob(entry.digest, blobs, result)
+
+        return result
+
+    def _create_blob(self, path: str) -> str:
+        digest = hashlib.sha256()
+
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 64), b''):
+                digest.update(chunk)
+
+        blob_path = self._blobs_path + '/' + digest.hexdigest()
+        os.makedirs(self._blobs_path, exist_ok=True)
+
+        if os.path.isfile(blob_path):
+            os.unlink(path)
+        else:
+            os.replace(path, blob_path)
+
+        return digest.hexdigest()
+
+    def _link(self, digest: str, version_path: str):
+        """
+        Replaces version with a link atomically - concurrently running process always sees a complete file
+        """
+
+        tmp_path = '{}/.{}.{}.{}.link'.format(os.path.dirname(version_path), os.path.basename(version_path),
+                                              os.getpid(), int(time() * 1000000))
+        os.symlink(os.path.relpath(self._blobs_path + '/' + digest, os.path.dirname(version_path)), tmp_path)
+        os.replace(tmp_path, version_path)
+
+    def _remove_version(self, name: str, result: CollectedGarbage):
+        os.unlink(self._versions_path + '/' + name)
+        result.removed_versions.append(name)
+
+    def _remove_blob(self, digest: str, blobs: Dict[str, int], result: CollectedGarbage):
+        os.unlink(self._blobs_path + '/' + digest)
+        result.removed_blobs.append(digest)
+        result.freed_size += blobs.pop(digest)
+
+    def _get_blobs_sizes(self) -> Dict[str, int]:
+        return {name: os.stat(self._blobs_path + '/' + name).st_size for name in self._list(self._blobs_path)}
+
+    @staticmethod
+    def _list(path: str) -> List[str]:
+        try:
+            return sorted([name for name in os.listdir(path) if not name.startswith('.')])
+
+        except FileNotFoundError:
+            return []
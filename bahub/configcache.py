@@ -0,0 +1,137 @@
+"""
+Configuration cache
+===================
+
+Keeps parsed and validated configuration file on disk, so next runs can skip YAML parsing
+and schema validation when the file did not change.
+
+Configuration is stored before environment variables are substituted - secrets passed through environment
+are never written to the cache.
+"""
+
+import hashlib
+import json
+import os
+from importlib.metadata import version as package_version, PackageNotFoundError
+from tempfile import NamedTemporaryFile
+from typing import Optional, Union
+from rkd.api.inputoutput import IO
+from rkd.yaml_parser import YamlFileLoader
+
+# increase when format of cached files changes
+CACHE_FORMAT_VERSION = '1'
+
+
+def get_bahub_version() -> str:
+    try:
+        return package_version('bahub')
+
+    except PackageNotFoundError:
+        return ''
+
+
+class CompiledConfigurationCache(object):
+    """
+    One cache file per configuration file path. The file keeps a key - hash of configuration file content,
+    schema and version of the application. When the key does not match, then the entry is replaced
+    """
+
+    _directory: str
+    _io: IO
+
+    def __init__(self, directory: str, io: IO):
+        self._directory = directory
+        self._io = io
+
+    def load(self, filename: str, schema_name: str, parser: YamlFileLoader) -> Union[dict, list]:
+        """
+        Loads configuration through the cache. Works like YamlFileLoader.load_from_file()
+        """
+
+        file_path = parser.find_path_by_name(filename, '')
+        schema_path = parser.find_path_by_name(schema_name.replace('/', '-') + '.json', 'schema')
+
+        if not file_path or not schema_path:
+            return parser.load_from_file(filename, schema_name)
+
+        with open(file_path, 'rb') as f:
+            content = f.read()
+
+        key = self.create_key(content, schema_path)
+        cache_path = self._get_cache_path(file_path)
+        cached = self._read(cache_path, key)
+
+        if cached is not None:
+            self._io.debug('Configuration loaded from cache "{}"'.format(cache_path))
+            return cached
+
+        parsed = parser.load(content, schema_name)
+        self._write(cache_path, key, parsed)
+
+        return parsed
+
+    @staticmethod
+    def create_key(content: bytes, schema_path: str) -> str:
+        digest = hashlib.sha256()
+        digest.update(content)
+
+        with open(schema_path, 'rb') as f:
+            digest.update(f.read())
+
+        digest.update((CACHE_FORMAT_VERSION + ':' + get_bahub_version()).encode('utf-8'))
+
+        return digest.hexdigest()
+
+    def _get_cache_path(self, file_path: str) -> str:
+        name = hashlib.sha256(os.path.abspath(file_path).encode('utf-8')).hexdigest()
+
+        return self._directory + '/' + name + '.json'
+
+    def _read(self, cache_path: str, key: str) -> Optional[Union[dict, list]]:
+        try:
+            with open(cache_path, 'rb') as f:
+                entry = json.loads(f.read())
+
+        except (OSError, ValueError):
+            return None
+
+        if not isinstance(entry, dict) or entry.get('key') != key:
+            return None
+
+        return entry.get('config')
+
+    def _write(self, cache_path: str, key: str, parsed: Union[dict, list]):
+        """
+        Writes atomically - a concurrently started process reads either the previous or the new version
+        """
+
+        try:
+            serialized = json.dumps({'key': key, 'config': parsed})
+
+            # e.g. dates or integer keys in YAML would be different after reading from JSON
+            if json.loads(serialized)['config'] != parsed:
+                self._io.debug('Configuration cannot be cached, it contains values not representable in JSON')
+                return
+
+        except (TypeError, ValueError) as e:
+            self._io.debug('Configuration cannot be cached: {}'.format(str(e)))
+            return
+
+        tmp_path = None
+
+        try:
+            os.makedirs(self._directory, mode=0o700, exist_ok=True)
+
+            with NamedTemporaryFile('w', dir=self._directory, prefix='.', suffix='.tmp', delete=False) as f:
+                tmp_path = f.name
+                f.write(serialized)
+
+            os.chmod(tmp_path, 0o600)
+            os.replace(tmp_path, cache_path)
+
+        except OSError as e:
+            # cache is only an optimization
+            self._io.debug('Cannot write configuration cache: {}'.format(str(e)))
+
+            if tmp_path and os.path.exists(tmp_path):
+                os.unlink(tmp_path)
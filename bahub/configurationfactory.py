@@ -1,11 +1,12 @@
 
 import os
-import re
-from typing import Tuple, Type, Union, Dict, List
-from json import dumps as json_encode, loads as json_decode
+from threading import RLock
+from typing import Tuple, Type, Union, Dict, List, Optional
 from rkd.api.inputoutput import IO
 from rkd.yaml_parser import YamlFileLoader
 from .adapters.base import AdapterInterface
+from .configcache import CompiledConfigurationCache
+from .env import substitute_env_variables
 from .importing import Importing
 from .model import Encryption
 from .model import ServerAccess
@@ -14,10 +15,16 @@ from .errorhandler import ErrorHandlerFactory, ErrorHandlerInterface
 from .notifier import NotifierInterface, NotifierFactory
 from .exception import ConfigurationFactoryException, ConfigurationError, SpecificationError
 from .transports.base import TransportInterface
+from .security import SensitiveDataRedactor
+from .scheduler import CronSchedule
 
 
 class ConfigurationFactory(object):
-    """ Constructs objects basing on the configuration file """
+    """ Constructs objects basing on the configuration file
+
+    Transports and backup definitions (with their adapters) are constructed lazily - on first access,
+    so only what is really used is imported and validated. Use lazy=False or validate_all() to construct all of them
+    """
 
     _accesses: dict        # type: dict[ServerAccess]
     _encryption: dict      # type: dict[Encryption]
@@ -26,15 +33,30 @@ class ConfigurationFactory(object):
     _notifiers: dict       # type: dict[NotifierInterface]
     _transports: dict      # type: dict[TransportInterface]
     _adapters: dict        # type: dict[Type[AdapterInterface]]
+    _transports_config: dict  # raw configuration of transports, that were not constructed yet
+    _backups_config: dict     # raw configuration of backups, that were not constructed yet
     _debug = False         # type: bool
     _config_dir: str
     _io: IO
+    _redactor: SensitiveDataRedactor
+    _lock: RLock
 
-    def __init__(self, configuration_path: str, debug: bool, parser: YamlFileLoader, io: IO):
+    def __init__(self, configuration_path: str, debug: bool, parser: YamlFileLoader, io: IO, lazy: bool = True,
+                 cache: Optional[CompiledConfigurationCache] = None):
         self._io = io
         self._debug = debug
+        self._lock = RLock()
         self._config_dir = os.path.abspath(os.path.dirname(configuration_path))
-        self._parse(self._process_env_variables(parser.load_from_file(configuration_path, 'org.riotkit.bahub')))
+
+        if cache:
+            config = cache.load(configuration_path, 'org.riotkit.bahub', parser)
+        else:
+            config = parser.load_from_file(configuration_path, 'org.riotkit.bahub')
+
+        self._parse(self._process_env_variables(config))
+
+        if not lazy:
+            self.validate_all()
 
     def _parse(self, config: dict):
         self._accesses = {}
@@ -44,34 +66,47 @@ class ConfigurationFactory(object):
         self._notifiers = {}
         self._transports = {}
         self._adapters = {}
+        self._transports_config = config['transports']
+        self._backups_config = config['backups']
 
         self._parse_accesses(config['accesses'])
         self._parse_encryption(config['encryption'])
-        self._parse_transports(config['transports'])
-        self._parse_backups(config['backups'])
         self._parse_monitoring_error_handlers(config.get('error_handlers', {}))
         self._parse_notifiers(config.get('notifiers', {}))
 
-    def _process_env_variables(self, content: Union[dict, list]) -> Union[dict, list]:
-        content_as_str: str = json_encode(content)
+    def validate_all(self) -> None:
+        """
+        Constructs all transports and definitions - validates whole configuration file at once
+        """
+
+        for transport_name in self._transports_config.keys():
+            self.get_transport(transport_name)
+
+        for backup_name in self._backups_config.keys():
+            self.get_definition(backup_name)
 
-        env_list = list(dict(os.environ).items())
-        env_list.sort(key=lambda item: (-len(item[0]), item[0]))
+    def _process_env_variables(self, content: Union[dict, list]) -> Union[dict, list]:
+        # special variables have lower priority than environment
+        variables = {'CONFIG_DIR': self._config_dir, **os.environ}
+        content, unresolved = substitute_env_variables(content, variables)
 
-        # add special variables:
-        env_list.append(['CONFIG_DIR', self._config_dir])
+        if unresolved:
+            paths_by_name: Dict[str, List[str]] = {}
 
-        for env in env_list:
-            content_as_str = content_as_str.replace('${' + env[0] + '}', env[1])
+            for name, path in unresolved:
+                paths_by_name.setdefault(name, [])
 
-        invalid_vars = set(re.findall('\${([A-Z0-9a-z_]+)}', content_as_str))
+                if path and path not in paths_by_name[name]:
+                    paths_by_name[name].append(path)
 
-        if len(invalid_vars) > 0:
             raise ConfigurationFactoryException(
-                'Following environment variables cannot be resolved: ' + (', '.join(invalid_vars))
+                'Following environment variables cannot be resolved: ' + (', '.join([
+                    name + (' (at ' + ', '.join(paths) + ')' if paths else '')
+                    for name, paths in paths_by_name.items()
+                ]))
             )
 
-        return json_decode(content_as_str)
+        return content
 
     def _parse_accesses(self, config: dict):
         """Access tokens"""
@@ -92,48 +127,62 @@ class ConfigurationFactory(object):
                     raise ConfigurationError('Encryption "%s" is missing "%s" configuration option' %
                                              (enc_name, config_key_name))
 
-    def _parse_transports(self, config: dict) -> None:
+    def _parse_transport(self, transport_name: str, config: dict) -> None:
         """Transports - eg. sh, docker"""
 
-        for transport_name, config in config.items():
-            with DefinitionFactoryErrorCatcher('transports.' + transport_name, self._debug):
-                try:
-                    transport: Union[Type[TransportInterface], TransportInterface.__init__] = \
-                        Importing.import_transport(config['type'])
+        with DefinitionFactoryErrorCatcher('transports.' + transport_name, self._debug):
+            try:
+                transport: Union[Type[TransportInterface], TransportInterface.__init__] = \
+                    Importing.import_transport(config['type'])
 
-                    transport.validate_spec(config['spec'])
+                transport.validate_spec(config['spec'])
 
-                    self._transports[transport_name] = transport(config['spec'], self._io)
+                self._transports[transport_name] = transport(config['spec'], self._io)
 
-                except KeyError as config_key_name:
-                    raise ConfigurationError('Transport "%s" is missing "%s" configuration option' %
-                                             (transport_name, config_key_name))
+                # output of the backup process is stripped out of sensitive data such as passwords
+                self._transports[transport_name].set_redactor(self.get_sensitive_data_redactor())
 
-    def _parse_backups(self, config: dict):
+            except KeyError as config_key_name:
+                raise ConfigurationError('Transport "%s" is missing "%s" configuration option' %
+                                         (transport_name, config_key_name))
+
+    def _parse_backup(self, backup_name: str, config: dict):
         """Backups"""
 
-        for backup_name, config in config.items():
-            with DefinitionFactoryErrorCatcher('backups.' + backup_name, self._debug):
+        with DefinitionFactoryErrorCatcher('backups.' + backup_name, self._debug):
+            # raw configuration is kept untouched, objects are placed in a copy
+            config = {**config, 'meta': {**config['meta']}}
 
-                # find related access and encryption
-                if not config['meta']['access'] in self._accesses.keys():
-                    raise ConfigurationError('Backup "%s" has incorrect "access" specified' % backup_name)
+            # find related access and encryption
+            if not config['meta']['access'] in self._accesses.keys():
+                raise ConfigurationError('Backup "%s" has incorrect "access" specified' % backup_name)
 
-                config['meta']['access'] = self._accesses[config['meta']['access']]
+            config['meta']['access'] = self._accesses[config['meta']['access']]
 
-                if "encryption" in config['meta']:
-                    config['meta']['encryption'] = self._encryption[config['meta']['encryption']]
+            if "encryption" in config['meta']:
+                config['meta']['encryption'] = self._encryption[config['meta']['encryption']]
 
-                config['meta']['transport'] = self._transports[config['meta']['transport']]
+            if config['meta']['transport'] not in self._transports_config:
+                raise ConfigurationError('Backup "%s" has incorrect "transport" specified' % backup_name)
 
-                adapter, definition = self._create_definition(
-                    config['meta']['type'],
-                    config,
-                    backup_name
-                )
+            config['meta']['transport'] = self.get_transport(config['meta']['transport'])
 
-                self._backups[backup_name] = definition
-                self._adapters[backup_name] = adapter
+            adapter, definition = self._create_definition(
+                config['meta']['type'],
+                config,
+                backup_name
+            )
+
+            # fail early on invalid schedule, not when the daemon is already running
+            if definition.get_schedule():
+                CronSchedule(definition.get_schedule())
+
+            self._backups[backup_name] = definition
+            self._adapters[backup_name] = adapter
+
+            # secrets of definitions constructed after the redactor was created
+            if hasattr(self, '_redactor'):
+                self._redactor.add_words(definition.get_sensitive_information())
 
     @staticmethod
     def _create_definition(def_type: str, config: dict,
@@ -158,11 +207,6 @@ class ConfigurationFactory(object):
     def _parse_notifiers(self, config: dict):
         """Notifiers"""
 
-        sensitive_data = []
-
-        for definition in self._backups.values():
-            sensitive_data += definition.get_sensitive_information()
-
         for key, values in config.items():
             with DefinitionFactoryErrorCatcher('notifiers.' + key, self._debug):
 
@@ -173,7 +217,7 @@ class ConfigurationFactory(object):
                 self._notifiers[key] = notifier
 
                 # make the notification to be stripped out of sensitive data such as passwords
-                notifier.set_sensitive_data_to_strip_out(sensitive_data)
+                notifier.set_redactor(self.get_sensitive_data_redactor())
 
     def get_error_handlers(self):
         return self._error_handlers
@@ -182,31 +226,50 @@ class ConfigurationFactory(object):
         return self._notifiers
 
     def definitions(self) -> Dict[str, BackupDefinition]:
-        return self._backups
+        """
+        Constructs all definitions. Use get_definition_names() when only names are needed
+        """
+
+        return {name: self.get_definition(name) for name in self._backups_config.keys()}
+
+    def get_definition_names(self) -> List[str]:
+        return list(self._backups_config.keys())
 
     def get_definition(self, name: str) -> BackupDefinition:
-        if name not in self._backups:
+        if name not in self._backups_config:
             raise ConfigurationFactoryException(
                 'No such backup definition, maybe a typo? Please check the configuration file'
             )
 
+        with self._lock:
+            if name not in self._backups:
+                self._parse_backup(name, self._backups_config[name])
+
         return self._backups[name]
 
+    def get_transport(self, name: str) -> TransportInterface:
+        if name not in self._transports_config:
+            raise ConfigurationFactoryException('No such transport "{}" defined in the configuration file'.format(name))
+
+        with self._lock:
+            if name not in self._transports:
+                self._parse_transport(name, self._transports_config[name])
+
+        return self._transports[name]
+
     def get_adapter(self, definition_name: str) -> Type[AdapterInterface]:
         """
         Finds and returns an AdapterInterface type (not a class object)
         """
 
-        if definition_name not in self._adapters:
-            raise ConfigurationFactoryException(
-                'No such backup definition, maybe a typo? Please check the configuration file'
-            )
+        self.get_definition(definition_name)
 
         return self._adapters[definition_name]
 
     def get_all_sensitive_data(self) -> List[str]:
         """
         Collects sensitive data like passwords from the configuration file
+        Includes only definitions that were already constructed, others are added to the redactor when constructed
         :return:
         """
 
@@ -215,14 +278,26 @@ class ConfigurationFactory(object):
         for access in self._accesses:
             sensitive_data.append(self._accesses[access].get_token())
 
-        for backup in self._backups:
-            if self._backups[backup].encryption().get_passphrase():
-                sensitive_data.append(self._backups[backup].encryption().get_passphrase())
+        for encryption in self._encryption.values():
+            if encryption.get_passphrase():
+                sensitive_data.append(encryption.get_passphrase())
 
-            sensitive_data += self._backups[backup].get_sensitive_information()
+        for backup in list(self._backups.values()):
+            sensitive_data += backup.get_sensitive_information()
 
         return sensitive_data
 
+    def get_sensitive_data_redactor(self) -> SensitiveDataRedactor:
+        """
+        Returns a redactor compiled once from all secrets collected by get_all_sensitive_data()
+        """
+
+        with self._lock:
+            if not hasattr(self, '_redactor'):
+                self._redactor = SensitiveDataRedactor(self.get_all_sensitive_data())
+
+        return self._redactor
+
 
 class DefinitionFactoryErrorCatcher(object):
     _key_name = ""
@@ -1,6 +1,55 @@
 import os
+import re
+from typing import Dict, List, Tuple, Union
 from rkd.env import STR_BOOLEAN_TRUE
 
+ENV_VARIABLE_PATTERN = re.compile(r'\$\{([A-Za-z0-9_]+)\}')
+
 
 def is_curl_debug_mode() -> bool:
     return os.getenv('RKD_CURL_DEBUG', '').lower() in STR_BOOLEAN_TRUE
+
+
+def substitute_env_variables(content: Union[dict, list, str, int, float, bool, None], variables: Dict[str, str],
+                             path: str = '') -> Tuple[Union[dict, list, str, int, float, bool, None],
+                                                      List[Tuple[str, str]]]:
+    """
+    Replaces ${VARIABLE} in all strings of a parsed structure (e.g. from YAML) in a single pass.
+    Values are not parsed again, so they can contain any characters, also "${...}"
+
+    :return: Structure with substituted variables, and a list of unresolved variables with their paths
+             e.g. [("COLLECTION_ID", "backups.fs.meta.collection_id")]
+    """
+
+    unresolved = []
+
+    def walk(value, value_path: str):
+        if isinstance(value, str):
+            if '${' not in value:
+                return value
+
+            def replace(match) -> str:
+                name = match.group(1)
+
+                if name not in variables:
+                    unresolved.append((name, value_path))
+                    return match.group(0)
+
+                return variables[name]
+
+            return ENV_VARIABLE_PATTERN.sub(replace, value)
+
+        if isinstance(value, dict):
+            return {walk(key, value_path): walk(item, _join_path(value_path, str(key)))
+                    for key, item in value.items()}
+
+        if isinstance(value, list):
+            return [walk(item, '{}[{}]'.format(value_path, num)) for num, item in enumerate(value)]
+
+        return value
+
+    return walk(content, path), unresolved
+
+
+def _join_path(path: str, key: str) -> str:
+    return path + '.' + key if path else key
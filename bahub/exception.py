@@ -106,3 +106,20 @@ class BackupRestoreError(BackupProcessError):
     def from_generic_restore_failure(stream) -> 'BackupRestoreError':
         return BackupRestoreError("Restore error. Process exited with a failure - read logs above.\nFailure cause: {}"
                                   .format(stream.find_failure_cause()))
+
+
+class DownloadError(ApplicationException):
+    """Errors related to fetching required binaries into the local cache"""
+
+    @classmethod
+    def from_checksum_mismatch(cls, url: str, expected: str, actual: str) -> 'DownloadError':
+        return cls(f"Checksum of file downloaded from '{url}' does not match. Expected sha256 '{expected}', "
+                   f"got '{actual}'")
+
+    @classmethod
+    def from_missing_checksum(cls, checksums_url: str, filename: str) -> 'DownloadError':
+        return cls(f"No sha256 digest of '{filename}' in '{checksums_url}'")
+
+    @classmethod
+    def from_failed_attempts(cls, url: str, attempts: int, error: Exception) -> 'DownloadError':
+        return cls(f"Cannot download '{url}' after {attempts} attempts. Last error: {error}")
@@ -1,5 +1,6 @@
 from abc import abstractmethod
-from typing import List
+from tempfile import TemporaryDirectory
+from typing import List, Tuple
 
 
 class FilesystemInterface(object):
@@ -13,7 +14,11 @@ class FilesystemInterface(object):
         pass
 
     @abstractmethod
-    def download(self, url: str, destination_path: str):
+    def download(self, url: str, destination_path: str, sha256: str = ''):
+        """
+        Downloads a file. When "sha256" is not empty, then the downloaded file is verified against it
+        """
+
         pass
 
     @abstractmethod
@@ -51,3 +56,102 @@ class FilesystemInterface(object):
     @abstractmethod
     def move(self, src: str, dst: str):
         pass
+
+    @abstractmethod
+    def read_file(self, path: str) -> str:
+        """
+        Returns content of a text file, empty string when the file does not exist
+        """
+
+        pass
+
+    @abstractmethod
+    def checksum(self, path: str) -> str:
+        """
+        Returns sha256 digest of a file
+        """
+
+        pass
+
+    def batch(self) -> 'FilesystemOperationsBatch':
+        """
+        Collects modifying operations to execute them at once (see FilesystemOperationsBatch)
+        """
+
+        return FilesystemOperationsBatch(self)
+
+
+class FilesystemOperationsBatch(object):
+    """
+    Modifying operations collected to be executed together, when leaving the context manager:
+
+        with fs.batch() as batch:
+            batch.force_mkdir("/opt/bin")
+            batch.link("/opt/bin/versions/v1.0.0-tracexit", "/opt/bin/tracexit")
+
+    Executes operations one-by-one by default. Filesystems where each operation is a remote call
+    (e.g. inside a container) should execute a whole batch in one call
+
+    Files are copied (uploaded) before all other operations, so the operations can use them.
+    Local temporary files needed until the batch is executed should be created in get_staging_path()
+    """
+
+    fs: FilesystemInterface
+    operations: List[Tuple[str, tuple]]
+    uploads: List[Tuple[str, str]]
+    _staging: TemporaryDirectory
+
+    def __init__(self, fs: FilesystemInterface):
+        self.fs = fs
+        self.operations = []
+        self.uploads = []
+
+    def get_staging_path(self, filename: str) -> str:
+        """
+        Local path for a temporary file, removed after the batch is finished
+        """
+
+        if not hasattr(self, '_staging'):
+            self._staging = TemporaryDirectory()
+
+        return self._staging.name + '/' + filename
+
+    def copy_to(self, local_path: str, dst_path: str):
+        self.uploads.append((local_path, dst_path))
+
+    def force_mkdir(self, path: str):
+        self.operations.append(('force_mkdir', (path,)))
+
+    def delete_file(self, path: str):
+        self.operations.append(('delete_file', (path,)))
+
+    def link(self, src: str, dst: str):
+        self.operations.append(('link', (src, dst)))
+
+    def make_executable(self, path: str):
+        self.operations.append(('make_executable', (path,)))
+
+    def unpack(self, archive_path: str, dst_path: str):
+        self.operations.append(('unpack', (archive_path, dst_path)))
+
+    def move(self, src: str, dst: str):
+        self.operations.append(('move', (src, dst)))
+
+    def execute(self):
+        for local_path, dst_path in self.uploads:
+            self.fs.copy_to(local_path, dst_path)
+
+        for name, args in self.operations:
+            getattr(self.fs, name)(*args)
+
+    def __enter__(self) -> 'FilesystemOperationsBatch':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        try:
+            if exc_type is None:
+                self.execute()
+
+        finally:
+            if hasattr(self, '_staging'):
+                self._staging.cleanup()
@@ -1,18 +1,49 @@
 import importlib
-from typing import Tuple, Type
+from importlib.metadata import entry_points
+from threading import RLock
+from time import perf_counter
+from typing import Tuple, Type, Dict
 from .adapters.base import AdapterInterface
 from .exception import ParsingException
 from .model import BackupDefinition
 from .transports.base import TransportInterface
 
+ADAPTERS_ENTRY_POINT_GROUP = 'bahub.adapters'
+TRANSPORTS_ENTRY_POINT_GROUP = 'bahub.transports'
+
+# short names of built-in plugins, work also when package metadata (entry points) is not installed
+BUILTIN_ADAPTERS = {
+    'filesystem': 'bahub.adapters.filesystem',
+    'mysql': 'bahub.adapters.mysql'
+}
+
+BUILTIN_TRANSPORTS = {
+    'sh': 'bahub.transports.sh',
+    'docker': 'bahub.transports.docker',
+    'docker_sidecontainer': 'bahub.transports.docker_sidecontainer',
+    'kubernetes_podexec': 'bahub.transports.kubernetes_podexec',
+    'kubernetes_sidepod': 'bahub.transports.kubernetes_sidepod'
+}
+
 
 class Importing(object):
     """
     Adapter and Transport importer
+
+    Plugins can be referenced by a full module path (e.g. "bahub.adapters.mysql") or by a short name (e.g. "mysql").
+    Short names of third-party plugins are registered with entry points in "bahub.adapters"
+    and "bahub.transports" groups, where value is a module path, e.g. "redis = my_package.bahub_redis"
+
+    Only modules of referenced plugins are imported, each only once
     """
 
-    @staticmethod
-    def import_adapter(import_str: str) -> Tuple[Type[AdapterInterface], Type[BackupDefinition]]:
+    _cache: Dict[str, object] = {}
+    _entry_points: Dict[str, Dict[str, str]] = {}
+    _import_times: Dict[str, float] = {}
+    _lock = RLock()
+
+    @classmethod
+    def import_adapter(cls, import_str: str) -> Tuple[Type[AdapterInterface], Type[BackupDefinition]]:
         """
         Imports an Adapter - service + model (Based on rkd.api.parsing.SyntaxParsing)
 
@@ -20,27 +51,79 @@ class Importing(object):
         :return:
         """
 
-        try:
-            module = importlib.import_module(import_str)
-        except ImportError as e:
-            raise ParsingException.from_import_error(import_str, e)
+        module_path = cls.resolve_name(import_str, ADAPTERS_ENTRY_POINT_GROUP, BUILTIN_ADAPTERS)
+        module = cls._import_module(module_path)
 
         if "Adapter" not in dir(module):
-            raise ParsingException.from_class_not_found_in_module_error(import_str, 'Adapter')
+            raise ParsingException.from_class_not_found_in_module_error(module_path, 'Adapter')
 
         if "Definition" not in dir(module):
-            raise ParsingException.from_class_not_found_in_module_error(import_str, 'Definition')
+            raise ParsingException.from_class_not_found_in_module_error(module_path, 'Definition')
 
         return module.Adapter, module.Definition
 
-    @staticmethod
-    def import_transport(import_str: str) -> Type[TransportInterface]:
-        try:
-            module = importlib.import_module(import_str)
-        except ImportError as e:
-            raise ParsingException.from_import_error(import_str, e)
+    @classmethod
+    def import_transport(cls, import_str: str) -> Type[TransportInterface]:
+        module_path = cls.resolve_name(import_str, TRANSPORTS_ENTRY_POINT_GROUP, BUILTIN_TRANSPORTS)
+        module = cls._import_module(module_path)
 
         if "Transport" not in dir(module):
-            raise ParsingException.from_class_not_found_in_module_error(import_str, 'Transport')
+            raise ParsingException.from_class_not_found_in_module_error(module_path, 'Transport')
 
         return module.Transport
+
+    @classmethod
+    def resolve_name(cls, name: str, group: str, builtin: Dict[str, str]) -> str:
+        """
+        Translates a short name into a module path. Module paths are returned as they are
+        """
+
+        if name in builtin:
+            return builtin[name]
+
+        if '.' in name:
+            return name
+
+        return cls.get_entry_points(group).get(name, name)
+
+    @classmethod
+    def get_entry_points(cls, group: str) -> Dict[str, str]:
+        """
+        Lists registered plugins (short name -> module path) without importing them
+        """
+
+        with cls._lock:
+            if group not in cls._entry_points:
+                discovered = entry_points()
+
+                # Python 3.10+ has select(), in Python 3.9 a dict is returned
+                selected = discovered.select(group=group) if hasattr(discovered, 'select') \
+                    else discovered.get(group, [])
+
+                cls._entry_points[group] = {entry_point.name: entry_point.value.split(':')[0]
+                                            for entry_point in selected}
+
+            return cls._entry_points[group]
+
+    @classmethod
+    def get_import_times(cls) -> Dict[str, float]:
+        """
+        Time spent (in seconds) on importing each plugin module, including its dependencies
+        """
+
+        return dict(cls._import_times)
+
+    @classmethod
+    def _import_module(cls, module_path: str):
+        with cls._lock:
+            if module_path not in cls._cache:
+                started_at = perf_counter()
+
+                try:
+                    cls._cache[module_path] = importlib.import_module(module_path)
+                except ImportError as e:
+                    raise ParsingException.from_import_error(module_path, e)
+
+                cls._import_times[module_path] = perf_counter() - started_at
+
+            return cls._cache[module_path]
@@ -1,17 +1,471 @@
-import shutil
-from time import sleep
-from typing import BinaryIO, Union, Optional, IO, Callable
+import codecs
+import errno
+import fcntl
+import os
+import stat
+from dataclasses import dataclass
+from io import IOBase, RawIOBase, TextIOBase
+from queue import Queue
+from threading import Thread
+from time import monotonic
+from typing import BinaryIO, Union, Optional, IO, Callable, List, Tuple
 from urllib3 import HTTPResponse
-from rkd.api.inputoutput import IO as RKDIO
+from rkd.api.inputoutput import IO as RKDIO, StandardOutputReplication
 from .exception import BufferingError
 
 BUFFER_CALLABLE_DEF = Callable[[Optional[int]], str]
+EXIT_WAIT_CALLABLE_DEF = Callable[[float], bool]
+READ_CHUNK_SIZE = 64 * 1024
+COPY_CHUNK_SIZE = 1024 * 1024
+
+# Linux-only fcntl() commands, exposed by Python since 3.10
+F_SETPIPE_SZ = getattr(fcntl, 'F_SETPIPE_SZ', 1031)
+F_GETPIPE_SZ = getattr(fcntl, 'F_GETPIPE_SZ', 1032)
+
+# errors meaning that kernel-side copy is not supported between given pair of descriptors
+_ZERO_COPY_UNSUPPORTED_ERRNO = (errno.EINVAL, errno.ENOSYS, errno.EBADF, errno.EXDEV, errno.ENOTSUP)
+
+
+def copy_fd(src_fd: int, dst_fd: int, chunk_size: int = COPY_CHUNK_SIZE,
+            on_copied: Optional[Callable[[int], None]] = None) -> int:
+    """
+    Copies everything from one file descriptor to another until EOF, returns number of copied bytes
+
+    On Linux the data does not go through Python at all - splice() is used when any side is a pipe,
+    sendfile() when the source is a regular file. When the kernel refuses the operation, then it falls back
+    to plain read()/write() on descriptors, continuing from the place where it stopped
+
+    :param on_copied: Called with number of bytes after each copied chunk
+    """
+
+    total = 0
+    src_is_pipe = _is_pipe(src_fd)
+    dst_is_pipe = _is_pipe(dst_fd)
+
+    if hasattr(os, 'splice') and (src_is_pipe or dst_is_pipe):
+        copy_method = lambda: os.splice(src_fd, dst_fd, chunk_size)
+    elif hasattr(os, 'sendfile') and stat.S_ISREG(os.fstat(src_fd).st_mode):
+        copy_method = lambda: os.sendfile(dst_fd, src_fd, None, chunk_size)
+    else:
+        copy_method = None
+
+    while copy_method:
+        try:
+            copied = copy_method()
+        except OSError as err:
+            if err.errno not in _ZERO_COPY_UNSUPPORTED_ERRNO:
+                raise
+
+            break
+
+        if copied == 0:
+            return total
+
+        total += copied
+
+        if on_copied:
+            on_copied(copied)
+
+    while True:
+        chunk = os.read(src_fd, chunk_size)
+
+        if not chunk:
+            return total
+
+        view = memoryview(chunk)
+
+        while view:
+            view = view[os.write(dst_fd, view):]
+
+        total += len(chunk)
+
+        if on_copied:
+            on_copied(len(chunk))
+
+
+@dataclass
+class TransferStats(object):
+    """
+    Snapshot of TransferMeter counters
+    """
+
+    description: str
+    total_bytes: int
+    elapsed: float
+    bytes_per_second: float
+    time_to_first_byte: Optional[float]
+    stalls: int
+    total_stall_time: float
+    longest_stall: float
+    parent: Optional['TransferStats'] = None
+
+    def __str__(self) -> str:
+        return '{description}: {mb:.2f}MB in {elapsed:.1f}s ({rate:.2f}MB/s), first byte after {ttfb}, ' \
+               '{stalls} stalls ({stall_time:.1f}s)'.format(
+                    description=self.description, mb=self.total_bytes / 1024 / 1024, elapsed=self.elapsed,
+                    rate=self.bytes_per_second / 1024 / 1024, stalls=self.stalls, stall_time=self.total_stall_time,
+                    ttfb='{:.3f}s'.format(self.time_to_first_byte) if self.time_to_first_byte is not None else '-')
+
+
+class TransferMeter(object):
+    """
+    Counts transferred bytes, throughput (exponentially weighted moving average), time to first byte and stalls
+
+    record() is called in the hot loop, so it only does a few arithmetic operations.
+    Progress is reported at most once per `report_interval` seconds - only then the statistics are formatted
+    """
+
+    _started_at: float
+    _last_activity_at: float
+    _first_byte_at: Optional[float]
+    _total_bytes: int
+
+    _rate: float
+    _window_started_at: float
+    _window_bytes: int
+
+    _stalls: int
+    _total_stall_time: float
+    _longest_stall: float
+
+    _on_progress: Optional[Callable[[TransferStats], None]]
+    _next_report_at: float
+
+    def __init__(self, description: str = '', on_progress: Optional[Callable[[TransferStats], None]] = None,
+                 report_interval: float = 10.0, stall_threshold: float = 1.0,
+                 rate_sample_interval: float = 0.5, ewma_alpha: float = 0.3):
+
+        self.description = description
+        self.report_interval = report_interval
+        self.stall_threshold = stall_threshold
+        self.rate_sample_interval = rate_sample_interval
+        self.ewma_alpha = ewma_alpha
+        self._on_progress = on_progress
+
+        now = monotonic()
+        self._started_at = now
+        self._last_activity_at = now
+        self._first_byte_at = None
+        self._total_bytes = 0
+        self._rate = 0.0
+        self._window_started_at = now
+        self._window_bytes = 0
+        self._stalls = 0
+        self._total_stall_time = 0.0
+        self._longest_stall = 0.0
+        self._next_report_at = now + report_interval
+
+    def record(self, num_bytes: int) -> None:
+        if not num_bytes:
+            return
+
+        now = monotonic()
+
+        if self._first_byte_at is None:
+            self._first_byte_at = now
+
+        else:
+            gap = now - self._last_activity_at
+
+            if gap >= self.stall_threshold:
+                self._stalls += 1
+                self._total_stall_time += gap
+                self._longest_stall = max(self._longest_stall, gap)
+
+        self._last_activity_at = now
+        self._total_bytes += num_bytes
+        self._window_bytes += num_bytes
+
+        window = now - self._window_started_at
+
+        if window >= self.rate_sample_interval:
+            sample = self._window_bytes / window
+            self._rate = sample if not self._rate else self.ewma_alpha * sample + (1 - self.ewma_alpha) * self._rate
+            self._window_started_at = now
+            self._window_bytes = 0
+
+        if self._on_progress and now >= self._next_report_at:
+            self._next_report_at = now + self.report_interval
+            self._on_progress(self.stats())
+
+    def stats(self) -> TransferStats:
+        now = monotonic()
+        elapsed = now - self._started_at
+
+        # before the first sample window is complete there is no moving average yet
+        rate = self._rate
+
+        if not rate and self._first_byte_at is not None:
+            rate = self._total_bytes / max(now - self._first_byte_at, 1e-9)
+
+        return TransferStats(
+            description=self.description,
+            total_bytes=self._total_bytes,
+            elapsed=elapsed,
+            bytes_per_second=rate,
+            time_to_first_byte=(self._first_byte_at - self._started_at) if self._first_byte_at is not None else None,
+            stalls=self._stalls,
+            total_stall_time=self._total_stall_time,
+            longest_stall=self._longest_stall
+        )
+
+
+class LineFramer(object):
+    """
+    Splits a stream of byte chunks into complete text lines
+
+    A line split between chunks is returned once it is complete. Text is decoded incrementally,
+    so a multi-byte character split between chunks is decoded correctly
+    """
+
+    _decoder: codecs.IncrementalDecoder
+    _pending: str
+
+    def __init__(self, encoding: str = 'utf-8', errors: str = 'replace'):
+        self._decoder = codecs.getincrementaldecoder(encoding)(errors=errors)
+        self._pending = ''
+
+    def feed(self, chunk: bytes) -> List[str]:
+        """
+        Returns lines completed by this chunk (without line endings)
+        """
+
+        lines = (self._pending + self._decoder.decode(chunk)).split('\n')
+        self._pending = lines.pop()
+
+        return [line[:-1] if line.endswith('\r') else line for line in lines]
+
+    def flush(self) -> List[str]:
+        """
+        Returns the last, not terminated line (at the end of the stream)
+        """
+
+        rest = self._pending + self._decoder.decode(b'', final=True)
+        self._pending = ''
+
+        return [rest] if rest else []
+
+
+class BatchedLineWriter(object):
+    """
+    Writes lines in batches - one write() call with many lines joined, instead of a call per line.
+    Each write of a logger formats the message and passes it through output processors (e.g. secrets redaction)
+    """
+
+    _write: Callable[[str], None]
+    _max_lines: int
+    _lines: List[str]
+
+    def __init__(self, write: Callable[[str], None], max_lines: int = 100):
+        self._write = write
+        self._max_lines = max_lines
+        self._lines = []
+
+    def write_lines(self, lines: List[str]):
+        self._lines += lines
+
+        while len(self._lines) >= self._max_lines:
+            self._write('\n'.join(self._lines[0:self._max_lines]))
+            self._lines = self._lines[self._max_lines:]
+
+    def flush(self):
+        if self._lines:
+            self._write('\n'.join(self._lines))
+            self._lines = []
+
+
+class TextStreamWriter(object):
+    """
+    Writes binary data into a text stream, decoding it incrementally - a multi-byte character split between
+    chunks is decoded correctly. Call flush() at the end
+    """
+
+    _destination: Union[TextIOBase, StandardOutputReplication]
+    _decoder: codecs.IncrementalDecoder
+
+    def __init__(self, destination: Union[TextIOBase, StandardOutputReplication],
+                 encoding: str = 'utf-8', errors: str = 'replace'):
+        self._destination = destination
+        self._decoder = codecs.getincrementaldecoder(encoding)(errors=errors)
+
+    def write(self, data: Union[bytes, memoryview]) -> int:
+        text = self._decoder.decode(bytes(data))
+
+        if text:
+            self._destination.write(text)
+
+        return len(data)
+
+    def flush(self):
+        rest = self._decoder.decode(b'', final=True)
+
+        if rest:
+            self._destination.write(rest)
+
+        self._destination.flush()
+
+
+def is_text_stream(stream) -> bool:
+    """
+    Text streams without an underlying binary buffer - including RKD's replication of sys.stdout/sys.stderr
+    (IO().capture_descriptors()), that writes also to the log files, so cannot be bypassed by its file descriptor
+    """
+
+    return isinstance(stream, StandardOutputReplication) or \
+        (isinstance(stream, TextIOBase) and not hasattr(stream, 'buffer'))
+
+
+def set_pipe_size(fd: int, size: int) -> int:
+    """
+    Changes capacity of a pipe (F_SETPIPE_SZ), returns the capacity that kernel actually applied
+
+    :raises OSError: When the pipe capacity cannot be changed, e.g. `size` exceeds /proc/sys/fs/pipe-max-size
+    """
+
+    fcntl.fcntl(fd, F_SETPIPE_SZ, size)
+
+    return fcntl.fcntl(fd, F_GETPIPE_SZ)
+
+
+class ReadAheadReader(object):
+    """
+    Reads a stream in a background thread, so the producer does not wait for the consumer and vice versa
+
+    Data is read into a bounded ring of reusable buffers - when all buffers are filled, then the background thread
+    waits until the consumer releases at least one of them
+    """
+
+    _readinto: Callable[[memoryview], Optional[int]]
+    _ring: List[bytearray]
+    _free: Queue
+    _filled: Queue
+    _current: Optional[Tuple[int, memoryview]]
+    _error: Optional[BaseException]
+    _eof: bool
+    _thread: Thread
+
+    def __init__(self, readinto: Callable[[memoryview], Optional[int]], chunk_size: int, buffers: int = 4):
+        self._readinto = readinto
+        self._ring = [bytearray(chunk_size) for _ in range(0, buffers)]
+        self._free = Queue()
+        self._filled = Queue()
+        self._current = None
+        self._error = None
+        self._eof = False
+
+        for index in range(0, buffers):
+            self._free.put(index)
+
+        self._thread = Thread(target=self._produce, daemon=True)
+        self._thread.start()
+
+    def _produce(self):
+        try:
+            while True:
+                index = self._free.get()
+
+                # closed by the consumer
+                if index is None:
+                    return
+
+                length = self._readinto(memoryview(self._ring[index])) or 0
+                self._filled.put((index, length))
+
+                if not length:
+                    return
+
+        except BaseException as err:
+            self._error = err
+            self._filled.put((None, 0))
+
+    def _next_chunk(self) -> Optional[memoryview]:
+        """
+        Returns currently consumed chunk, waits for the next one when needed. None means end of the stream
+        """
+
+        if self._current is not None:
+            return self._current[1]
+
+        if self._eof:
+            return None
+
+        index, length = self._filled.get()
+
+        if not length:
+            self._eof = True
+
+            if self._error:
+                raise self._error
+
+            return None
+
+        self._current = (index, memoryview(self._ring[index])[0:length])
+
+        return self._current[1]
+
+    def _consume(self, length: int):
+        index, view = self._current
+
+        if length < len(view):
+            self._current = (index, view[length:])
+            return
+
+        self._current = None
+        self._free.put(index)
+
+    def read(self, size: int = -1) -> bytes:
+        """
+        Returns at most `size` bytes from a single chunk, empty bytes at end of the stream
+        """
+
+        view = self._next_chunk()
+
+        if view is None:
+            return b''
+
+        data = bytes(view[0:size] if size and size > 0 else view)
+        self._consume(len(data))
+
+        return data
+
+    def copy_to(self, write: Callable[[memoryview], None], on_copied: Optional[Callable[[int], None]] = None):
+        """
+        Writes all remaining chunks, without copying them into intermediate `bytes` objects
+        """
+
+        while True:
+            view = self._next_chunk()
+
+            if view is None:
+                return
+
+            length = len(view)
+            write(view)
+            self._consume(length)
+
+            if on_copied:
+                on_copied(length)
+
+    def close(self):
+        self._free.put(None)
+
+
+def _is_pipe(fd: int) -> bool:
+    return stat.S_ISFIFO(os.fstat(fd).st_mode)
+
+
+def _fileno(stream) -> Optional[int]:
+    try:
+        return stream.fileno()
+    except (AttributeError, OSError, ValueError):
+        return None
 
 
 class StreamableBuffer(object):
     _read_callback: BUFFER_CALLABLE_DEF
     _close: callable
     _has_exited_with_failure: callable
+    _wait_for_exit: Optional[EXIT_WAIT_CALLABLE_DEF]
     _description: str
     _buffer: Union[BinaryIO, Optional[IO[bytes]], HTTPResponse]
     _in_buffer: Optional[BUFFER_CALLABLE_DEF]
@@ -19,12 +473,17 @@ class StreamableBuffer(object):
 
     # pre-validation of the buffer on read()
     _pre_validation_taken_place: bool
-    _pre_validation_sleep: int
+    _pre_validation_timeout: float
 
     _io: RKDIO
 
+    # buffering
+    _chunk_size: Optional[int]
+    _read_ahead_buffers: int
+    _read_ahead: Optional[ReadAheadReader]
+
     # stats
-    _stat_total_read: int
+    _meter: TransferMeter
 
     def __init__(self, io: RKDIO, read_callback: BUFFER_CALLABLE_DEF,
                  close_callback: callable,
@@ -35,7 +494,11 @@ class StreamableBuffer(object):
                  description: str = '',
                  in_buffer: Optional[BUFFER_CALLABLE_DEF] = None,
                  parent: Optional['StreamableBuffer'] = None,
-                 pre_validation_sleep: int = 5):
+                 pre_validation_timeout: float = 5,
+                 wait_for_exit_callback: Optional[EXIT_WAIT_CALLABLE_DEF] = None,
+                 progress_interval: float = 30.0,
+                 chunk_size: Optional[int] = None,
+                 read_ahead_buffers: int = 0):
 
         self._io = io
         self._read_callback = read_callback
@@ -43,14 +506,23 @@ class StreamableBuffer(object):
         self._is_eof = eof_callback
         self._is_success = is_success_callback
         self._has_exited_with_failure = has_exited_with_failure
+        self._wait_for_exit = wait_for_exit_callback
         self._description = description
         self._buffer = buffer
         self._in_buffer = in_buffer
         self._parent = parent
-        self._pre_validation_sleep = pre_validation_sleep
+        self._pre_validation_timeout = pre_validation_timeout
+
+        self._chunk_size = chunk_size
+        self._read_ahead_buffers = read_ahead_buffers
+        self._read_ahead = None
 
         self._pre_validation_taken_place = False
-        self._stat_total_read = 0
+        self._meter = TransferMeter(
+            description=description,
+            on_progress=lambda stats: self._io.debug('Transfer progress: {}'.format(stats)),
+            report_interval=progress_interval
+        )
 
     def get_buffer(self) -> Union[BinaryIO, Optional[IO[bytes]]]:
         return self._buffer
@@ -58,41 +530,151 @@ class StreamableBuffer(object):
     def get_in_buffer(self) -> Optional[BUFFER_CALLABLE_DEF]:
         return self._in_buffer
 
-    def read(self, size: int = 64 * 1024) -> bytes:
+    def read(self, size: Optional[int] = None) -> bytes:
         """
         Read stream of given length
         At first read() call it performs stream validation to see if it didn't end prematurely
 
-        :param size:
+        :param size: Defaults to configured chunk size
         :return:
         """
 
         buf = None
+        size = size or self._chunk_size or READ_CHUNK_SIZE
 
         if self._pre_validation_taken_place is False:
             self._io.debug('Validating stream against premature termination')
 
             self._pre_validation_taken_place = True
+            buf = self._read_chunk(size)
 
-            buf = self._read_callback(size)
-            # give the process / api request or other thing a little amount of time on first read
-            sleep(self._pre_validation_sleep)
+            # no data at all on first read - the process (or one of its parents) has probably exited,
+            # so give it a bounded amount of time to report the exit code. When data flows, then we do not wait at all
+            if not buf:
+                self.wait_for_exit(self._pre_validation_timeout)
 
         if self.has_exited_with_failure():
             raise BufferingError.from_early_buffer_exit(self._description)
 
-        self._stat_total_read += size
-        self._io.debug('Read {size} (total={total}b, {total_mb}mb)'.format(size=size, total=self._stat_total_read,
-                                                                           total_mb=self._stat_total_read/1024/1024))
+        if buf is None:
+            buf = self._read_chunk(size)
+
+        self._meter.record(len(buf))
+
+        return buf
+
+    def _read_chunk(self, size: int) -> bytes:
+        read_ahead = self._get_read_ahead()
+
+        if read_ahead:
+            return read_ahead.read(size)
+
+        return self._read_callback(size)
 
-        return self._read_callback(size) if buf is None else buf
+    def _get_read_ahead(self) -> Optional[ReadAheadReader]:
+        """
+        Lazily starts a background read-ahead, when enabled and when the buffer is a binary stream
+        """
+
+        if self._read_ahead is None and self._read_ahead_buffers > 0 \
+                and not isinstance(self._buffer, TextIOBase) and hasattr(self._buffer, 'readinto'):
+            self._read_ahead = ReadAheadReader(self._buffer.readinto, self._chunk_size or COPY_CHUNK_SIZE,
+                                               self._read_ahead_buffers)
+
+        return self._read_ahead
+
+    def stats(self) -> TransferStats:
+        """
+        Transfer statistics of this stream, with statistics of parent streams attached
+        """
+
+        stats = self._meter.stats()
+        stats.parent = self._parent.stats() if self._parent else None
+
+        return stats
+
+    def wait_for_exit(self, timeout: float) -> bool:
+        """
+        Waits up to `timeout` seconds for the whole chain (parents first) to exit.
+        Returns True when every stream that is able to report its exit has exited in given time
+        """
+
+        deadline = monotonic() + timeout
+
+        if self._parent and not self._parent.wait_for_exit(timeout):
+            return False
+
+        # not implemented - there is nothing to wait for
+        if not self._wait_for_exit:
+            return True
+
+        return self._wait_for_exit(max(0.0, deadline - monotonic()))
 
     def copy_to(self, destination_stream):
-        shutil.copyfileobj(self._buffer, destination_stream)
+        """
+        Copies whole stream into other stream
+
+        Binary streams backed by an unbuffered file descriptor are copied by the kernel (see copy_fd()) into
+        files and pipes, text streams are copied in Python
+        """
+
+        if isinstance(self._buffer, TextIOBase):
+            self._copy_in_python(destination_stream)
+            return
+
+        # binary data written to a text stream (e.g. sys.stderr) goes directly into its underlying binary buffer
+        if isinstance(destination_stream, TextIOBase) and hasattr(destination_stream, 'buffer'):
+            destination_stream.flush()
+            destination_stream = destination_stream.buffer
+
+        if is_text_stream(destination_stream):
+            writer = TextStreamWriter(destination_stream)
+            self._copy_chunks(writer)
+            writer.flush()
+            return
+
+        src_fd = _fileno(self._buffer)
+        dst_fd = _fileno(destination_stream) if isinstance(destination_stream, IOBase) else None
+
+        # buffered readers could hold data already read from the descriptor, so they cannot be bypassed
+        if self._read_ahead is None and isinstance(self._buffer, RawIOBase) \
+                and src_fd is not None and dst_fd is not None:
+            destination_stream.flush()
+            copy_fd(src_fd, dst_fd, chunk_size=self._chunk_size or COPY_CHUNK_SIZE, on_copied=self._meter.record)
+            return
+
+        self._copy_chunks(destination_stream)
+
+    def _copy_chunks(self, destination_stream):
+        read_ahead = self._get_read_ahead()
+
+        if read_ahead:
+            read_ahead.copy_to(destination_stream.write, on_copied=self._meter.record)
+            return
+
+        self._copy_in_python(destination_stream)
+
+    def _copy_in_python(self, destination_stream):
+        read = self._buffer.read
+        write = destination_stream.write
+        record = self._meter.record
+        chunk_size = self._chunk_size or COPY_CHUNK_SIZE
+
+        while True:
+            chunk = read(chunk_size)
+
+            if not chunk:
+                return
+
+            write(chunk)
+            record(len(chunk))
 
     def close(self):
         self._io.debug('Closing stream')
 
+        if self._read_ahead:
+            self._read_ahead.close()
+
         return self._close()
 
     def eof(self) -> bool:
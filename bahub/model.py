@@ -1,12 +1,11 @@
 from dataclasses import dataclass
 from typing import List
 from abc import ABC, abstractmethod
-from jsonschema import validate, draft7_format_checker, ValidationError
 
 from .bin import RequiredBinary
 from .exception import SpecificationError
 from .transports.base import TransportInterface
-from .schema import create_example_from_attributes
+from .schema import create_example_from_attributes, find_specification_errors
 
 
 @dataclass
@@ -100,15 +99,17 @@ class BackupDefinition(ABC):
     _name: str
     _spec: dict
     _transport: TransportInterface
+    _schedule: str
 
     def __init__(self, access: ServerAccess, collection_id: str, encryption: Encryption,
-                 name: str, spec: dict, transport: TransportInterface):
+                 name: str, spec: dict, transport: TransportInterface, schedule: str = ''):
         self._access = access
         self._encryption = encryption
         self._collection_id = collection_id
         self._name = name
         self._spec = spec
         self._transport = transport
+        self._schedule = schedule
 
     @staticmethod
     def from_config(cls, config: dict, name: str):
@@ -120,7 +121,8 @@ class BackupDefinition(ABC):
             encryption=config['meta']['encryption'],
             name=name,
             spec=config['spec'],
-            transport=config['meta']['transport']
+            transport=config['meta']['transport'],
+            schedule=config['meta'].get('schedule', '')
         )
 
     @staticmethod
@@ -131,13 +133,10 @@ class BackupDefinition(ABC):
 
     @classmethod
     def validate_spec(cls, spec: dict):
-        spec_schema = cls.get_specification_schema()
+        errors = find_specification_errors(cls, spec)
 
-        if spec_schema:
-            try:
-                validate(instance=spec, schema=spec_schema, format_checker=draft7_format_checker)
-            except ValidationError as exc:
-                raise SpecificationError(str(exc))
+        if errors:
+            raise SpecificationError('\n - '.join(['Invalid "spec" section:'] + errors))
 
     @staticmethod
     @abstractmethod
@@ -166,10 +165,34 @@ class BackupDefinition(ABC):
     def get_collection_id(self) -> str:
         return self._collection_id
 
-    def transport(self, binaries: List[RequiredBinary]) -> TransportInterface:
-        self._transport.prepare_environment(binaries)
+    def transport(self, binaries: List[RequiredBinary], isolated: bool = False) -> TransportInterface:
+        """
+        :param binaries: Tools required in the target environment
+        :param isolated: Use a separate instance of the transport (required when definitions are processed in parallel)
+        """
+
+        transport = self._transport.clone() if isolated else self._transport
+        transport.prepare_environment(binaries)
+
+        return transport
+
+    def get_transport(self) -> TransportInterface:
         return self._transport
 
+    def isolate_transport(self) -> None:
+        """
+        Detaches the definition from a transport instance shared with other definitions
+        """
+
+        self._transport = self._transport.clone()
+
+    def get_schedule(self) -> str:
+        """
+        Cron expression - when the daemon should make a backup
+        """
+
+        return self._schedule
+
     def get_transport_required_tools(self) -> List[RequiredBinary]:
         return self._transport.get_required_binaries()
 
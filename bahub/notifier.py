@@ -6,11 +6,23 @@ Notifier
 Integrates external monitoring services for sending infos and alerts
 """
 
-import requests
+import atexit
+import random
 import json
-from time import sleep
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from queue import Queue, Full
+from threading import Thread, Lock, Timer
+from time import sleep, monotonic
+from typing import Callable, Dict, Optional, Tuple, List, TYPE_CHECKING
+from urllib.parse import urlparse
 from rkd.api.inputoutput import IO
 from .model import BackupDefinition
+from .security import SensitiveDataRedactor
+
+if TYPE_CHECKING:
+    import requests
 
 
 class NotifierInterface(object):
@@ -34,18 +46,18 @@ class NotifierInterface(object):
     """
 
     config = {}
-    sensitive_data: list
+    redactor: SensitiveDataRedactor
     io: IO
 
     def __init__(self, config: dict, io: IO):
         self._set_config(config)
-        self.sensitive_data = []
+        self.redactor = SensitiveDataRedactor([])
         self.io = io
 
     def _set_config(self, config: dict):
         pass
 
-    def backup_was_uploaded(self, definition: BackupDefinition) -> None:
+    def backup_was_uploaded(self, definition: BackupDefinition, transferred_bytes: Optional[int] = None) -> None:
         pass
 
     def starting_backup_restore(self, definition: BackupDefinition) -> None:
@@ -54,7 +66,7 @@ class NotifierInterface(object):
     def starting_backup_creation(self, definition: BackupDefinition) -> None:
         pass
 
-    def backup_was_restored(self, definition: BackupDefinition) -> None:
+    def backup_was_restored(self, definition: BackupDefinition, transferred_bytes: Optional[int] = None) -> None:
         pass
 
     def failed_to_upload_backup(self, definition: BackupDefinition, reason) -> None:
@@ -66,23 +78,193 @@ class NotifierInterface(object):
     def exception_occurred(self, exception: BaseException):
         pass
 
+    def flush(self) -> None:
+        """
+        Sends notifications that were buffered (only when notifier is buffering them)
+        """
+
+        pass
+
+    def set_redactor(self, redactor: SensitiveDataRedactor):
+        """
+        Sets a redactor (usually shared by all notifiers and by the console output) that strips out secrets
+        """
+
+        self.redactor = redactor
+
     def set_sensitive_data_to_strip_out(self, sensitive_data: list):
-        self.sensitive_data = sensitive_data
+        self.set_redactor(SensitiveDataRedactor(sensitive_data))
 
     def filter_out_sensitive_data(self, input_str: str) -> str:
-        for keyword in self.sensitive_data:
-            input_str = input_str.replace(keyword, '****')
+        return self.redactor.redact(input_str)
+
+
+_http_sessions: Dict[Tuple[str, int], 'requests.Session'] = {}
+_http_sessions_lock = Lock()
+
+
+def get_http_session(url: str, pool_size: int = 2) -> 'requests.Session':
+    """
+    Returns a HTTP session shared by all notifiers sending to the same server
+    Session keeps connections alive, so TCP and TLS handshakes are not repeated for each notification
+    """
+
+    # imported there - only when a HTTP notifier is configured (startup time)
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    parsed = urlparse(url)
+    key = (parsed.scheme + '://' + parsed.netloc, pool_size)
+
+    with _http_sessions_lock:
+        if key not in _http_sessions:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+
+            _http_sessions[key] = session
+
+        return _http_sessions[key]
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    Parses "Retry-After" HTTP header, which can be a number of seconds or a HTTP date
+    """
+
+    if not value:
+        return None
+
+    try:
+        return max(0.0, float(value))
+
+    except (TypeError, ValueError):
+        pass
+
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+
+    except (TypeError, ValueError):
+        return None
+
+
+def format_bytes(num: float) -> str:
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if num < 1024:
+            return '{:.2f} {}'.format(num, unit) if unit != 'B' else '{} B'.format(int(num))
+
+        num /= 1024
+
+    return '{:.2f} TB'.format(num)
 
-        return input_str
+
+def calculate_backoff(retry_num: int, base: float = 1.0, cap: float = 60.0) -> float:
+    """
+    Exponential backoff with "full jitter" - random delay between 0 and min(cap, base * 2^retry_num)
+    Randomness spreads retries of multiple clients in time, so they do not hit a recovering service at once
+    """
+
+    return random.uniform(0, min(cap, base * (2 ** retry_num)))
+
+
+class NotificationWorker(object):
+    """
+    Delivers notifications to a single notifier in a background thread, in order in which they were queued
+
+    The queue is bounded - when the notifier is too slow, then new notifications are dropped,
+    as a backup should never wait for a chat service
+    """
+
+    _notifier: NotifierInterface
+    _queue: Queue
+    _thread: Optional[Thread]
+    _lock: Lock
+
+    def __init__(self, notifier: NotifierInterface, queue_size: int = 100):
+        self._notifier = notifier
+        self._queue = Queue(maxsize=queue_size)
+        self._thread = None
+        self._lock = Lock()
+
+    def submit(self, method: Callable, args: tuple, kwargs: dict, timeout: float = 0) -> bool:
+        """
+        Queues a notification. Waits up to `timeout` seconds for a free place in the queue, does not wait by default
+        """
+
+        # notifications are submitted by many batch workers at once - there must be only one consumer thread
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    thread = Thread(target=self._work, daemon=True)
+                    thread.start()
+                    self._thread = thread
+
+        try:
+            self._queue.put((method, args, kwargs), block=timeout > 0, timeout=timeout if timeout > 0 else None)
+            return True
+
+        except Full:
+            self._notifier.io.warn('Notifications queue is full, dropping notification ({})'.format(method.__name__))
+            return False
+
+    def _work(self):
+        while True:
+            method, args, kwargs = self._queue.get()
+
+            try:
+                method(*args, **kwargs)
+
+            except Exception as e:
+                self._notifier.io.warn('Notification ({}) could not be sent: {}'.format(method.__name__, str(e)))
+
+            finally:
+                self._queue.task_done()
+
+    def flush(self, timeout: float) -> bool:
+        """
+        Waits up to `timeout` seconds for all queued notifications to be processed
+        """
+
+        deadline = monotonic() + timeout
+
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = deadline - monotonic()
+
+                if remaining <= 0:
+                    return False
+
+                self._queue.all_tasks_done.wait(remaining)
+
+        return True
 
 
 class MultiplexedNotifiers(object):
-    """Proxy that allows to use multiple notifiers at once"""
+    """Proxy that allows to use multiple notifiers at once
+
+    In asynchronous mode (default) notifications are only queued, each notifier is delivering its notifications
+    in its own background thread, so notifiers work in parallel and do not block the backup process.
+    Queued notifications are flushed at process exit, but not longer than `flush_timeout` seconds
+    """
 
     _notifiers: list
+    _workers: Dict[str, NotificationWorker]
+    _asynchronous: bool
+    _flush_timeout: float
 
-    def __init__(self, notifiers: dict):
+    def __init__(self, notifiers: dict, asynchronous: bool = True, queue_size: int = 100, flush_timeout: float = 30):
         self._notifiers = list(notifiers.items())
+        self._asynchronous = asynchronous
+        self._flush_timeout = flush_timeout
+        self._workers = {}
+
+        if asynchronous:
+            for name, notifier in self._notifiers:
+                self._workers[name] = NotificationWorker(notifier, queue_size)
+
+            if self._workers:
+                atexit.register(self.flush)
 
     def __getattr__(self, item):
         return self._create_proxy(item)
@@ -91,28 +273,73 @@ class MultiplexedNotifiers(object):
         def _proxy(*args, **kwargs):
             for handler_name, handler in _proxy.notifiers:
                 method = getattr(handler, _proxy.item)
+
+                if handler_name in _proxy.workers:
+                    _proxy.workers[handler_name].submit(method, args, kwargs)
+                    continue
+
                 method(*args, **kwargs)
 
         _proxy.item = item
         _proxy.notifiers = self._notifiers
+        _proxy.workers = self._workers
 
         return _proxy
 
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        Waits until queued notifications are delivered. Returns False if the deadline was reached before
+        """
+
+        deadline = monotonic() + (self._flush_timeout if timeout is None else timeout)
+        result = True
+
+        # notifiers that are buffering notifications (e.g. digest) should send them now - in asynchronous mode
+        # after notifications already queued, in the background thread, so sending is limited by the deadline too
+        for handler_name, handler in self._notifiers:
+            if handler_name in self._workers:
+                result = self._workers[handler_name].submit(
+                    handler.flush, (), {}, timeout=max(0.001, deadline - monotonic())) and result
+                continue
+
+            try:
+                handler.flush()
+
+            except Exception as e:
+                handler.io.warn('Notifier "{}" could not flush notifications: {}'.format(handler_name, str(e)))
+
+        for worker in self._workers.values():
+            result = worker.flush(max(0.0, deadline - monotonic())) and result
+
+        return result
+
 
 class SlackNotifier(NotifierInterface):
     """Slack/Mattermost notification"""
 
-    _timeout = 300
+    _connect_timeout = 10
+    _read_timeout = 300
     _url = ''
     _max_retry_num = 3
+    _retry_backoff: float
+    _retry_backoff_cap: float
+    _max_retry_after: float
+    _session: 'requests.Session'
 
     def __init__(self, config: dict, io: IO):
         super().__init__(config, io)
         self._url = config['url']
         self._max_retry_num = int(config.get('max_retry_num', 3))
-        self._timeout = int(config.get('connection_timeout', 300))
+        self._connect_timeout = float(config.get('connect_timeout', 10))
 
-    def backup_was_uploaded(self, definition: BackupDefinition) -> None:
+        # "connection_timeout" is kept for backwards compatibility
+        self._read_timeout = float(config.get('read_timeout', config.get('connection_timeout', 300)))
+        self._session = get_http_session(self._url, int(config.get('pool_size', 2)))
+        self._retry_backoff = float(config.get('retry_backoff', 1))
+        self._retry_backoff_cap = float(config.get('retry_backoff_cap', 60))
+        self._max_retry_after = float(config.get('max_retry_after', 120))
+
+    def backup_was_uploaded(self, definition: BackupDefinition, transferred_bytes: Optional[int] = None) -> None:
         self._send(':white_check_mark: Backup was uploaded for ' + str(definition))
 
     def starting_backup_restore(self, definition: BackupDefinition) -> None:
@@ -121,7 +348,7 @@ class SlackNotifier(NotifierInterface):
     def starting_backup_creation(self, definition: BackupDefinition) -> None:
         self._send(':information_source: Creating backup of ' + str(definition))
 
-    def backup_was_restored(self, definition: BackupDefinition) -> None:
+    def backup_was_restored(self, definition: BackupDefinition, transferred_bytes: Optional[int] = None) -> None:
         self._send(':white_check_mark: Backup was restored for ' + str(definition))
 
     def failed_to_upload_backup(self, definition: BackupDefinition, reason) -> None:
@@ -133,30 +360,181 @@ class SlackNotifier(NotifierInterface):
     def exception_occurred(self, exception: BaseException):
         self._send(':bangbang: ' + str(exception))
 
-    def _send(self, msg: str, retry_num: int = 0):
+    def _send(self, msg: str):
         msg = self.filter_out_sensitive_data(msg)
 
         self.io.debug('Notifying: %s' % msg)
-        self.io.debug('Notifier retry num=%i' % retry_num)
 
-        try:
-            response = requests.post(
-                self._url, data=json.dumps({'text': msg}),
-                headers={'Content-Type': 'application/json'},
-                timeout=self._timeout
-            )
-            if response.status_code != 200:
-                raise ValueError(
-                    'Request to slack returned an error %s, the response is:\n%s'
-                    % (response.status_code, response.text)
+        retry_after = None
+
+        for retry_num in range(0, self._max_retry_num + 1):
+            if retry_num > 0:
+                # when server (e.g. rate limiter) tells when to retry, then follow it
+                sleep(min(retry_after, self._max_retry_after) if retry_after is not None else
+                      calculate_backoff(retry_num - 1, self._retry_backoff, self._retry_backoff_cap))
+
+            self.io.debug('Notifier retry num=%i' % retry_num)
+            retry_after = None
+
+            try:
+                response = self._session.post(
+                    self._url, data=json.dumps({'text': msg}),
+                    headers={'Content-Type': 'application/json'},
+                    timeout=(self._connect_timeout, self._read_timeout)
                 )
-        except Exception as e:
-            if self._max_retry_num and retry_num < self._max_retry_num:
-                self._send(msg, retry_num + 1)
-                sleep(1)
+                if response.status_code != 200:
+                    retry_after = parse_retry_after(response.headers.get('Retry-After'))
+
+                    raise ValueError(
+                        'Request to slack returned an error %s, the response is:\n%s'
+                        % (response.status_code, response.text)
+                    )
+
                 return
 
-            self.io.warn('During sending a notification an unrecoverable error occurred: ' + str(e))
+            except Exception as e:
+                error = e
+
+        self.io.warn('During sending a notification an unrecoverable error occurred: ' + str(error))
+
+
+@dataclass
+class DigestEntry(object):
+    """
+    State of a single backup definition in a digest
+    """
+
+    status: str
+    duration: Optional[float] = None
+    transferred_bytes: Optional[int] = None
+    reason: str = ''
+
+
+class SlackDigestNotifier(SlackNotifier):
+    """Slack/Mattermost notification that aggregates all events from a time window into a single message
+
+    Useful when making backups of many definitions at once - instead of flooding the channel (and hitting rate limits)
+    a single message with status, duration and size of each backup is sent per `window` seconds
+    """
+
+    _STATUSES = {
+        'creating': (':hourglass_flowing_sand:', 'creating backup'),
+        'uploaded': (':white_check_mark:', 'backup uploaded'),
+        'upload_failed': (':x:', 'backup failed'),
+        'restoring': (':hourglass_flowing_sand:', 'restoring backup'),
+        'restored': (':white_check_mark:', 'backup restored'),
+        'restore_failed': (':x:', 'restore failed')
+    }
+
+    _window: float
+    _entries: Dict[str, DigestEntry]
+    _started_at: Dict[str, float]
+    _exceptions: List[str]
+    _lock: Lock
+    _timer: Optional[Timer]
+
+    def __init__(self, config: dict, io: IO):
+        super().__init__(config, io)
+        self._window = float(config.get('window', 300))
+        self._entries = {}
+        self._started_at = {}
+        self._exceptions = []
+        self._lock = Lock()
+        self._timer = None
+
+    def starting_backup_creation(self, definition: BackupDefinition) -> None:
+        self._record(definition, 'creating', is_start=True)
+
+    def backup_was_uploaded(self, definition: BackupDefinition, transferred_bytes: Optional[int] = None) -> None:
+        self._record(definition, 'uploaded', transferred_bytes=transferred_bytes)
+
+    def failed_to_upload_backup(self, definition: BackupDefinition, reason) -> None:
+        self._record(definition, 'upload_failed', reason=reason)
+
+    def starting_backup_restore(self, definition: BackupDefinition) -> None:
+        self._record(definition, 'restoring', is_start=True)
+
+    def backup_was_restored(self, definition: BackupDefinition, transferred_bytes: Optional[int] = None) -> None:
+        self._record(definition, 'restored', transferred_bytes=transferred_bytes)
+
+    def failed_to_restore_backup(self, definition: BackupDefinition, reason) -> None:
+        self._record(definition, 'restore_failed', reason=reason)
+
+    def exception_occurred(self, exception: BaseException):
+        with self._lock:
+            self._exceptions.append(str(exception))
+            self._schedule_flush()
+
+    def _record(self, definition: BackupDefinition, status: str, is_start: bool = False,
+                transferred_bytes: Optional[int] = None, reason=None):
+
+        name = definition.name() if isinstance(definition, BackupDefinition) else str(definition)
+        now = monotonic()
+
+        with self._lock:
+            entry = self._entries.get(name, DigestEntry(status=status))
+            entry.status = status
+
+            if is_start:
+                self._started_at[name] = now
+
+            elif name in self._started_at:
+                entry.duration = now - self._started_at.pop(name)
+
+            if transferred_bytes is not None:
+                entry.transferred_bytes = transferred_bytes
+
+            if reason is not None:
+                entry.reason = str(reason)
+
+            self._entries[name] = entry
+            self._schedule_flush()
+
+    def _schedule_flush(self):
+        if self._timer is None:
+            self._timer = Timer(self._window, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def flush(self) -> None:
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+            entries, exceptions = self._entries, self._exceptions
+            self._entries, self._exceptions = {}, []
+
+        if entries or exceptions:
+            self._send(self.format_digest(entries, exceptions))
+
+    def format_digest(self, entries: Dict[str, DigestEntry], exceptions: List[str]) -> str:
+        succeeded = len([entry for entry in entries.values() if entry.status in ['uploaded', 'restored']])
+        failed = len([entry for entry in entries.values() if entry.status in ['upload_failed', 'restore_failed']])
+
+        lines = [':bar_chart: Backup digest: {total} definitions - {succeeded} succeeded, {failed} failed'.format(
+            total=len(entries), succeeded=succeeded, failed=failed
+        )]
+
+        for name, entry in entries.items():
+            icon, description = self._STATUSES[entry.status]
+            line = '{icon} {name} - {description}'.format(icon=icon, name=name, description=description)
+
+            if entry.duration is not None:
+                line += ', {:.1f}s'.format(entry.duration)
+
+            if entry.transferred_bytes is not None:
+                line += ', ' + format_bytes(entry.transferred_bytes)
+
+            if entry.reason:
+                line += ': ' + entry.reason
+
+            lines.append(line)
+
+        for exception in exceptions:
+            lines.append(':bangbang: ' + exception)
+
+        return '\n'.join(lines)
 
 
 class NotifierFactory(object):
@@ -165,6 +543,8 @@ class NotifierFactory(object):
     _SUPPORTED = {
         'slack': SlackNotifier,
         'mattermost': SlackNotifier,
+        'slack-digest': SlackDigestNotifier,
+        'mattermost-digest': SlackDigestNotifier,
         'none': NotifierInterface,
         'nothing': NotifierInterface,
         '': NotifierInterface,
@@ -0,0 +1,261 @@
+"""
+Scheduler
+=========
+
+Cron-style scheduler used by the daemon mode. Keeps configuration, transports and binaries cache in memory
+and dispatches backups of definitions onto a pool of workers, when their schedule says so.
+
+Each run is delayed by a random jitter, so definitions scheduled at the same time (e.g. at midnight)
+do not start all at once.
+"""
+
+import random
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from threading import Event, Lock
+from typing import List, Set, Callable, Optional, Dict
+from rkd.api.inputoutput import IO
+from .exception import ConfigurationError
+
+CRON_MACROS = {
+    '@yearly': '0 0 1 1 *',
+    '@annually': '0 0 1 1 *',
+    '@monthly': '0 0 1 * *',
+    '@weekly': '0 0 * * 0',
+    '@daily': '0 0 * * *',
+    '@midnight': '0 0 * * *',
+    '@hourly': '0 * * * *'
+}
+
+MONTH_NAMES = ['jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec']
+DAY_OF_WEEK_NAMES = ['sun', 'mon', 'tue', 'wed', 'thu', 'fri', 'sat']
+
+# longest period that could be needed to find a next run (e.g. 29th of February on Monday)
+MAX_SEARCH_YEARS = 30
+
+
+class CronSchedule(object):
+    """
+    Standard 5-field cron expression: minute, hour, day of month, month, day of week
+
+    Supports "*", ranges "1-5", steps "*/15", lists "1,15", names of months and days of week, and macros
+    such as "@daily". Like in Vixie cron - when both day of month and day of week are restricted,
+    then matching any of them is enough
+    """
+
+    _expression: str
+    _minutes: Set[int]
+    _hours: Set[int]
+    _days_of_month: Set[int]
+    _months: Set[int]
+    _days_of_week: Set[int]
+    _any_day_of_month: bool
+    _any_day_of_week: bool
+
+    def __init__(self, expression: str):
+        self._expression = expression
+        fields = CRON_MACROS.get(expression.strip(), expression).split()
+
+        if len(fields) != 5:
+            raise ConfigurationError('Invalid cron expression "{}", expected 5 fields'.format(expression))
+
+        try:
+            self._minutes = _parse_field(fields[0], 0, 59)
+            self._hours = _parse_field(fields[1], 0, 23)
+            self._days_of_month = _parse_field(fields[2], 1, 31)
+            self._months = _parse_field(fields[3], 1, 12, names=MONTH_NAMES, names_offset=1)
+            self._days_of_week = set([day % 7 for day in _parse_field(fields[4], 0, 7, names=DAY_OF_WEEK_NAMES)])
+
+        except ValueError as e:
+            raise ConfigurationError('Invalid cron expression "{}": {}'.format(expression, str(e)))
+
+        self._any_day_of_month = fields[2].startswith('*')
+        self._any_day_of_week = fields[4].startswith('*')
+
+    def next_after(self, moment: datetime) -> datetime:
+        """
+        Finds the first matching minute that is after given moment
+        """
+
+        current = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = moment.year + MAX_SEARCH_YEARS
+
+        while current.year <= limit:
+            if current.month not in self._months:
+                current = (current.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+                continue
+
+            if not self._matches_day(current):
+                current = current.replace(hour=0, minute=0) + timedelta(days=1)
+                continue
+
+            if current.hour not in self._hours:
+                current = current.replace(minute=0) + timedelta(hours=1)
+                continue
+
+            if current.minute not in self._minutes:
+                current += timedelta(minutes=1)
+                continue
+
+            return current
+
+        raise ConfigurationError('Cron expression "{}" never matches'.format(self._expression))
+
+    def _matches_day(self, moment: datetime) -> bool:
+        matches_day_of_month = moment.day in self._days_of_month
+        matches_day_of_week = (moment.weekday() + 1) % 7 in self._days_of_week
+
+        if self._any_day_of_month or self._any_day_of_week:
+            return matches_day_of_month and matches_day_of_week
+
+        return matches_day_of_month or matches_day_of_week
+
+    def __str__(self) -> str:
+        return self._expression
+
+
+def _parse_field(value: str, minimum: int, maximum: int, names: List[str] = None, names_offset: int = 0) -> Set[int]:
+    def to_number(text: str) -> int:
+        if names and text.lower() in names:
+            return names.index(text.lower()) + names_offset
+
+        return int(text)
+
+    values = set()
+
+    for part in value.split(','):
+        step = 1
+        has_step = '/' in part
+
+        if has_step:
+            part, step_str = part.split('/', 1)
+            step = int(step_str)
+
+            if step < 1:
+                raise ValueError('step must be a positive number')
+
+        if part == '*':
+            start, end = minimum, maximum
+        elif '-' in part:
+            start, end = [to_number(number) for number in part.split('-', 1)]
+        else:
+            start = to_number(part)
+            end = maximum if has_step else start
+
+        if start < minimum or end > maximum or start > end:
+            raise ValueError('"{}" is out of range {}-{}'.format(part, minimum, maximum))
+
+        values.update(range(start, end + 1, step))
+
+    return values
+
+
+@dataclass
+class ScheduledJob(object):
+    """
+    A definition with a schedule, and time of its next run
+    """
+
+    definition_name: str
+    schedule: CronSchedule
+    next_run: Optional[datetime] = None
+    run_at: Optional[datetime] = None
+    is_running: bool = field(default=False)
+
+
+class Scheduler(object):
+    """
+    Dispatches jobs onto a pool of workers, when they are due. A job is never run twice at the same time -
+    when previous run still did not finish, then the next one is skipped
+    """
+
+    _jobs: List[ScheduledJob]
+    _run: Callable[[str], object]
+    _io: IO
+    _jitter: float
+    _now: Callable[[], datetime]
+    _executor: ThreadPoolExecutor
+    _lock: Lock
+
+    def __init__(self, jobs: List[ScheduledJob], run: Callable[[str], object], workers: int, io: IO,
+                 jitter: float = 0, now: Callable[[], datetime] = datetime.now):
+        self._jobs = jobs
+        self._run = run
+        self._io = io
+        self._jitter = jitter
+        self._now = now
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='scheduled-backup')
+        self._lock = Lock()
+
+        for job in self._jobs:
+            self._plan_next_run(job, self._now())
+
+    def _plan_next_run(self, job: ScheduledJob, after: datetime):
+        job.next_run = job.schedule.next_after(after)
+        job.run_at = job.next_run + timedelta(seconds=random.uniform(0, self._jitter))
+
+        self._io.debug('Next run of "{}" planned at {}'.format(job.definition_name, job.run_at.isoformat()))
+
+    def get_planned_runs(self) -> Dict[str, datetime]:
+        return {job.definition_name: job.run_at for job in self._jobs}
+
+    def tick(self) -> List[str]:
+        """
+        Dispatches all jobs that are due, returns names of dispatched definitions
+        """
+
+        now = self._now()
+        dispatched = []
+
+        for job in self._jobs:
+            if job.run_at > now:
+                continue
+
+            # missed runs (e.g. when the machine was suspended) are not repeated
+            self._plan_next_run(job, now)
+
+            with self._lock:
+                if job.is_running:
+                    self._io.warn('Skipping "{}", previous run did not finish yet'.format(job.definition_name))
+                    continue
+
+                job.is_running = True
+
+            self._io.info('Starting scheduled backup of "{}"'.format(job.definition_name))
+            self._executor.submit(self._run_job, job)
+            dispatched.append(job.definition_name)
+
+        return dispatched
+
+    def _run_job(self, job: ScheduledJob):
+        try:
+            self._run(job.definition_name)
+
+        except Exception as e:
+            self._io.error('Scheduled backup of "{}" failed: {}'.format(job.definition_name, str(e)))
+
+        finally:
+            with self._lock:
+                job.is_running = False
+
+    def seconds_to_next_run(self) -> float:
+        earliest = min([job.run_at for job in self._jobs])
+
+        return max(0.0, (earliest - self._now()).total_seconds())
+
+    def run_forever(self, stop: Event, max_sleep: float = 60):
+        """
+        Runs until `stop` is set, then waits for running jobs to finish
+
+        :param max_sleep: Wake up at least every N seconds, in case the system clock was changed
+        """
+
+        try:
+            while not stop.is_set():
+                self.tick()
+                stop.wait(min(self.seconds_to_next_run(), max_sleep))
+
+        finally:
+            self._io.info('Waiting for running backups to finish')
+            self._executor.shutdown(wait=True)
@@ -3,7 +3,61 @@ JSON Schema helper methods
 ==========================
 """
 
-from typing import Dict
+from threading import Lock
+from typing import Dict, List, Optional, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from jsonschema import Draft7Validator, ValidationError
+
+_validators: Dict[type, Optional['Draft7Validator']] = {}
+_validators_lock = Lock()
+
+
+def get_specification_validator(cls) -> Optional['Draft7Validator']:
+    """
+    Compiles get_specification_schema() of given adapter definition or transport class into a validator.
+    Compiled once per class, the schema itself is checked only on first use
+
+    :return: None when class does not define a schema
+    """
+
+    if cls not in _validators:
+        with _validators_lock:
+            if cls not in _validators:
+                # imported only when a spec is validated (startup time)
+                from jsonschema import Draft7Validator, draft7_format_checker
+
+                schema = cls.get_specification_schema()
+                validator = None
+
+                if schema:
+                    Draft7Validator.check_schema(schema)
+                    validator = Draft7Validator(schema, format_checker=draft7_format_checker)
+
+                _validators[cls] = validator
+
+    return _validators[cls]
+
+
+def find_specification_errors(cls, spec: dict) -> List[str]:
+    """
+    Validates "spec" against the schema of given class, returns all errors at once
+    """
+
+    validator = get_specification_validator(cls)
+
+    if validator is None:
+        return []
+
+    errors = sorted(validator.iter_errors(spec), key=lambda error: [str(part) for part in error.absolute_path])
+
+    return [format_validation_error(error) for error in errors]
+
+
+def format_validation_error(error: 'ValidationError') -> str:
+    path = '.'.join([str(part) for part in error.absolute_path])
+
+    return '{}: {}'.format(path, error.message) if path else error.message
 
 
 def create_example_from_attributes(attributes: dict) -> Dict[str, str]:
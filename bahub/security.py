@@ -4,7 +4,274 @@ Security
 
 Provides security helpers
 """
-from typing import List, Union
+import re
+from io import TextIOBase
+from threading import Lock
+from typing import List, Union, Iterable, Optional, Pattern, BinaryIO
+from .inputoutput import TextStreamWriter, is_text_stream
+
+DEFAULT_MASK = '********'
+
+
+class SensitiveDataRedactor(object):
+    """
+    Replaces secrets with a mask
+
+    All secrets are compiled once into a single regular expression, built from a prefix tree of the secrets,
+    so each position of the text is checked against all secrets at once, instead of scanning the text
+    once per secret. Works on both `str` and `bytes`
+    """
+
+    _words: List[str]
+    _mask: str
+    _max_length: int
+    _str_pattern: Optional[Pattern]
+    _bytes_pattern: Optional[Pattern]
+    _lock: Lock
+
+    def __init__(self, words: Iterable[str], mask: str = DEFAULT_MASK):
+        # empty secret would match everywhere
+        self._words = sorted(set([str(word) for word in words if word]))
+        self._mask = mask
+        self._max_length = max([len(word.encode('utf-8')) for word in self._words], default=0)
+        self._str_pattern = _compile_words_pattern(self._words) if self._words else None
+        self._bytes_pattern = None
+        self._lock = Lock()
+
+    def add_words(self, words: Iterable[str]) -> None:
+        """
+        Adds more secrets. Already created output processors and streams start to use them immediately
+        """
+
+        with self._lock:
+            words = set(self._words) | set([str(word) for word in words if word])
+
+            if len(words) == len(self._words):
+                return
+
+            words = sorted(words)
+
+            # pattern is replaced before the list of words, so redact() never sees new words without a pattern
+            self._str_pattern = _compile_words_pattern(words)
+            self._bytes_pattern = None
+            self._max_length = max([len(word.encode('utf-8')) for word in words])
+            self._words = words
+
+    def redact(self, text: Union[str, bytes]) -> Union[str, bytes]:
+        if not self._words or not text:
+            return text
+
+        if isinstance(text, bytes):
+            return self._get_bytes_pattern().sub(self._mask.encode('utf-8'), text)
+
+        return self._str_pattern.sub(self._mask, text)
+
+    def create_output_processor(self) -> callable:
+        """
+        Creates a filtering method in format of RKD's IO output processor
+        """
+
+        def sensitive_word_filter(text, origin: Union[str, bytes] = '') -> Union[str, bytes]:
+            return self.redact(text)
+
+        return sensitive_word_filter
+
+    def create_stream(self) -> 'RedactingStream':
+        return RedactingStream(self)
+
+    def get_words(self) -> List[str]:
+        return self._words
+
+    def get_mask(self) -> str:
+        return self._mask
+
+    def get_max_length(self) -> int:
+        """
+        Longest secret in bytes (in `str` each character is at least one byte, so it is also a safe limit there)
+        """
+
+        return self._max_length
+
+    def find_safe_boundary(self, text: Union[str, bytes]) -> int:
+        """
+        Returns position in text, before which redacting will not change anymore, even if more text comes
+        """
+
+        return len(text) - (self._max_length - 1) if self._max_length else len(text)
+
+    def _get_bytes_pattern(self) -> Pattern:
+        with self._lock:
+            if self._bytes_pattern is None:
+                # each byte is represented as a single latin-1 character, so the same prefix tree builder can be reused
+                self._bytes_pattern = re.compile(
+                    _build_words_regex([word.encode('utf-8').decode('latin-1') for word in self._words])
+                    .encode('latin-1')
+                )
+
+            return self._bytes_pattern
+
+    def get_pattern(self, text: Union[str, bytes]) -> Pattern:
+        return self._get_bytes_pattern() if isinstance(text, bytes) else self._str_pattern
+
+
+class RedactingStream(object):
+    """
+    Redacts secrets in a stream that comes in chunks
+
+    A secret can be split between two chunks, so the end of each chunk that could be a beginning of a secret
+    is kept until the next chunk arrives (or until flush())
+    """
+
+    _redactor: SensitiveDataRedactor
+    _tail: Union[str, bytes, None]
+    _empty: Union[str, bytes]
+
+    def __init__(self, redactor: SensitiveDataRedactor):
+        self._redactor = redactor
+        self._tail = None
+        self._empty = ''
+
+    def feed(self, chunk: Union[str, bytes]) -> Union[str, bytes]:
+        """
+        Returns redacted part of the stream that is already safe to output
+        """
+
+        data = self._tail + chunk if self._tail else chunk
+        self._empty = data[0:0]
+
+        if not self._redactor.get_words():
+            self._tail = None
+            return data
+
+        pattern = self._redactor.get_pattern(data)
+        mask = self._redactor.get_mask().encode('utf-8') if isinstance(data, bytes) else self._redactor.get_mask()
+        boundary = self._redactor.find_safe_boundary(data)
+
+        output = []
+        position = 0
+
+        for match in pattern.finditer(data):
+            # a longer secret could start there and continue in the next chunk
+            if match.start() >= boundary:
+                break
+
+            output.append(data[position:match.start()])
+            output.append(mask)
+            position = match.end()
+
+        boundary = max(boundary, position)
+        output.append(data[position:boundary])
+        self._tail = data[boundary:]
+
+        return self._empty.join(output)
+
+    def flush(self) -> Union[str, bytes]:
+        """
+        Returns the remaining part of the stream, call at the end of the stream
+        """
+
+        if not self._tail:
+            return self._empty
+
+        tail = self._tail
+        self._tail = None
+
+        return self._redactor.redact(tail)
+
+
+class RedactingWriter(object):
+    """
+    File-like object that redacts secrets in binary data before writing it to the destination stream.
+    Call flush() at the end - the tail that could be a beginning of a secret is written only then
+    """
+
+    _destination: Union[BinaryIO, TextStreamWriter]
+    _stream: RedactingStream
+
+    def __init__(self, destination: Union[BinaryIO, TextIOBase], redactor: SensitiveDataRedactor):
+        # binary data written to a text stream (e.g. sys.stderr) goes directly into its underlying binary buffer
+        if isinstance(destination, TextIOBase) and hasattr(destination, 'buffer'):
+            destination.flush()
+            destination = destination.buffer
+
+        # e.g. sys.stderr replicated by RKD to the log files - accepts only text
+        elif is_text_stream(destination):
+            destination = TextStreamWriter(destination)
+
+        self._destination = destination
+        self._stream = redactor.create_stream()
+
+    def write(self, data: Union[bytes, memoryview]) -> int:
+        self._destination.write(self._stream.feed(bytes(data)))
+
+        return len(data)
+
+    def flush(self):
+        self._destination.write(self._stream.flush())
+        self._destination.flush()
+
+
+def _compile_words_pattern(words: List[str]) -> Pattern:
+    return re.compile(_build_words_regex(words))
+
+
+def _build_words_regex(words: List[str]) -> str:
+    """
+    Builds a regular expression from a prefix tree of given words, e.g. ["abc", "abd", "ab"] -> "ab(?:[cd])?"
+    Longer words are always preferred, as optional groups are greedy
+    """
+
+    trie = {}
+
+    for word in words:
+        node = trie
+
+        for char in word:
+            node = node.setdefault(char, {})
+
+        node[None] = {}
+
+    return _trie_node_to_regex(trie)
+
+
+def _trie_node_to_regex(node: dict) -> str:
+    alternatives = []
+    single_chars = []
+
+    for char in sorted([key for key in node.keys() if key is not None]):
+        child = node[char]
+        literal = re.escape(char)
+
+        # collapse a chain of nodes with a single child into one literal, that keeps recursion shallow
+        while len(child) == 1 and None not in child:
+            next_char = next(iter(child))
+            literal += re.escape(next_char)
+            child = child[next_char]
+
+        if list(child.keys()) == [None]:
+            if len(literal) == len(re.escape(char)):
+                single_chars.append(literal)
+                continue
+
+            alternatives.append(literal)
+            continue
+
+        alternatives.append(literal + _trie_node_to_regex(child))
+
+    if len(single_chars) == 1:
+        alternatives.append(single_chars[0])
+    elif single_chars:
+        alternatives.append('[' + ''.join(single_chars) + ']')
+
+    if len(alternatives) == 1:
+        pattern = alternatives[0]
+    else:
+        pattern = '(?:' + '|'.join(alternatives) + ')'
+
+    if None in node:
+        return '(?:' + pattern + ')?'
+
+    return pattern
 
 
 def create_sensitive_data_stripping_filter(words: List[str]) -> callable:
@@ -14,11 +281,4 @@ def create_sensitive_data_stripping_filter(words: List[str]) -> callable:
     :return:
     """
 
-    def sensitive_word_filter(text, origin: Union[str, bytes] = '') -> Union[str, bytes]:
-        for word in words:
-            if word in text:
-                text = text.replace(word, '********')
-
-        return text
-
-    return sensitive_word_filter
+    return SensitiveDataRedactor(words).create_output_processor()
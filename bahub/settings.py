@@ -3,7 +3,10 @@ import os
 HOME_PATH = os.path.expanduser("~/.backup-controller")
 BIN_CACHE_PATH = HOME_PATH + "/bin"
 BIN_VERSION_CACHE_PATH = BIN_CACHE_PATH + '/versions'
+BIN_BLOBS_CACHE_PATH = BIN_CACHE_PATH + '/blobs'
+BIN_CACHE_MAX_SIZE = 256 * 1024 * 1024
 CONFIG_PATH = os.path.expanduser("~/.backup-controller/config.yaml")
+CONFIG_CACHE_PATH = HOME_PATH + "/cache/config"
 
 TARGET_ENV_BIN_PATH = "/tmp/.br"
 TARGET_ENV_VERSIONS_PATH = "/tmp/.br/versions"
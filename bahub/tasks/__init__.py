@@ -7,11 +7,15 @@ Provides shell commands such as:
 - sending backups
 - listing backups
 - receiving backups
+- making backups on schedule (daemon)
+- managing local cache of binaries
 
 """
 from rkd.api.syntax import TaskDeclaration
 from .prepare import BackupPreparationTask
 from .restore import RestoreTask
+from .daemon import DaemonTask
+from .cache import CacheStatsTask, CacheGarbageCollectionTask
 from .docs import BackupTypeSchemaPrintingTask, BackupTypeExampleTask, TransportTypeTask, InfoTask
 
 
@@ -19,8 +23,11 @@ def imports():
     return [
         TaskDeclaration(RestoreTask()),
         TaskDeclaration(BackupPreparationTask()),
+        TaskDeclaration(DaemonTask()),
         TaskDeclaration(BackupTypeSchemaPrintingTask()),
         TaskDeclaration(BackupTypeExampleTask()),
         TaskDeclaration(TransportTypeTask()),
-        TaskDeclaration(InfoTask())
+        TaskDeclaration(InfoTask()),
+        TaskDeclaration(CacheStatsTask()),
+        TaskDeclaration(CacheGarbageCollectionTask())
     ]
@@ -1,6 +1,7 @@
 import os
 from abc import ABC
 from argparse import ArgumentParser
+from time import monotonic
 from traceback import print_exc
 from typing import Dict, Union, Optional, List
 from rkd.api.contract import TaskInterface, ExecutionContext, ArgumentEnv
@@ -9,12 +10,17 @@ from rkd.exception import YAMLFileValidationError
 
 from ..adapters.base import AdapterInterface
 from ..api import BackupRepository
+from ..batch import DefinitionResult
 from ..bin import get_backup_maker_binaries, download_required_tools, RequiredBinary
+from ..bincache import BinariesCache
+from ..configcache import CompiledConfigurationCache
 from ..configurationfactory import ConfigurationFactory
+from ..exception import ConfigurationFactoryException
+from ..importing import Importing
 from ..model import BackupDefinition
 from ..notifier import MultiplexedNotifiers, NotifierInterface
-from ..security import create_sensitive_data_stripping_filter
-from ..settings import BIN_CACHE_PATH, BIN_VERSION_CACHE_PATH, CONFIG_PATH
+from ..settings import BIN_CACHE_PATH, BIN_VERSION_CACHE_PATH, BIN_BLOBS_CACHE_PATH, BIN_CACHE_MAX_SIZE, \
+    CONFIG_PATH, CONFIG_CACHE_PATH
 from ..transports.sh import LocalFilesystem
 
 
@@ -35,7 +41,9 @@ class BaseTask(TaskInterface, ABC):
                 configuration_path=context.get_arg_or_env('--config'),
                 debug=bool(context.get_arg_or_env('--debug')),
                 parser=YamlFileLoader([]),
-                io=self._io
+                io=self._io,
+                lazy=not context.get_arg('--validate-all'),
+                cache=CompiledConfigurationCache(CONFIG_CACHE_PATH, self._io)
             )
 
         except YAMLFileValidationError as e:
@@ -43,8 +51,12 @@ class BaseTask(TaskInterface, ABC):
             print_exc()
             return False
 
+        except ConfigurationFactoryException as e:
+            self.io().error(str(e))
+            return False
+
         if not context.get_arg('--show-secrets'):
-            self._io.add_output_processor(create_sensitive_data_stripping_filter(self.config.get_all_sensitive_data()))
+            self._io.add_output_processor(self.config.get_sensitive_data_redactor().create_output_processor())
 
         self.api = BackupRepository(self._io)
         self.notifier = MultiplexedNotifiers(self.config.notifiers())
@@ -55,6 +67,9 @@ class BaseTask(TaskInterface, ABC):
         """
         Binaries cache keeps single-binary applications required to perform a backup
         Files are copied from the cache to the destination environment e.g. Docker container or Kubernetes POD
+
+        Downloaded files are moved into a content-addressed store, versions not used recently are removed
+        when the cache is bigger than BIN_CACHE_MAX_SIZE
         """
 
         download_required_tools(
@@ -65,6 +80,18 @@ class BaseTask(TaskInterface, ABC):
             binaries=binaries
         )
 
+        cache = BinariesCache(BIN_VERSION_CACHE_PATH, BIN_BLOBS_CACHE_PATH)
+        names = [binary.get_full_name_with_version() for binary in binaries]
+
+        for name in names:
+            cache.store(name)
+
+        collected = cache.collect_garbage(BIN_CACHE_MAX_SIZE, keep=names)
+
+        if collected.removed_versions:
+            self.io().debug('Removed least recently used binaries from cache: {}'.format(
+                ', '.join(collected.removed_versions)))
+
     def call_backup_maker(self, context: ExecutionContext, is_backup: bool, version: str = "") -> bool:
         """
         Schedules a "Backup Maker" to perform action.
@@ -73,17 +100,35 @@ class BaseTask(TaskInterface, ABC):
         spawning the process and tracking it.
         """
 
-        definition_name = context.get_arg('definition')
+        return self.run_backup_maker(context.get_arg('definition'), is_backup=is_backup, version=version).success
+
+    def run_backup_maker(self, definition_name: str, is_backup: bool, version: str = "",
+                         isolated: bool = False, prepare_binaries: bool = True) -> DefinitionResult:
+        """
+        Runs a "Backup Maker" for a single definition
+
+        :param isolated: Use a separate Transport instance (when running many definitions in parallel)
+        :param prepare_binaries: Set to False, when binaries cache was already prepared
+        """
+
+        started_at = monotonic()
         definition = self.config.get_definition(definition_name)
         adapter: AdapterInterface = self.config.get_adapter(definition_name)()
-        required_binaries = adapter.get_required_binaries() + get_backup_maker_binaries() + \
-                            definition.get_transport_required_tools()
+        required_binaries = self.get_required_binaries(definition_name)
+
+        self.io().debug('Imported plugins: {}'.format(', '.join([
+            '{} ({:.3f}s)'.format(module, import_time) for module, import_time in Importing.get_import_times().items()
+        ])))
 
-        self.prepare_binaries_cache(required_binaries)
+        if prepare_binaries:
+            self.prepare_binaries_cache(required_binaries)
 
         # begin a backup, get a buffered reader
-        with definition.transport(binaries=required_binaries) as transport:
-            self.notifier.starting_backup_creation(definition)
+        with definition.transport(binaries=required_binaries, isolated=isolated) as transport:
+            if is_backup:
+                self.notifier.starting_backup_creation(definition)
+            else:
+                self.notifier.starting_backup_restore(definition)
 
             if is_backup:
                 transport.schedule(adapter.create_backup_instruction(definition), definition,
@@ -104,13 +149,57 @@ class BaseTask(TaskInterface, ABC):
             if additional_info:
                 self.io().outln(additional_info)
 
-        return is_success
+        transferred_bytes = transport.get_transferred_bytes()
+        self._notify_result(definition, is_backup, is_success, transferred_bytes)
+
+        return DefinitionResult(
+            definition_name=definition_name,
+            success=is_success,
+            elapsed=monotonic() - started_at,
+            transferred_bytes=transferred_bytes,
+            error='' if is_success else 'backup-maker process did not return success'
+        )
+
+    def prepare_binaries_cache_for_definitions(self, names: List[str]):
+        """
+        Prepares binaries cache once for many definitions, before they are processed in parallel
+        """
+
+        binaries = {}
+
+        for name in names:
+            for binary in self.get_required_binaries(name):
+                binaries[binary.get_full_name_with_version()] = binary
+
+        self.prepare_binaries_cache(list(binaries.values()))
+
+    def get_required_binaries(self, definition_name: str) -> List[RequiredBinary]:
+        definition = self.config.get_definition(definition_name)
+        adapter: AdapterInterface = self.config.get_adapter(definition_name)()
+
+        return adapter.get_required_binaries() + get_backup_maker_binaries() + \
+            definition.get_transport_required_tools()
+
+    def _notify_result(self, definition: BackupDefinition, is_backup: bool, is_success: bool,
+                       transferred_bytes: Optional[int]):
+        reason = 'backup-maker process did not return success'
+
+        if is_backup and is_success:
+            self.notifier.backup_was_uploaded(definition, transferred_bytes=transferred_bytes)
+        elif is_backup:
+            self.notifier.failed_to_upload_backup(definition, reason)
+        elif is_success:
+            self.notifier.backup_was_restored(definition, transferred_bytes=transferred_bytes)
+        else:
+            self.notifier.failed_to_restore_backup(definition, reason)
 
     def configure_argparse(self, parser: ArgumentParser, with_definition: bool = True):
         # do not require as switch, allow to use env
         parser.add_argument('--config', '-c', default=CONFIG_PATH, required=False)
         parser.add_argument('--debug', action='store_true')
         parser.add_argument('--show-secrets', action='store_true', help='Do not hide secrets in output')
+        parser.add_argument('--validate-all', action='store_true',
+                            help='Construct and validate all transports and definitions, not only used ones')
 
         if with_definition:
             parser.add_argument('definition', help='Backup definition name from the configuration file')
@@ -0,0 +1,58 @@
+from argparse import ArgumentParser
+from rkd.api.contract import ExecutionContext, TaskInterface
+from ..bincache import BinariesCache, parse_size
+from ..notifier import format_bytes
+from ..settings import BIN_VERSION_CACHE_PATH, BIN_BLOBS_CACHE_PATH, BIN_CACHE_MAX_SIZE
+
+
+class CacheStatsTask(TaskInterface):
+    """Shows size and contents of the local binaries cache"""
+
+    def get_name(self) -> str: return ':stats'
+    def get_group_name(self) -> str: return ':cache'
+
+    def configure_argparse(self, parser: ArgumentParser, with_definition: bool = False):
+        pass
+
+    def execute(self, context: ExecutionContext) -> bool:
+        cache = BinariesCache(BIN_VERSION_CACHE_PATH, BIN_BLOBS_CACHE_PATH)
+        stats = cache.stats()
+
+        self.io().outln('Versions: {}, blobs: {}, size: {} (limit {}), saved by deduplication: {}'.format(
+            stats.versions, stats.blobs, format_bytes(stats.size), format_bytes(BIN_CACHE_MAX_SIZE),
+            format_bytes(stats.deduplicated_size)
+        ))
+
+        for entry in sorted(cache.entries(), key=lambda e: e.last_used, reverse=True):
+            self.io().outln('{} -> {} ({})'.format(entry.name, entry.digest[0:12], format_bytes(entry.size)))
+
+        return True
+
+
+class CacheGarbageCollectionTask(TaskInterface):
+    """Removes least recently used binaries from the local cache, until the cache fits in the size limit"""
+
+    def get_name(self) -> str: return ':gc'
+    def get_group_name(self) -> str: return ':cache'
+
+    def configure_argparse(self, parser: ArgumentParser, with_definition: bool = False):
+        parser.add_argument('--max-size', default=str(BIN_CACHE_MAX_SIZE),
+                            help='Size limit e.g. "512M", "1G" or number of bytes (default: {})'.format(
+                                format_bytes(BIN_CACHE_MAX_SIZE)))
+
+    def execute(self, context: ExecutionContext) -> bool:
+        try:
+            max_size = parse_size(context.get_arg('--max-size'))
+
+        except ValueError as e:
+            self.io().error(str(e))
+            return False
+
+        collected = BinariesCache(BIN_VERSION_CACHE_PATH, BIN_BLOBS_CACHE_PATH).collect_garbage(max_size)
+
+        for name in collected.removed_versions:
+            self.io().info('Removed {}'.format(name))
+
+        self.io().success_msg('Freed {}'.format(format_bytes(collected.freed_size)))
+
+        return True
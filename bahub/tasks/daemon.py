@@ -0,0 +1,75 @@
+import signal
+from argparse import ArgumentParser
+from threading import Event
+from rkd.api.contract import ExecutionContext
+from .base import BaseTask
+from ..batch import ConcurrencyLimiter
+from ..scheduler import Scheduler, ScheduledJob, CronSchedule
+
+
+class DaemonTask(BaseTask):
+    """Runs continuously and makes backups according to schedules of definitions (meta.schedule, in cron format)
+
+    Configuration, transports and binaries cache are kept in memory between runs
+    """
+
+    def get_name(self) -> str:
+        return ':daemon'
+
+    def get_group_name(self) -> str:
+        return ':backup'
+
+    def configure_argparse(self, parser: ArgumentParser, with_definition: bool = False):
+        super().configure_argparse(parser, with_definition=False)
+        parser.add_argument('--workers', '-w', default=2, type=int,
+                            help='Number of definitions processed at once')
+        parser.add_argument('--jitter', default=300, type=float,
+                            help='Maximum random delay (in seconds) of each scheduled run')
+
+    def execute(self, context: ExecutionContext) -> bool:
+        if not super().execute(context):
+            return False
+
+        jobs = [
+            ScheduledJob(definition_name=name, schedule=CronSchedule(definition.get_schedule()))
+            for name, definition in self.config.definitions().items() if definition.get_schedule()
+        ]
+
+        if not jobs:
+            self.io().error('No backup definition has a "schedule" defined in "meta" section')
+            return False
+
+        names = [job.definition_name for job in jobs]
+
+        # each definition keeps its own transport (and its clients) between runs
+        for name in names:
+            self.config.get_definition(name).isolate_transport()
+
+        self.prepare_binaries_cache_for_definitions(names)
+
+        limiter = ConcurrencyLimiter()
+        limiter.configure([self.config.get_definition(name).get_transport() for name in names])
+
+        def run(name: str):
+            with limiter.limit(self.config.get_definition(name).get_transport()):
+                return self.run_backup_maker(name, is_backup=True, prepare_binaries=False)
+
+        scheduler = Scheduler(jobs, run=run, workers=int(context.get_arg('--workers')), io=self.io(),
+                              jitter=float(context.get_arg('--jitter')))
+
+        for name, run_at in scheduler.get_planned_runs().items():
+            self.io().info('"{}" will run at {}'.format(name, run_at.strftime('%Y-%m-%d %H:%M:%S')))
+
+        stop = Event()
+        signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+
+        try:
+            scheduler.run_forever(stop)
+
+        except KeyboardInterrupt:
+            stop.set()
+
+        finally:
+            self.notifier.flush()
+
+        return True
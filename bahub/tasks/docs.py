@@ -2,9 +2,7 @@ import json
 import yaml
 from argparse import ArgumentParser
 from rkd.api.contract import ExecutionContext, TaskInterface
-from ..importing import Importing
-from ..transports.all import transports
-from ..adapters import adapters
+from ..importing import Importing, BUILTIN_TRANSPORTS, BUILTIN_ADAPTERS
 
 
 class BackupTypeSchemaPrintingTask(TaskInterface):
@@ -92,14 +90,15 @@ class InfoTask(TaskInterface):
         self.io().print_line()
         self.io().outln('Standard built-in transports:')
 
-        for transport in transports():
-            self.io().outln('- {}'.format(transport.__module__))
+        # listed without importing - transports import heavy SDKs like docker or kubernetes
+        for short_name, module in BUILTIN_TRANSPORTS.items():
+            self.io().outln('- {} ({})'.format(module, short_name))
 
         self.io().print_line()
         self.io().outln('Standard built-in backup types:')
 
-        for adapter in adapters():
-            self.io().outln('- {}'.format(adapter.__module__))
+        for short_name, module in BUILTIN_ADAPTERS.items():
+            self.io().outln('- {} ({})'.format(module, short_name))
 
         self.io().print_line()
         self.io().info_msg('*The list includes ONLY officially distributed adapters and transports. '
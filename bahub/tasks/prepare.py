@@ -1,9 +1,16 @@
+from argparse import ArgumentParser
+from typing import List
 from rkd.api.contract import ExecutionContext
 from .base import BaseTask
+from ..batch import resolve_definition_names, run_batch, format_summary, ConcurrencyLimiter
+from ..exception import ConfigurationError
 
 
 class BackupPreparationTask(BaseTask):
     """Makes a backup and prints to stdout or into a file specified by --target parameter
+
+    Multiple definitions, globs (e.g. "db_*") or "all" can be specified to make backups in batch,
+    --parallel controls how many definitions are processed at once
     """
 
     def get_name(self) -> str:
@@ -12,8 +19,56 @@ class BackupPreparationTask(BaseTask):
     def get_group_name(self) -> str:
         return ':backup'
 
+    def configure_argparse(self, parser: ArgumentParser, with_definition: bool = True):
+        super().configure_argparse(parser, with_definition=False)
+        parser.add_argument('definition', nargs='+',
+                            help='Backup definition names from the configuration file, globs (e.g. "db_*") or "all"')
+        parser.add_argument('--parallel', '-j', default=1, type=int,
+                            help='Number of definitions processed at once, when making backups in batch')
+
     def execute(self, context: ExecutionContext) -> bool:
         if not super().execute(context):
             return False
 
-        return self.call_backup_maker(context, is_backup=True)
+        patterns = context.get_arg('definition')
+
+        try:
+            names = resolve_definition_names(patterns, self.config.get_definition_names())
+
+        except ConfigurationError as e:
+            self.io().error(str(e))
+            return False
+
+        # a single definition selected by name behaves as before - no summary, no separate transport instance
+        if names == patterns and len(names) == 1:
+            return self.run_backup_maker(names[0], is_backup=True).success
+
+        return self.make_backups_in_batch(names, workers=int(context.get_arg('--parallel')))
+
+    def make_backups_in_batch(self, names: List[str], workers: int) -> bool:
+        # binaries cache is shared, so it is prepared once, before any worker starts
+        self.prepare_binaries_cache_for_definitions(names)
+
+        limiter = ConcurrencyLimiter()
+        limiter.configure([self.config.get_definition(name).get_transport() for name in names])
+
+        self.io().info('Making backups of {} definitions, {} at once'.format(len(names), workers))
+
+        results = run_batch(
+            names,
+            run=lambda name: self.run_backup_maker(name, is_backup=True, isolated=True, prepare_binaries=False),
+            workers=workers,
+            limiter=limiter,
+            get_transport=lambda name: self.config.get_definition(name).get_transport()
+        )
+
+        self.io().outln(format_summary(results))
+
+        for transport_type in {self.config.get_definition(name).get_transport().__class__ for name in names}:
+            metrics = transport_type.get_metrics()
+
+            if metrics:
+                self.io().debug('{} metrics: {}'.format(transport_type.__module__, ', '.join(
+                    ['{}={}'.format(name, value) for name, value in metrics.items()])))
+
+        return all([result.success for result in results])
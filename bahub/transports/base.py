@@ -1,16 +1,53 @@
 import os
 import sys
 from abc import abstractmethod
-from subprocess import Popen, PIPE
-from time import sleep
-from typing import List, Union, Optional
-from jsonschema import validate, draft7_format_checker, ValidationError
+from subprocess import Popen, PIPE, TimeoutExpired
+from typing import List, Union, Optional, Dict
 from rkd.api.inputoutput import IO
 
 from ..bin import RequiredBinary
 from ..exception import SpecificationError
-from ..inputoutput import StreamableBuffer
-from ..schema import create_example_from_attributes
+from ..inputoutput import StreamableBuffer, set_pipe_size
+from ..schema import create_example_from_attributes, find_specification_errors
+from ..security import SensitiveDataRedactor
+
+
+# options that tune buffering of streams spawned by TransportInterface._exec_command()
+# can be included in "spec" schema of transports that use it
+BUFFERING_SPECIFICATION_PROPERTIES = {
+    "chunk_size": {
+        "type": "integer",
+        "minimum": 4096,
+        "example": 1048576,
+        "description": "Size of a single read/copy operation in bytes"
+    },
+    "pipe_size": {
+        "type": "integer",
+        "minimum": 4096,
+        "example": 1048576,
+        "description": "Capacity of process output pipe in bytes (Linux only, limited by /proc/sys/fs/pipe-max-size)"
+    },
+    "read_ahead_buffers": {
+        "type": "integer",
+        "minimum": 0,
+        "example": 0,
+        "default": 0,
+        "description": "Number of chunks read ahead in background thread, 0 disables read-ahead"
+    }
+}
+
+
+# options that limit parallelism, when many definitions are processed at once (batch mode)
+# can be included in "spec" schema of any transport
+CONCURRENCY_SPECIFICATION_PROPERTIES = {
+    "max_concurrency": {
+        "type": "integer",
+        "minimum": 1,
+        "example": 4,
+        "description": "Maximum number of definitions processed at once in the same concurrency group "
+                       "(e.g. Kubernetes namespace, Docker host), applies when backups are made in batch"
+    }
+}
 
 
 def create_backup_maker_command(command: str, definition, is_backup: bool,
@@ -69,9 +106,60 @@ class TransportInterface(object):
     _spec: dict
     _io: IO
 
+    # buffering of streams (see BUFFERING_SPECIFICATION_PROPERTIES)
+    _chunk_size: Optional[int]
+    _pipe_size: Optional[int]
+    _read_ahead_buffers: int
+
+    _max_concurrency: Optional[int]
+
+    # strips out secrets from the output of the backup process
+    _redactor: SensitiveDataRedactor
+
     def __init__(self, spec: dict, io: IO):
         self._spec = spec
         self._io = io
+        self._redactor = SensitiveDataRedactor([])
+        self._chunk_size = int(spec['chunk_size']) if spec.get('chunk_size') else None
+        self._pipe_size = int(spec['pipe_size']) if spec.get('pipe_size') else None
+        self._read_ahead_buffers = int(spec.get('read_ahead_buffers', 0))
+        self._max_concurrency = int(spec['max_concurrency']) if spec.get('max_concurrency') else None
+
+    def clone(self) -> 'TransportInterface':
+        """
+        Creates a new, not used yet instance with same configuration.
+        Transports keep state of the scheduled process, so each definition processed in parallel needs its own instance
+        """
+
+        transport = self.__class__(self._spec, self._io)
+        transport.set_redactor(self._redactor)
+
+        return transport
+
+    def set_redactor(self, redactor: SensitiveDataRedactor):
+        """
+        Sets a redactor (usually shared with the console output) that strips out secrets from output of the process
+        """
+
+        self._redactor = redactor
+
+    def get_concurrency_group(self) -> str:
+        """
+        Transports in the same group share a limit of definitions processed at once (see "max_concurrency")
+        """
+
+        return self.__class__.__module__
+
+    def get_concurrency_limit(self) -> Optional[int]:
+        return self._max_concurrency
+
+    @classmethod
+    def get_metrics(cls) -> Dict[str, int]:
+        """
+        Counters collected by all transports of this type in current process e.g. API calls saved by caching
+        """
+
+        return {}
 
     def __enter__(self) -> 'TransportInterface':
         """
@@ -115,13 +203,10 @@ class TransportInterface(object):
 
     @classmethod
     def validate_spec(cls, spec: dict):
-        spec_schema = cls.get_specification_schema()
+        errors = find_specification_errors(cls, spec)
 
-        if spec_schema:
-            try:
-                validate(instance=spec, schema=spec_schema, format_checker=draft7_format_checker)
-            except ValidationError as exc:
-                raise SpecificationError('Linked transport "spec" section parsing error, ' + str(exc))
+        if errors:
+            raise SpecificationError('\n - '.join(['Linked transport "spec" section parsing error:'] + errors))
 
     @abstractmethod
     def prepare_environment(self, binaries: List[RequiredBinary]) -> None:
@@ -149,11 +234,23 @@ class TransportInterface(object):
 
         return ''
 
+    def get_transferred_bytes(self) -> Optional[int]:
+        """
+        Optionally return size of the transferred backup, when the transport is able to tell it
+        """
+
+        return None
+
     def io(self) -> IO:
         return self._io
 
     def _exec_command(self, command: Union[str, List[str]], stdin: Optional[StreamableBuffer] = None,
-                      env: dict = None) -> StreamableBuffer:
+                      env: dict = None, binary: bool = False) -> StreamableBuffer:
+        """
+        Spawns a process and returns its stdout as a StreamableBuffer
+
+        :param binary: Keep raw bytes (no decoding) and expose an unbuffered pipe, so it can be copied by the kernel
+        """
 
         proc_env = dict(os.environ)
 
@@ -165,12 +262,31 @@ class TransportInterface(object):
                      stdout=PIPE,
                      stderr=sys.stderr.fileno(),
                      env=env,
-                     text=True)
+                     text=not binary,
+                     bufsize=0 if binary else -1)
+
+        if self._pipe_size:
+            try:
+                self.io().debug(f"Pipe capacity set to {set_pipe_size(proc.stdout.fileno(), self._pipe_size)}")
+
+            except OSError as exc:
+                self.io().warn(f"Cannot set pipe capacity to {self._pipe_size}: {exc}")
+
+        def wait_for_exit(timeout: float) -> bool:
+            try:
+                proc.wait(timeout=timeout)
+                return True
+
+            except TimeoutExpired:
+                return False
 
         def close_stream():
             proc.stdout.close()
-            proc.terminate()
-            sleep(1)
+
+            # give the process a moment to exit on its own after its output was consumed, then terminate
+            if not wait_for_exit(1):
+                proc.terminate()
+                wait_for_exit(1)
 
         return StreamableBuffer(
             io=self._io,
@@ -179,9 +295,12 @@ class TransportInterface(object):
             eof_callback=lambda: proc.poll() is not None,
             is_success_callback=lambda: proc.poll() == 0,
             has_exited_with_failure=lambda: proc.poll() is not None and proc.poll() >= 1,
+            wait_for_exit_callback=wait_for_exit,
             description='command <{}>'.format(command),
             buffer=proc.stdout,
-            parent=stdin
+            parent=stdin,
+            chunk_size=self._chunk_size,
+            read_ahead_buffers=self._read_ahead_buffers
         )
 
     def get_required_binaries(self):
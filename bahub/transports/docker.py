@@ -7,18 +7,37 @@ Executes commands inside a running docker container.
 Note: Requires access to the docker daemon. Make sure your user is in a "docker" group (have access to the socket)
 """
 import os
-import subprocess
-from tempfile import TemporaryDirectory
-import docker
-from typing import List, Generator
+import re
+import shlex
+import tarfile
+from tempfile import TemporaryDirectory, SpooledTemporaryFile
+from typing import List, Generator, Tuple, Dict, Optional
 from docker import DockerClient
+from docker.errors import NotFound
 from docker.models.containers import Container
 from rkd.api.inputoutput import IO
-from .base import TransportInterface, create_backup_maker_command
+from .base import TransportInterface, create_backup_maker_command, CONCURRENCY_SPECIFICATION_PROPERTIES
+from .docker_clients import DockerClients
 from .sh import LocalFilesystem
-from ..bin import RequiredBinary, copy_required_tools_from_controller_cache_to_target_env
-from ..fs import FilesystemInterface
-from ..settings import TARGET_ENV_BIN_PATH, TARGET_ENV_VERSIONS_PATH
+from ..bin import RequiredBinary, copy_required_tools_from_controller_cache_to_target_env, \
+    copy_encryption_keys_from_controller_to_target_env, TargetEnvironmentLocks
+from ..fs import FilesystemInterface, FilesystemOperationsBatch
+from ..inputoutput import LineFramer, BatchedLineWriter
+from ..settings import BIN_VERSION_CACHE_PATH, TARGET_ENV_BIN_PATH, TARGET_ENV_VERSIONS_PATH
+
+
+# can be included in "spec" schema of transports based on this one
+DEMUX_SPECIFICATION_PROPERTIES = {
+    "demux": {
+        "type": "boolean",
+        "example": False,
+        "default": False,
+        "description": "Read stdout and stderr of the backup process separately, so their lines are never mixed"
+    }
+}
+
+# archives bigger than this are buffered on disk
+SPOOLED_ARCHIVE_MAX_MEMORY = 1024 * 1024 * 16
 
 
 class DockerFilesystemTransport(FilesystemInterface):
@@ -32,10 +51,16 @@ class DockerFilesystemTransport(FilesystemInterface):
         exit_code, result = self.container.exec_run(["mkdir", "-p", path])
         assert exit_code == 0, f"Cannot create directory inside container at path {path}: {result}"
 
-    def download(self, url: str, destination_path: str):
+    def download(self, url: str, destination_path: str, sha256: str = ''):
         exit_code, result = self.container.exec_run(["curl", "-f", "-L", "--output", destination_path, url])
         assert exit_code == 0, f"Cannot download {url} into {destination_path} inside container: {result}"
 
+        if sha256:
+            exit_code, result = self.container.exec_run(
+                ["/bin/sh", "-c", f"echo '{sha256}  {destination_path}' | sha256sum -c -"]
+            )
+            assert exit_code == 0, f"Checksum of {destination_path} inside container does not match: {result}"
+
     def delete_file(self, path: str):
         exit_code, result = self.container.exec_run(["rm", "-f", path])
         assert exit_code == 0, f"Cannot remove file at path {path} inside container: {result}"
@@ -52,8 +77,42 @@ class DockerFilesystemTransport(FilesystemInterface):
         exit_code, result = self.container.exec_run(["test", "-f", path])
         return exit_code == 0
 
+    def read_file(self, path: str) -> str:
+        exit_code, result = self.container.exec_run(["cat", path])
+        return result.decode('utf-8') if exit_code == 0 else ''
+
+    def checksum(self, path: str) -> str:
+        exit_code, result = self.container.exec_run(["sha256sum", path])
+        assert exit_code == 0, f"Cannot calculate checksum of '{path}' inside container: {result}"
+
+        return result.decode('utf-8').split(' ')[0]
+
     def copy_to(self, local_path: str, dst_path: str):
-        subprocess.check_call(["docker", "cp", local_path, self.container.id + ":" + dst_path])
+        self.put_files([(local_path, dst_path)])
+
+    def put_files(self, files: List[Tuple[str, str]]):
+        """
+        Uploads multiple files in one request through Docker API (files are sent as a tar archive)
+
+        :param files: List of (local path, absolute path inside container)
+        """
+
+        with SpooledTemporaryFile(max_size=SPOOLED_ARCHIVE_MAX_MEMORY) as buffer:
+            with tarfile.open(fileobj=buffer, mode='w') as archive:
+                for local_path, dst_path in files:
+                    stat = os.stat(local_path)
+                    info = tarfile.TarInfo(dst_path.lstrip('/'))
+                    info.size = stat.st_size
+                    info.mode = stat.st_mode & 0o777
+                    info.mtime = int(stat.st_mtime)
+
+                    with open(local_path, 'rb') as f:
+                        archive.addfile(info, f)
+
+            buffer.seek(0)
+
+            assert self.container.put_archive('/', buffer), \
+                f"Cannot copy files into container: {', '.join([dst for local, dst in files])}"
 
     def pack(self, archive_path: str, src_path: str, files_list: List[str]):
         if not files_list:
@@ -74,6 +133,58 @@ class DockerFilesystemTransport(FilesystemInterface):
         exit_code, result = self.container.exec_run(["mv", src, dst])
         return exit_code == 0, f"Cannot move file '{src}' to '{dst}'"
 
+    def batch(self) -> 'DockerFilesystemOperationsBatch':
+        return DockerFilesystemOperationsBatch(self)
+
+
+class DockerFilesystemOperationsBatch(FilesystemOperationsBatch):
+    """
+    Executes a whole batch as a single shell script inside the container - one exec instead of one per operation.
+    Each step reports its exit code, the script stops at first failing step
+    """
+
+    fs: DockerFilesystemTransport
+
+    COMMANDS = {
+        'force_mkdir': lambda path: ["mkdir", "-p", path],
+        'delete_file': lambda path: ["rm", "-f", path],
+        'link': lambda src, dst: ["ln", "-s", src, dst],
+        'make_executable': lambda path: ["chmod", "+x", path],
+        'unpack': lambda archive_path, dst_path: ["tar", "-xf", archive_path, "--directory", dst_path],
+        'move': lambda src, dst: ["mv", src, dst]
+    }
+
+    def create_script(self) -> str:
+        steps = []
+
+        for num, (name, args) in enumerate(self.operations):
+            command = " ".join([shlex.quote(arg) for arg in self.COMMANDS[name](*args)])
+            steps.append(f'{command} 2>&1; rc=$?; echo "@<br-step {num} $rc>"; [ $rc -eq 0 ] || exit $rc')
+
+        return "\n".join(steps)
+
+    def execute(self):
+        if self.uploads:
+            self.fs.put_files(self.uploads)
+
+        if not self.operations:
+            return
+
+        exit_code, result = self.fs.container.exec_run(["/bin/sh", "-c", self.create_script()])
+        output = result.decode('utf-8', errors='replace') if isinstance(result, bytes) else str(result)
+        statuses = re.findall(r'@<br-step (\d+) (\d+)>', output)
+
+        if exit_code == 0 and len(statuses) == len(self.operations):
+            return
+
+        # the step that reported a failure or the first one that did not report at all
+        failed = int(statuses[-1][0]) if statuses and statuses[-1][1] != '0' else len(statuses)
+        name, args = self.operations[min(failed, len(self.operations) - 1)]
+        output = re.sub(r'@<br-step \d+ \d+>\n?', '', output)
+
+        raise AssertionError(f"Cannot {name} {args} inside container (step {failed + 1} of {len(self.operations)}, "
+                             f"exit code {exit_code}): {output}")
+
 
 class Transport(TransportInterface):
     """
@@ -85,13 +196,16 @@ class Transport(TransportInterface):
 
     _container_name: str
     _shell: str
+    _demux: bool
     _client: DockerClient
     _container: Container
+    _fs: DockerFilesystemTransport
     bin_path: str = TARGET_ENV_BIN_PATH
     versions_path: str = TARGET_ENV_VERSIONS_PATH
     binaries: List[RequiredBinary]
     _exec_stream: Generator
     _exec_id: str
+    _transferred_bytes: Optional[int] = None
 
     def __init__(self, spec: dict, io: IO):
         super().__init__(spec, io)
@@ -100,25 +214,63 @@ class Transport(TransportInterface):
         self._io = io
         self._container_name = spec.get('container')
         self._shell = spec.get('shell', '/bin/sh')
+        self._demux = bool(spec.get('demux', False))
 
     @property
     def client(self) -> DockerClient:
+        """
+        Client shared by all Docker transports connecting to the same daemon (see DockerClients)
+        """
+
         if not hasattr(self, "_client"):
-            self._client = docker.from_env()
+            self._client = DockerClients.get_client()
             self._populate_container_information()
 
         return self._client
 
     def _populate_container_information(self):
-        self.fs = DockerFilesystemTransport(self.container)
+        """
+        Called once, when the client is created - a place to inspect additional containers
+        """
 
     @property
     def container(self) -> Container:
         if not hasattr(self, "_container"):
-            self._container = self.client.containers.get(self._container_name)
+            self._refresh_container()
 
         return self._container
 
+    def _refresh_container(self):
+        """
+        Takes the container again from DockerClients (inspected again after its TTL) - the transport is kept
+        between runs by the daemon, while the container could be recreated in the meantime
+        """
+
+        self._container = DockerClients.get_container(self._container_name)
+        self._fs = DockerFilesystemTransport(self._container)
+
+    def _forget_container(self):
+        """
+        Container was removed or recreated - next use will inspect it again
+        """
+
+        DockerClients.invalidate_container(self._container_name)
+
+        for attribute in ['_container', '_fs']:
+            if hasattr(self, attribute):
+                delattr(self, attribute)
+
+    @property
+    def fs(self) -> DockerFilesystemTransport:
+        if not hasattr(self, "_fs"):
+            self._refresh_container()
+
+        return self._fs
+
+    @classmethod
+    def get_metrics(cls) -> Dict[str, int]:
+        return DockerClients.get_metrics()
+
     @staticmethod
     def get_specification_schema() -> dict:
         return {
@@ -134,10 +286,16 @@ class Transport(TransportInterface):
                     "type": "string",
                     "example": "/bin/sh",
                     "default": "/bin/sh"
-                }
+                },
+                **DEMUX_SPECIFICATION_PROPERTIES,
+                **CONCURRENCY_SPECIFICATION_PROPERTIES
             }
         }
 
+    def get_concurrency_group(self) -> str:
+        # all containers on the same Docker host
+        return 'docker:' + os.getenv('DOCKER_HOST', 'local')
+
     def prepare_environment(self, binaries: List[RequiredBinary]) -> None:
         self.binaries = binaries
 
@@ -152,18 +310,39 @@ class Transport(TransportInterface):
         :return:
         """
 
+        self._refresh_container()
+
+        try:
+            self._schedule(command, definition, is_backup, version)
+
+        except NotFound:
+            self._forget_container()
+            raise
+
+    def _schedule(self, command: str, definition, is_backup: bool, version: str):
         new_path = self.discover_path_variable_in_container() + ":" + self.bin_path
         self.io().debug(f"Setting $PATH={new_path}")
 
-        copy_required_tools_from_controller_cache_to_target_env(
-            local_cache_fs=LocalFilesystem(),
-            dst_fs=self.fs,
-            io=self.io(),
-            bin_path=self.bin_path,
-            versions_path=self.versions_path,
-            local_versions_path=os.path.expanduser("~/.backup-controller/versions"),  # todo
-            binaries=self.binaries
-        )
+        # keys and tools are uploaded in one request
+        with TargetEnvironmentLocks.lock('docker:' + self.container.id), self.fs.batch() as batch:
+            copy_encryption_keys_from_controller_to_target_env(
+                src_fs=LocalFilesystem(),
+                dst_fs=self.fs,
+                pub_key_path=definition.encryption().get_public_key_path(),
+                private_key_path=definition.encryption().get_private_key_path(),
+                io=self.io(),
+                batch=batch
+            )
+            copy_required_tools_from_controller_cache_to_target_env(
+                local_cache_fs=LocalFilesystem(),
+                dst_fs=self.fs,
+                io=self.io(),
+                bin_path=self.bin_path,
+                versions_path=self.versions_path,
+                local_versions_path=BIN_VERSION_CACHE_PATH,
+                binaries=self.binaries,
+                batch=batch
+            )
 
         complete_cmd = create_backup_maker_command(command, definition, is_backup, version)
 
@@ -181,7 +360,7 @@ class Transport(TransportInterface):
         # start spawned command. Save its ID - we will be able to track its status later
         self._exec_id = response['Id']
         self._exec_stream = self.client.api.exec_start(
-            response['Id'], stream=True
+            response['Id'], stream=True, demux=self._demux
         )
 
     def watch(self) -> bool:
@@ -190,13 +369,38 @@ class Transport(TransportInterface):
         :return:
         """
 
-        for lines in self._exec_stream:
-            for line in lines.split(b'\n'):
-                self.io().info(line.decode('utf-8'))
+        writer = BatchedLineWriter(self.io().info)
+        framers = [LineFramer(), LineFramer()]
+        redacting_streams = [self._redactor.create_stream(), self._redactor.create_stream()]
+        self._transferred_bytes = 0
+
+        # with "demux" each chunk is a tuple (stdout, stderr), lines of both streams are framed separately
+        # secrets are redacted before framing - a secret split between chunks is never written
+        for chunk in self._exec_stream:
+            for framer, redacting_stream, data in zip(framers, redacting_streams, chunk if self._demux else [chunk]):
+                if data:
+                    self._transferred_bytes += len(data)
+                    writer.write_lines(framer.feed(redacting_stream.feed(data)))
+
+            # a write per chunk, not per line - logs are not delayed, when the process is quiet
+            writer.flush()
+
+        for framer, redacting_stream in zip(framers, redacting_streams):
+            tail = redacting_stream.flush()
+
+            if tail:
+                writer.write_lines(framer.feed(tail))
+
+            writer.write_lines(framer.flush())
+
+        writer.flush()
 
         self.io().debug(f"Docker exec process returned code={self._exit_code}")
         return self._exit_code == 0
 
+    def get_transferred_bytes(self) -> Optional[int]:
+        return self._transferred_bytes
+
     def discover_path_variable_in_container(self) -> str:
         """
         Returns $PATH value from container
@@ -0,0 +1,187 @@
+"""
+Docker connections
+==================
+
+Process-wide pool of Docker clients - one per daemon address and TLS configuration, and a short-lived cache
+of inspected containers. Many definitions targeting the same Docker host share one connection
+and do not repeat the same API calls.
+"""
+import os
+from threading import RLock
+from time import monotonic
+from typing import Dict, Tuple, Optional, Mapping
+import docker
+from docker import DockerClient
+from docker.errors import APIError, ImageNotFound
+from docker.models.containers import Container
+from rkd.api.inputoutput import IO
+
+# how long (in seconds) an inspected container is reused, before it is inspected again
+CONTAINER_CACHE_TTL = 5.0
+
+# how long (in seconds) an image is considered up-to-date after its digest was compared with the registry
+IMAGE_CHECK_TTL = 300.0
+
+
+class DockerClients(object):
+    """
+    Shared DockerClient instances and inspected containers
+
+    Metrics (see get_metrics()):
+        clients_created, clients_reused - each new client costs an API call (version negotiation)
+        containers_inspected, containers_from_cache - each inspect is an API call
+        api_calls_saved - calls that were not made thanks to the pool and the cache
+        images_pulled, image_pulls_skipped - image is pulled only when its digest in the registry changed
+    """
+
+    _clients: Dict[Tuple[str, str, str], DockerClient] = {}
+    _containers: Dict[Tuple[Tuple[str, str, str], str], Tuple[float, Container]] = {}
+    _images: Dict[Tuple[Tuple[str, str, str], str], Tuple[float, str]] = {}
+    _metrics: Dict[str, int] = {}
+    _lock = RLock()
+
+    @staticmethod
+    def get_connection_key(environment: Optional[Mapping[str, str]] = None) -> Tuple[str, str, str]:
+        environment = os.environ if environment is None else environment
+
+        return (
+            environment.get('DOCKER_HOST', ''),
+            environment.get('DOCKER_TLS_VERIFY', ''),
+            environment.get('DOCKER_CERT_PATH', '')
+        )
+
+    @classmethod
+    def get_client(cls) -> DockerClient:
+        return cls._get_client(count_reuse=True)
+
+    @classmethod
+    def _get_client(cls, count_reuse: bool) -> DockerClient:
+        key = cls.get_connection_key()
+
+        with cls._lock:
+            if key not in cls._clients:
+                cls._clients[key] = docker.from_env()
+                cls._increment('clients_created')
+
+            elif count_reuse:
+                cls._increment('clients_reused')
+
+            return cls._clients[key]
+
+    @classmethod
+    def get_container(cls, name: str, ttl: float = CONTAINER_CACHE_TTL) -> Container:
+        """
+        Returns an inspected container. The same container is inspected again after "ttl" seconds
+
+        :raises docker.errors.NotFound:
+        """
+
+        key = (cls.get_connection_key(), name)
+
+        with cls._lock:
+            cached = cls._containers.get(key)
+
+            if cached and monotonic() - cached[0] < ttl:
+                cls._increment('containers_from_cache')
+                return cached[1]
+
+        # inspect is not done under the lock - other threads can use other containers meanwhile
+        container = cls._get_client(count_reuse=False).containers.get(name)
+
+        with cls._lock:
+            cls._containers[key] = (monotonic(), container)
+            cls._increment('containers_inspected')
+
+        return container
+
+    @classmethod
+    def invalidate_container(cls, name: str):
+        """
+        Forgets inspected container e.g. when it was recreated or removed
+        """
+
+        with cls._lock:
+            cls._containers.pop((cls.get_connection_key(), name), None)
+
+    @classmethod
+    def ensure_image(cls, image: str, io: IO, ttl: float = IMAGE_CHECK_TTL) -> str:
+        """
+        Makes sure that the local image is the same as in the registry - compares digests through Docker API,
+        pulls the image only when digest changed or the image is not present locally.
+        When the registry cannot be reached, then the local image is used
+
+        :return: Local image id
+        """
+
+        key = (cls.get_connection_key(), image)
+
+        with cls._lock:
+            cached = cls._images.get(key)
+
+            if cached and monotonic() - cached[0] < ttl:
+                return cached[1]
+
+        client = cls._get_client(count_reuse=False)
+
+        try:
+            local = client.images.get(image)
+        except ImageNotFound:
+            local = None
+
+        try:
+            remote_digest = client.images.get_registry_data(image).id
+
+        except APIError as e:
+            if local is None:
+                raise
+
+            io.warn(f'Cannot check image "{image}" in registry, using local image. {e}')
+            remote_digest = None
+
+        if local is None or (remote_digest and not cls._has_digest(local.attrs, remote_digest)):
+            io.info(f'Pulling image "{image}"')
+            local = client.images.pull(image)
+            metric = 'images_pulled'
+        else:
+            io.debug(f'Image "{image}" is up-to-date')
+            metric = 'image_pulls_skipped'
+
+        with cls._lock:
+            cls._images[key] = (monotonic(), local.id)
+            cls._increment(metric)
+
+        return local.id
+
+    @staticmethod
+    def _has_digest(image_attrs: dict, digest: str) -> bool:
+        return any([repo_digest.endswith('@' + digest) for repo_digest in image_attrs.get('RepoDigests') or []])
+
+    @classmethod
+    def get_metrics(cls) -> Dict[str, int]:
+        with cls._lock:
+            metrics = {name: cls._metrics.get(name, 0) for name in
+                       ['clients_created', 'clients_reused', 'containers_inspected', 'containers_from_cache',
+                        'images_pulled', 'image_pulls_skipped']}
+
+        metrics['api_calls_saved'] = metrics['clients_reused'] + metrics['containers_from_cache']
+
+        return metrics
+
+    @classmethod
+    def reset(cls):
+        """
+        Closes all connections, clears cache and metrics
+        """
+
+        with cls._lock:
+            for client in cls._clients.values():
+                client.close()
+
+            cls._clients = {}
+            cls._containers = {}
+            cls._images = {}
+            cls._metrics = {}
+
+    @classmethod
+    def _increment(cls, name: str):
+        cls._metrics[name] = cls._metrics.get(name, 0) + 1
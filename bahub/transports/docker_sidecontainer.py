@@ -4,12 +4,139 @@ Temporary Docker Transport (bahub.transports.temporarydocker)
 
 Places a temporary container to copy data from other container while the second container will be shutted down for
 maintenance time
+
+With "warm_pool" the temporary containers are not removed after use - up to N idle containers per image
+and original container are kept running and reused by next backups
 """
-import subprocess
+from typing import List, Optional
 
 from rkd.api.inputoutput import IO
+from docker import DockerClient
+from docker.errors import APIError
 from docker.models.containers import Container
-from .docker import Transport as RegularDockerTransport, DockerFilesystemTransport
+from .base import CONCURRENCY_SPECIFICATION_PROPERTIES
+from .docker import Transport as RegularDockerTransport, DockerFilesystemTransport, DEMUX_SPECIFICATION_PROPERTIES
+from .docker_clients import DockerClients
+
+POOL_IMAGE_LABEL = 'org.riotkit.bahub.side-container'
+POOL_VOLUMES_FROM_LABEL = 'org.riotkit.bahub.volumes-from'
+
+# directory created by the process that uses the container - "mkdir" is atomic, only one process can claim it
+POOL_CLAIM_PATH = '/tmp/.br-claimed'
+
+# files that are left in the container after backup, binaries are kept - next use does not need to upload them
+POOL_CLEANED_UP_FILES = ['/tmp/.gpg.key', '/tmp/.gpg.pub']
+
+
+class SideContainerPool(object):
+    """
+    Idle temporary containers, found by labels on the Docker daemon - so are shared between runs of the application.
+
+    "volumes_from" can be set only when the container is created, so the pool is kept per image
+    and per original container
+    """
+
+    _client: DockerClient
+    _image: str
+    _original_id: str
+    _size: int
+
+    def __init__(self, client: DockerClient, image: str, original_id: str, size: int):
+        self._client = client
+        self._image = image
+        self._original_id = original_id
+        self._size = size
+
+    def get_original_id(self) -> str:
+        return self._original_id
+
+    def get_labels(self) -> dict:
+        return {POOL_IMAGE_LABEL: self._image, POOL_VOLUMES_FROM_LABEL: self._original_id}
+
+    def list(self) -> List[Container]:
+        return self._client.containers.list(
+            all=True, filters={'label': ['{}={}'.format(k, v) for k, v in self.get_labels().items()]}
+        )
+
+    def acquire(self, image_id: str, io: IO) -> Optional[Container]:
+        """
+        Claims an idle container. Containers that are stopped or created from an outdated image are removed
+
+        :return: None when there is no idle container
+        """
+
+        for container in self.list():
+            is_running = container.status == 'running'
+
+            if is_running and container.attrs.get('Image') == image_id:
+                if self._claim(container):
+                    io.debug(f'Reusing warm temporary container {container.id}')
+                    return container
+
+                continue
+
+            # an outdated container could be still in use by other process
+            if not is_running or self._claim(container):
+                io.debug(f'Removing outdated temporary container {container.id}')
+                self._remove(container)
+
+        return None
+
+    def create(self, host_config: dict) -> Container:
+        info = self._client.api.create_container(
+            image=self._image,
+            entrypoint=['sleep'],
+            command=[str(86400 * 5)],
+            host_config=host_config,
+            labels=self.get_labels()
+        )
+        container = self._client.containers.get(info['Id'])
+        container.start()
+
+        if not self._claim(container):
+            self._remove(container)
+            raise Exception(f'Cannot claim temporary container {container.id}')
+
+        return container
+
+    def release(self, container: Container, io: IO):
+        """
+        Gives back the container to the pool, or removes it when the pool is full
+        """
+
+        in_pool = [c for c in self.list() if c.status == 'running']
+
+        if len(in_pool) <= self._size:
+            exit_code, output = container.exec_run(
+                ['/bin/sh', '-c', 'rm -f {} && rmdir {}'.format(' '.join(POOL_CLEANED_UP_FILES), POOL_CLAIM_PATH)]
+            )
+
+            if exit_code == 0:
+                io.debug(f'Temporary container {container.id} was returned to the pool')
+                return
+
+            io.warn(f'Cannot clean up temporary container: {output}')
+
+        io.debug(f'Removing temporary container {container.id}')
+        self._remove(container)
+
+    @staticmethod
+    def _claim(container: Container) -> bool:
+        try:
+            exit_code, _ = container.exec_run(['mkdir', POOL_CLAIM_PATH])
+
+        except APIError:
+            return False
+
+        return exit_code == 0
+
+    @staticmethod
+    def _remove(container: Container):
+        try:
+            container.remove(force=True)
+
+        except APIError:
+            pass
 
 
 class Transport(RegularDockerTransport):
@@ -23,6 +150,7 @@ class Transport(RegularDockerTransport):
     _spec: dict
     _should_stop_original: bool
     _should_pull_image: bool
+    _warm_pool_size: int
 
     original_container: Container  # original container
     container: Container           # temporary container
@@ -34,10 +162,16 @@ class Transport(RegularDockerTransport):
         self._shell = spec.get('shell', '/bin/bash')
         self._should_stop_original = spec.get('stop', True)
         self._should_pull_image = spec.get('pull', True)
+        self._warm_pool_size = int(spec.get('warm_pool', 0))
+        self._container_name = spec.get('orig_container')
 
-    def _populate_container_information(self):
-        self._container_name = self._spec.get('orig_container')
-        self.original_container = self._client.containers.get(self._container_name)
+    def _refresh_container(self):
+        """
+        The temporary container is spawned on each run (see __enter__), it is not looked up by name
+        """
+
+    def _forget_container(self):
+        DockerClients.invalidate_container(self._container_name)
 
     @staticmethod
     def get_specification_schema() -> dict:
@@ -63,7 +197,22 @@ class Transport(RegularDockerTransport):
                     "type": "boolean",
                     "example": True,
                     "default": True
-                }
+                },
+                "pull": {
+                    "type": "boolean",
+                    "example": True,
+                    "default": True,
+                    "description": "Pull the image when its digest in the registry is different than local"
+                },
+                "warm_pool": {
+                    "type": "integer",
+                    "minimum": 0,
+                    "example": 2,
+                    "default": 0,
+                    "description": "Number of temporary containers kept running for next backups (0 - disabled)"
+                },
+                **DEMUX_SPECIFICATION_PROPERTIES,
+                **CONCURRENCY_SPECIFICATION_PROPERTIES
             }
         }
 
@@ -73,36 +222,26 @@ class Transport(RegularDockerTransport):
         :return:
         """
 
-        is_there_original_container = hasattr(self, "original_container")
+        # the original container could be recreated between runs (e.g. in daemon mode), so it is taken again
+        self.original_container = DockerClients.get_container(self._container_name)
 
         # stop the original container at first
-        if is_there_original_container and self._should_stop_original:
+        if self._should_stop_original:
             self.io().info('Stopping original container {}'.format(self.original_container.id))
             self.original_container.stop()
 
         try:
-            self.io().info('Creating a temporary container...')
-            host_config = self.client.api.create_host_config(volumes_from=[self.original_container.id])
+            image_id = DockerClients.ensure_image(self._temp_image, self.io()) if self._should_pull_image else None
 
-            if self._should_pull_image:
-                subprocess.check_call(['docker', 'pull', self._temp_image])
-
-            info = self.client.api.create_container(
-                image=self._temp_image,
-                entrypoint=['sleep'],
-                command=[str(86400 * 5)],
-                host_config=host_config
-            )
-            self._container = self.client.containers.get(info['Id'])
-            self.io().debug('Temporary container was spawned')
-
-            self._container.start()
-            self.io().debug('Temporary container was started')
+            if self._warm_pool_size:
+                self._container = self._acquire_from_pool(image_id)
+            else:
+                self._container = self._create_container()
 
             # will allow injection of required binaries into container
-            self.fs = DockerFilesystemTransport(self._container)
+            self._fs = DockerFilesystemTransport(self._container)
         except:
-            if is_there_original_container and self._should_stop_original:
+            if self._should_stop_original:
                 self.io().error("Error while starting temporary container, restoring original container")
                 self.original_container.start()
 
@@ -110,14 +249,63 @@ class Transport(RegularDockerTransport):
 
         return self
 
+    def _create_container(self) -> Container:
+        self.io().info('Creating a temporary container...')
+        host_config = self.client.api.create_host_config(volumes_from=[self.original_container.id])
+
+        info = self.client.api.create_container(
+            image=self._temp_image,
+            entrypoint=['sleep'],
+            command=[str(86400 * 5)],
+            host_config=host_config
+        )
+        container = self.client.containers.get(info['Id'])
+        self.io().debug('Temporary container was spawned')
+
+        container.start()
+        self.io().debug('Temporary container was started')
+
+        return container
+
+    def _acquire_from_pool(self, image_id: Optional[str]) -> Container:
+        if not image_id:
+            image_id = self.client.images.get(self._temp_image).id
+
+        container = self.pool.acquire(image_id, self.io())
+
+        if container is None:
+            self.io().info('Creating a temporary container for the warm pool...')
+            container = self.pool.create(self.client.api.create_host_config(volumes_from=[self.original_container.id]))
+
+        return container
+
+    @property
+    def pool(self) -> SideContainerPool:
+        # containers in the pool share volumes of the original container - the pool changes with it
+        if not hasattr(self, '_pool') or self._pool.get_original_id() != self.original_container.id:
+            self._pool = SideContainerPool(self.client, self._temp_image, self.original_container.id,
+                                           self._warm_pool_size)
+
+        return self._pool
+
     def __exit__(self, exc_type, exc_val, exc_t) -> None:
+        if self._warm_pool_size:
+            try:
+                self.pool.release(self.container, self.io())
+            finally:
+                self._bring_back_original_container()
+
+            return
+
         try:
             self.io().info('Killing temporary container')
             self.container.kill()
         finally:
             self.io().debug('Removing temporary container')
             self.container.remove(force=True)
+            self._bring_back_original_container()
 
-            if self._should_stop_original:
-                self.io().info('Bringing back the orginal container')
-                self.original_container.start()
+    def _bring_back_original_container(self):
+        if self._should_stop_original:
+            self.io().info('Bringing back the orginal container')
+            self.original_container.start()
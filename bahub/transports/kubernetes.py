@@ -25,10 +25,12 @@ class ExecResult(object):
 
     _process: WSClient
     _io: IO
+    _transferred_bytes: int
 
     def __init__(self, process: WSClient, io: IO):
         self._process = process
         self._io = io
+        self._transferred_bytes = 0
 
     def read(self) -> str:
         """
@@ -53,8 +55,16 @@ class ExecResult(object):
 
             for line in out:
                 if line:
+                    self._transferred_bytes += len(line.encode('utf-8'))
                     printer(line)
 
+    def get_transferred_bytes(self) -> int:
+        """
+        Size of the output read by watch()
+        """
+
+        return self._transferred_bytes
+
     def is_still_running(self) -> bool:
         return self._process.is_open()
 
@@ -211,7 +221,7 @@ class KubernetesPodFilesystem(FilesystemInterface):
         self.pod_name = pod_name
         self.namespace = namespace
 
-    def _exec(self, cmd: List[str], msg: str, exit_code_hack: bool = False):
+    def _exec(self, cmd: List[str], msg: str, exit_code_hack: bool = False) -> str:
         if exit_code_hack:
             cmd = ["/bin/sh", "-c", (" ".join(cmd)) + " && echo '@<br-exit-ok>'"]
 
@@ -223,16 +233,25 @@ class KubernetesPodFilesystem(FilesystemInterface):
         if exit_code_hack:
             assert "@<br-exit-ok>" in result, f"Process exited with failure. Output: {result}"
 
+        return result
+
     def force_mkdir(self, path: str):
         self._exec(["mkdir", "-p", path], "mkdir inside POD failed, cannot create directory", exit_code_hack=True)
 
-    def download(self, url: str, destination_path: str):
+    def download(self, url: str, destination_path: str, sha256: str = ''):
         self._exec(
             ["curl", "-s", "-L", "--output", destination_path, url],
             f"curl inside POD failed, cannot download file from '{url}' to '{destination_path}' path inside POD",
             exit_code_hack=True
         )
 
+        if sha256:
+            self._exec(
+                ["echo", f"'{sha256}  {destination_path}'", "|", "sha256sum", "-c", "-"],
+                f"Checksum of '{destination_path}' inside POD does not match",
+                exit_code_hack=True
+            )
+
     def delete_file(self, path: str):
         try:
             self._exec(["rm", path], f"Cannot remove file inside POD at path '{path}' (inside POD)",
@@ -294,6 +313,16 @@ class KubernetesPodFilesystem(FilesystemInterface):
 
         return True
 
+    def read_file(self, path: str) -> str:
+        try:
+            return self._exec(["cat", path], f"Cannot read file '{path}' (inside POD)")
+
+        except AssertionError:
+            return ''
+
+    def checksum(self, path: str) -> str:
+        return self._exec(["sha256sum", path], f"Cannot calculate checksum of '{path}' (inside POD)").split(' ')[0]
+
     def find_temporary_dir_path(self) -> str:
         return TemporaryDirectory().name
 
@@ -5,15 +5,15 @@ Kubernetes POD EXEC transport
 Performs `exec` operation into EXISTING, RUNNING POD to run a backup operation in-place.
 """
 
-from typing import List
+from typing import List, Optional
 from kubernetes import config, client
 from rkd.api.inputoutput import IO
 
 from bahub.bin import RequiredBinary, copy_required_tools_from_controller_cache_to_target_env, \
-    copy_encryption_keys_from_controller_to_target_env
+    copy_encryption_keys_from_controller_to_target_env, TargetEnvironmentLocks
 from bahub.exception import ConfigurationError
 from bahub.settings import BIN_VERSION_CACHE_PATH, TARGET_ENV_BIN_PATH, TARGET_ENV_VERSIONS_PATH
-from bahub.transports.base import TransportInterface, create_backup_maker_command
+from bahub.transports.base import TransportInterface, create_backup_maker_command, CONCURRENCY_SPECIFICATION_PROPERTIES
 from bahub.transports.kubernetes import KubernetesPodFilesystem, pod_exec, ExecResult, find_pod_name, \
     wait_for_pod_to_be_ready
 from bahub.transports.sh import LocalFilesystem
@@ -61,10 +61,15 @@ class Transport(TransportInterface):
                     "type": "string",
                     "example": 120,
                     "default": 120
-                }
+                },
+                **CONCURRENCY_SPECIFICATION_PROPERTIES
             }
         }
 
+    def get_concurrency_group(self) -> str:
+        # all PODs in the same namespace
+        return 'kubernetes:' + self._namespace
+
     @property
     def v1_core_api(self) -> client.CoreV1Api:
         if not hasattr(self, '_v1_core_api'):
@@ -142,22 +147,26 @@ class Transport(TransportInterface):
         """
 
         pod_fs = KubernetesPodFilesystem(pod_name, self._namespace, self.io())
-        copy_encryption_keys_from_controller_to_target_env(
-            src_fs=LocalFilesystem(),
-            pub_key_path=definition.encryption().get_public_key_path(),
-            private_key_path=definition.encryption().get_private_key_path(),
-            dst_fs=pod_fs,
-            io=self.io()
-        )
-        copy_required_tools_from_controller_cache_to_target_env(
-            local_cache_fs=LocalFilesystem(),
-            dst_fs=pod_fs,
-            io=self.io(),
-            bin_path=TARGET_ENV_BIN_PATH,
-            versions_path=TARGET_ENV_VERSIONS_PATH,
-            local_versions_path=BIN_VERSION_CACHE_PATH,
-            binaries=self._binaries
-        )
+
+        with TargetEnvironmentLocks.lock(f'kubernetes:{self._namespace}/{pod_name}'), pod_fs.batch() as batch:
+            copy_encryption_keys_from_controller_to_target_env(
+                src_fs=LocalFilesystem(),
+                pub_key_path=definition.encryption().get_public_key_path(),
+                private_key_path=definition.encryption().get_private_key_path(),
+                dst_fs=pod_fs,
+                io=self.io(),
+                batch=batch
+            )
+            copy_required_tools_from_controller_cache_to_target_env(
+                local_cache_fs=LocalFilesystem(),
+                dst_fs=pod_fs,
+                io=self.io(),
+                bin_path=TARGET_ENV_BIN_PATH,
+                versions_path=TARGET_ENV_VERSIONS_PATH,
+                local_versions_path=BIN_VERSION_CACHE_PATH,
+                binaries=self._binaries,
+                batch=batch
+            )
 
     def watch(self) -> bool:
         """
@@ -167,6 +176,12 @@ class Transport(TransportInterface):
         self._process.watch(self.io().debug)
         return self._process.has_exited_with_success()
 
+    def get_transferred_bytes(self) -> Optional[int]:
+        if not hasattr(self, "_process"):
+            return None
+
+        return self._process.get_transferred_bytes()
+
     def get_required_binaries(self):
         return []
 
@@ -13,6 +13,7 @@ from kubernetes.client import V1Pod, V1ObjectMeta, V1OwnerReference
 from rkd.api.inputoutput import IO
 
 from .kubernetes import wait_for_pod_to_be_ready, scale_resource, create_pod
+from .base import CONCURRENCY_SPECIFICATION_PROPERTIES
 from .kubernetes_podexec import Transport as KubernetesPodExecTransport
 
 
@@ -87,6 +88,7 @@ class Transport(KubernetesPodExecTransport):
                     "example": "-backup",
                     "description": "Suffix for name of a backup POD (original pod name + suffix)"
                 },
+                **CONCURRENCY_SPECIFICATION_PROPERTIES
             }
         }
 
@@ -4,24 +4,42 @@ Shell Transport
 
 Executes a command in the shell
 """
+import errno
+import hashlib
 import os
 import shutil
 import subprocess
 import sys
 from tempfile import TemporaryDirectory
-from typing import List
+from typing import List, Optional
+from uuid import uuid4
 
 from rkd.api.inputoutput import IO
 
-from .base import TransportInterface, create_backup_maker_command
-from ..bin import RequiredBinary, download_required_tools, copy_required_tools_from_controller_cache_to_target_env
+from .base import TransportInterface, create_backup_maker_command, BUFFERING_SPECIFICATION_PROPERTIES, \
+    CONCURRENCY_SPECIFICATION_PROPERTIES
+from ..bin import RequiredBinary, download_required_tools, copy_required_tools_from_controller_cache_to_target_env, \
+    TargetEnvironmentLocks
+from ..exception import DownloadError
 from ..fs import FilesystemInterface
 from ..inputoutput import StreamableBuffer
 from ..model import BackupDefinition
+from ..security import RedactingWriter
+from ..settings import BIN_VERSION_CACHE_PATH
 
 
 class LocalFilesystem(FilesystemInterface):
+    """
+    Local filesystem
+
+    Downloads are written into a ".part" file next to the destination, then renamed - a destination file never
+    contains a partially downloaded content. Interrupted download is resumed from the ".part" file using HTTP Range
+    """
+
     io: IO
+    download_attempts: int = 3
+    download_timeout: int = 60
+    chunk_size: int = 1024 * 64
 
     def force_mkdir(self, path: str):
         try:
@@ -29,14 +47,93 @@ class LocalFilesystem(FilesystemInterface):
         except FileExistsError:
             pass
 
-    def download(self, url: str, destination_path: str):
-        subprocess.check_call(["curl", "-s", "-L", "--output", destination_path, url])
+    def download(self, url: str, destination_path: str, sha256: str = ''):
+        # imported there to not slow down the startup of the application
+        from urllib.error import URLError
+        from http.client import HTTPException
+
+        part_path = destination_path + ".part"
+        last_error = None
+
+        for attempt in range(0, self.download_attempts):
+            try:
+                self._download_part(url, part_path)
+                last_error = None
+                break
+
+            except (URLError, HTTPException, OSError) as e:
+                last_error = e
+
+        if last_error is not None:
+            raise DownloadError.from_failed_attempts(url, self.download_attempts, last_error)
+
+        if sha256:
+            actual = self.checksum(part_path)
+
+            if actual != sha256.lower():
+                os.unlink(part_path)
+                raise DownloadError.from_checksum_mismatch(url, sha256, actual)
+
+        os.replace(part_path, destination_path)
+
+    def _download_part(self, url: str, part_path: str):
+        from urllib.error import HTTPError
+        from urllib.request import Request, urlopen
+
+        offset = os.path.getsize(part_path) if os.path.isfile(part_path) else 0
+        request = Request(url, headers={'Range': f'bytes={offset}-'} if offset else {})
+
+        try:
+            response = urlopen(request, timeout=self.download_timeout)
+
+        except HTTPError as e:
+            # already downloaded ".part" is not valid for the server, start from the beginning
+            if e.code == 416 and offset:
+                os.unlink(part_path)
+
+            raise
+
+        with response:
+            # server could ignore "Range" header and send whole file
+            resumed = offset and response.status == 206
+            length = response.headers.get('Content-Length')
+
+            with open(part_path, 'ab' if resumed else 'wb') as f:
+                shutil.copyfileobj(response, f, self.chunk_size)
+                written = f.tell()
+
+        if length is not None and written != int(length) + (offset if resumed else 0):
+            raise OSError(f"Connection closed after {written} bytes of '{url}'")
+
+    def checksum(self, path: str) -> str:
+        digest = hashlib.sha256()
+
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(self.chunk_size), b''):
+                digest.update(chunk)
+
+        return digest.hexdigest()
+
+    def read_file(self, path: str) -> str:
+        try:
+            with open(path, 'r') as f:
+                return f.read()
+
+        except FileNotFoundError:
+            return ''
 
     def delete_file(self, path: str):
-        os.unlink(path)
+        try:
+            os.unlink(path)
+
+        except FileNotFoundError:
+            pass
 
     def link(self, src: str, dst: str):
-        os.link(src, dst)
+        # replaced atomically - other process can link the same file at the same time
+        tmp_path = '{}.{}.link'.format(dst, uuid4().hex)
+        os.link(src, tmp_path)
+        os.replace(tmp_path, dst)
 
     def make_executable(self, path: str):
         subprocess.check_call(["chmod", "+x", path])
@@ -48,7 +145,8 @@ class LocalFilesystem(FilesystemInterface):
         if not files_list:
             files_list = ["*", ".*"]
 
-        subprocess.check_call(["tar", "-zcf", archive_path] + files_list, cwd=src_path)
+        # versions in binaries cache are symbolic links, archive has to contain the files
+        subprocess.check_call(["tar", "--dereference", "-zcf", archive_path] + files_list, cwd=src_path)
 
     def copy_to(self, local_path: str, dst_path: str):
         shutil.copyfile(local_path, dst_path)
@@ -60,7 +158,21 @@ class LocalFilesystem(FilesystemInterface):
         return TemporaryDirectory().name
 
     def move(self, src: str, dst: str):
-        subprocess.check_call(["mv", src, dst])
+        """
+        Atomic move - across filesystems the file is copied next to the destination at first, then renamed
+        """
+
+        try:
+            os.replace(src, dst)
+
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+
+            tmp_path = dst + ".part"
+            shutil.copy2(src, tmp_path)
+            os.replace(tmp_path, dst)
+            os.unlink(src)
 
 
 class Transport(TransportInterface):
@@ -83,22 +195,24 @@ class Transport(TransportInterface):
         self.fs = LocalFilesystem()
 
     def prepare_environment(self, binaries: List[RequiredBinary]) -> None:
-        copy_required_tools_from_controller_cache_to_target_env(
-            local_cache_fs=LocalFilesystem(),
-            dst_fs=self.fs,
-            io=self.io(),
-            bin_path=self.bin_path,
-            versions_path=self.versions_path,
-            local_versions_path=os.path.expanduser("~/.backup-controller/versions"),
-            binaries=binaries
-        )
+        with TargetEnvironmentLocks.lock('sh:' + self.bin_path):
+            copy_required_tools_from_controller_cache_to_target_env(
+                local_cache_fs=LocalFilesystem(),
+                dst_fs=self.fs,
+                io=self.io(),
+                bin_path=self.bin_path,
+                versions_path=self.versions_path,
+                local_versions_path=BIN_VERSION_CACHE_PATH,
+                binaries=binaries
+            )
 
     def schedule(self, command: str, definition: BackupDefinition, is_backup: bool, version: str = "") -> None:
         try:
             self.handle = self._exec_command(
                 create_backup_maker_command(command, definition, is_backup, version), env={
                     "PATH": os.getenv("PATH") + ":" + self.bin_path
-                }
+                },
+                binary=True
             )
         except FileNotFoundError as exc:
             self.error = exc
@@ -108,11 +222,25 @@ class Transport(TransportInterface):
             self.io().error(str(self.error))
             return False
 
-        self.handle.copy_to(sys.stderr)
+        # a secret could be split between two chunks - a redacting writer keeps the tail until the next chunk
+        if self._redactor.get_words():
+            writer = RedactingWriter(sys.stderr, self._redactor)
+            self.handle.copy_to(writer)
+            writer.flush()
+        else:
+            self.handle.copy_to(sys.stderr)
+
         self.handle.close()
+        self.io().debug('Transfer finished: {}'.format(self.handle.stats()))
 
         return self.handle.finished_with_success()
 
+    def get_transferred_bytes(self) -> Optional[int]:
+        if not hasattr(self, "handle"):
+            return None
+
+        return self.handle.stats().total_bytes
+
     @staticmethod
     def get_specification_schema() -> dict:
         return {
@@ -120,6 +248,7 @@ class Transport(TransportInterface):
             "type": "object",
             "required": [],
             "properties": {
-
+                **BUFFERING_SPECIFICATION_PROPERTIES,
+                **CONCURRENCY_SPECIFICATION_PROPERTIES
             }
         }
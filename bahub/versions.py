@@ -1,3 +1,7 @@
 BACKUP_MAKER_BIN_VERSION = "0.0.4"
 POSTGRES_HELPER_BIN_VERSION = "0.0.1"
 TRACEXIT_BIN_VERSION = "1.1.0"
+
+# sha256 digests of released artifacts (file name -> digest), verified after download.
+# Artifacts that are not listed are verified with the checksums file published in the same release, when it exists
+BIN_CHECKSUMS = {}
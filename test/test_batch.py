@@ -0,0 +1,82 @@
+from threading import Lock
+from time import sleep
+from rkd.api.inputoutput import IO
+from rkd.api.testing import BasicTestingCase
+from bahub.batch import resolve_definition_names, run_batch, format_summary, ConcurrencyLimiter, DefinitionResult
+from bahub.exception import ConfigurationError
+from bahub.transports.sh import Transport
+
+
+class TestResolveDefinitionNames(BasicTestingCase):
+    def test_resolves_names_globs_and_all(self):
+        available = ['fs', 'db_mysql', 'db_postgres', 'www']
+
+        self.assertEqual(['fs'], resolve_definition_names(['fs'], available))
+        self.assertEqual(['db_mysql', 'db_postgres', 'fs'], resolve_definition_names(['db_*', 'fs', 'db_mysql'],
+                                                                                     available))
+        self.assertEqual(available, resolve_definition_names(['all'], available))
+
+    def test_raises_error_when_nothing_matches(self):
+        with self.assertRaises(ConfigurationError):
+            resolve_definition_names(['fs', 'mongo_*'], ['fs'])
+
+
+class TestRunBatch(BasicTestingCase):
+    def test_concurrency_is_limited_per_transport_group(self):
+        limited = Transport({'max_concurrency': 2}, IO())
+        limiter = ConcurrencyLimiter()
+        limiter.configure([limited, limited.clone()])
+
+        lock = Lock()
+        state = {'running': 0, 'max_running': 0}
+
+        def run(name: str) -> DefinitionResult:
+            with lock:
+                state['running'] += 1
+                state['max_running'] = max(state['max_running'], state['running'])
+
+            sleep(0.05)
+
+            with lock:
+                state['running'] -= 1
+
+            return DefinitionResult(definition_name=name, success=True, elapsed=0.05)
+
+        names = ['def_{}'.format(i) for i in range(0, 8)]
+        results = run_batch(names, run, workers=6, limiter=limiter, get_transport=lambda name: limited)
+
+        self.assertEqual(2, state['max_running'])
+        self.assertEqual(names, [result.definition_name for result in results])
+
+    def test_failure_of_one_definition_does_not_stop_others(self):
+        def run(name: str) -> DefinitionResult:
+            if name == 'broken':
+                raise Exception('Cannot connect to Docker daemon')
+
+            return DefinitionResult(definition_name=name, success=True, elapsed=1.0)
+
+        results = run_batch(['fs', 'broken', 'www'], run, workers=2, limiter=ConcurrencyLimiter(),
+                            get_transport=lambda name: Transport({}, IO()))
+
+        self.assertEqual([True, False, True], [result.success for result in results])
+        self.assertEqual('Cannot connect to Docker daemon', results[1].error)
+
+    def test_format_summary(self):
+        summary = format_summary([
+            DefinitionResult(definition_name='fs', success=True, elapsed=12.34, transferred_bytes=3 * 1024 * 1024),
+            DefinitionResult(definition_name='db_mysql', success=False, elapsed=1.0, error='Process failed')
+        ])
+
+        self.assertIn('fs         | OK     | 12.3s | 3.00 MB |', summary)
+        self.assertIn('db_mysql   | FAILED | 1.0s  | -       | Process failed', summary)
+        self.assertIn('1 of 2 definitions succeeded', summary)
+
+
+class TestTransportClone(BasicTestingCase):
+    def test_clone_creates_separate_instance_with_same_configuration(self):
+        transport = Transport({'max_concurrency': 3}, IO())
+        cloned = transport.clone()
+
+        self.assertIsNot(transport, cloned)
+        self.assertEqual(3, cloned.get_concurrency_limit())
+        self.assertEqual(transport.get_concurrency_group(), cloned.get_concurrency_group())
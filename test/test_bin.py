@@ -1,11 +1,22 @@
-from typing import Union
+import hashlib
+import io as _io
+import json
+import os
+import tarfile
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from tempfile import TemporaryDirectory
+from threading import Thread
+from typing import Union, Dict, List
 
 from rkd.api.inputoutput import BufferedSystemIO
 from rkd.api.testing import BasicTestingCase
 from bahub.bin import RequiredBinary, RequiredBinaryFromGithubRelease, RequiredBinaryFromGithubReleasePackedInArchive, \
     download_required_tools, copy_encryption_keys_from_controller_to_target_env, \
-    copy_required_tools_from_controller_cache_to_target_env
-from bahub.fs import FilesystemInterface
+    copy_required_tools_from_controller_cache_to_target_env, create_tools_manifest, get_backup_maker_binaries, \
+    parse_checksums
+from bahub.exception import DownloadError
+from bahub.fs import FilesystemInterface, FilesystemOperationsBatch
+from bahub.transports.sh import LocalFilesystem
 
 
 class TestRequiredBinary(BasicTestingCase):
@@ -24,6 +35,26 @@ class TestRequiredBinary(BasicTestingCase):
         self.assertEqual("kubectl", RequiredBinary("https://example.org/releases/kubectl").get_filename())
 
 
+class TestBackupMakerBinaries(BasicTestingCase):
+    def test_each_binary_is_verified_after_download(self):
+        """
+        Each binary has a pinned digest or a checksums file published in the release
+        """
+
+        for binary in get_backup_maker_binaries():
+            with self.subTest(binary.get_filename()):
+                self.assertTrue(binary.get_sha256() or binary.get_checksums_url())
+
+        self.assertEqual(
+            'https://github.com/riotkit-org/tracexit/releases/download/1.1.0/tracexit_1.1.0_checksums.txt',
+            get_backup_maker_binaries()[1].get_checksums_url()
+        )
+
+    def test_parse_checksums(self):
+        self.assertEqual({'a.tar.gz': 'abc', 'b.tar.gz': 'def'},
+                         parse_checksums('abc  a.tar.gz\nDEF *b.tar.gz\n\n'))
+
+
 class TestRequiredBinaryFromGithubRelease(BasicTestingCase):
     def test_get_url(self):
         binary = RequiredBinaryFromGithubRelease("riotkit-org/tracexit", "1.0.0", "tracexit")
@@ -57,6 +88,9 @@ class FSMock(object):
     def __getattr__(self, item):
         return lambda *args, **kwargs: self.callstack.append([item, args, kwargs])
 
+    def batch(self):
+        return FilesystemOperationsBatch(self)
+
 
 class TestDownloadRequiredTools(BasicTestingCase):
     """
@@ -97,16 +131,16 @@ class TestDownloadRequiredTools(BasicTestingCase):
         self.assertIn(['force_mkdir', ('/opt/bin',), {}], fs.callstack)
         self.assertIn(['force_mkdir', ('/opt/bin/.versions',), {}], fs.callstack)
 
-        # binary is downloaded into temporary directory
+        # archive is downloaded next to versions, so the download can be resumed
         self.assertIn(
             ['download', ('https://github.com/riotkit-org/tracexit/releases/download/1.0.0/tracexit-1.0.0-amd64.tar.gz',
-                          '/tmp/test/archive.tar.gz'), {}],
+                          '/opt/bin/.versions/.v1.0.0-tracexit.tar.gz'), {'sha256': ''}],
             fs.callstack
         )
 
-        # archive is unpacked
+        # archive is unpacked into temporary directory
         self.assertIn(
-            ['unpack', ('/tmp/test/archive.tar.gz', '/tmp/test'), {}],
+            ['unpack', ('/opt/bin/.versions/.v1.0.0-tracexit.tar.gz', '/tmp/test'), {}],
             fs.callstack
         )
 
@@ -122,6 +156,9 @@ class TestDownloadRequiredTools(BasicTestingCase):
             fs.callstack
         )
 
+        # archive is not kept after unpacking
+        self.assertIn(['delete_file', ('/opt/bin/.versions/.v1.0.0-tracexit.tar.gz',), {}], fs.callstack)
+
     def test_file_is_not_downloaded_twice(self):
         io = BufferedSystemIO()
         io.set_log_level("debug")
@@ -176,6 +213,224 @@ class TestDownloadRequiredTools(BasicTestingCase):
         self.assertNotIn("unpack", str(fs.callstack))
 
 
+class ArtifactsServer(object):
+    """
+    Local HTTP stand-in for a releases server. Supports "Range" header (unless disabled), records requests
+    """
+
+    files: Dict[str, bytes]
+    requests: List[dict]
+    support_range: bool
+
+    def __init__(self, files: Dict[str, bytes], support_range: bool = True):
+        self.files = files
+        self.requests = []
+        self.support_range = support_range
+
+    def __enter__(self) -> 'ArtifactsServer':
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.requests.append({'path': self.path, 'range': self.headers.get('Range')})
+
+                if self.path not in server.files:
+                    self.send_error(404)
+                    return
+
+                content = server.files[self.path]
+                requested_range = self.headers.get('Range')
+
+                if requested_range and server.support_range:
+                    offset = int(requested_range[len('bytes='):].rstrip('-'))
+
+                    if offset >= len(content):
+                        self.send_error(416)
+                        return
+
+                    self.send_response(206)
+                    self.send_header('Content-Range', f'bytes {offset}-{len(content) - 1}/{len(content)}')
+                    content = content[offset:]
+                else:
+                    self.send_response(200)
+
+                self.send_header('Content-Length', str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def log_message(self, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        Thread(target=self._httpd.serve_forever, daemon=True).start()
+
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def url(self, path: str) -> str:
+        return f'http://127.0.0.1:{self._httpd.server_address[1]}{path}'
+
+
+def create_tar_gz(filename: str, content: bytes) -> bytes:
+    buffer = _io.BytesIO()
+
+    with tarfile.open(fileobj=buffer, mode='w:gz') as archive:
+        info = tarfile.TarInfo(filename)
+        info.size = len(content)
+        archive.addfile(info, _io.BytesIO(content))
+
+    return buffer.getvalue()
+
+
+def sha256(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()
+
+
+class TestDownloadRequiredToolsFromHttpServer(BasicTestingCase):
+    """
+    Functional test of download_required_tools() with LocalFilesystem against a local HTTP server
+    """
+
+    def test_binaries_are_downloaded_in_parallel_and_verified(self):
+        archive = create_tar_gz('tracexit', b'#!/bin/sh\necho tracexit\n')
+        binary = b'#!/bin/sh\necho helper\n' * 1000
+
+        with ArtifactsServer({'/tracexit.tar.gz': archive, '/helper': binary}) as server, \
+                TemporaryDirectory() as cache_dir:
+
+            versions_path = cache_dir + '/bin/versions'
+            packed = RequiredBinaryFromGithubReleasePackedInArchive('riotkit-org/tracexit', '1.1.0', 'tracexit',
+                                                                    'tracexit.tar.gz', sha256=sha256(archive))
+            packed.url = server.url('/tracexit.tar.gz')
+
+            download_required_tools(
+                fs=LocalFilesystem(), io=BufferedSystemIO(), bin_path=cache_dir + '/bin',
+                versions_path=versions_path, workers=2,
+                binaries=[packed, RequiredBinary(server.url('/helper'), sha256=sha256(binary))]
+            )
+
+            with open(versions_path + '/vunknown-helper', 'rb') as f:
+                self.assertEqual(binary, f.read())
+
+            self.assertTrue(os.access(versions_path + '/vunknown-helper', os.X_OK))
+            self.assertTrue(os.access(versions_path + '/v1.1.0-tracexit', os.X_OK))
+
+            # no leftovers - archives and partial downloads are removed
+            self.assertEqual(['v1.1.0-tracexit', 'vunknown-helper'], sorted(os.listdir(versions_path)))
+
+    def test_checksum_mismatch_does_not_leave_file_in_cache(self):
+        with ArtifactsServer({'/helper': b'tampered content'}) as server, TemporaryDirectory() as cache_dir:
+            versions_path = cache_dir + '/bin/versions'
+
+            with self.assertRaises(DownloadError) as exc:
+                download_required_tools(
+                    fs=LocalFilesystem(), io=BufferedSystemIO(), bin_path=cache_dir + '/bin',
+                    versions_path=versions_path,
+                    binaries=[RequiredBinary(server.url('/helper'), sha256=sha256(b'original content'))]
+                )
+
+            self.assertIn('does not match', str(exc.exception))
+            self.assertEqual([], os.listdir(versions_path))
+
+    def test_interrupted_download_is_resumed(self):
+        content = os.urandom(1024 * 256)
+
+        with ArtifactsServer({'/helper': content}) as server, TemporaryDirectory() as cache_dir:
+            destination = cache_dir + '/helper'
+
+            # previous download was interrupted after 100 KB
+            with open(destination + '.part', 'wb') as f:
+                f.write(content[0:1024 * 100])
+
+            LocalFilesystem().download(server.url('/helper'), destination, sha256=sha256(content))
+
+            with open(destination, 'rb') as f:
+                self.assertEqual(content, f.read())
+
+            self.assertEqual([{'path': '/helper', 'range': 'bytes=102400-'}], server.requests)
+            self.assertFalse(os.path.exists(destination + '.part'))
+
+    def test_download_starts_from_beginning_when_server_does_not_support_range(self):
+        content = os.urandom(1024 * 64)
+
+        with ArtifactsServer({'/helper': content}, support_range=False) as server, TemporaryDirectory() as cache_dir:
+            destination = cache_dir + '/helper'
+
+            with open(destination + '.part', 'wb') as f:
+                f.write(content[0:1024])
+
+            LocalFilesystem().download(server.url('/helper'), destination, sha256=sha256(content))
+
+            with open(destination, 'rb') as f:
+                self.assertEqual(content, f.read())
+
+    def test_archive_is_verified_with_checksums_file_of_the_release(self):
+        archive = create_tar_gz('tracexit', b'#!/bin/sh\necho tracexit\n')
+        checksums = f'{sha256(b"other")}  tracexit_1.1.0_darwin_amd64.tar.gz\n' \
+                    f'{sha256(archive)}  tracexit_1.1.0_linux_amd64.tar.gz\n'.encode('utf-8')
+
+        for served_archive, expected_error in [(archive, None), (b'tampered', 'does not match')]:
+            with ArtifactsServer({'/tracexit_1.1.0_linux_amd64.tar.gz': served_archive,
+                                  '/checksums.txt': checksums}) as server, TemporaryDirectory() as cache_dir:
+
+                binary = RequiredBinaryFromGithubReleasePackedInArchive('riotkit-org/tracexit', '1.1.0', 'tracexit',
+                                                                        'tracexit_1.1.0_linux_amd64.tar.gz')
+                binary.url = server.url('/tracexit_1.1.0_linux_amd64.tar.gz')
+                binary.checksums_url = server.url('/checksums.txt')
+
+                with self.subTest(expected_error):
+                    try:
+                        download_required_tools(fs=LocalFilesystem(), io=BufferedSystemIO(),
+                                                bin_path=cache_dir + '/bin', versions_path=cache_dir + '/bin/versions',
+                                                binaries=[binary])
+                        error = None
+
+                    except DownloadError as e:
+                        error = str(e)
+
+                    if expected_error:
+                        self.assertIn(expected_error, error)
+                    else:
+                        self.assertIsNone(error)
+                        self.assertEqual(['v1.1.0-tracexit'], os.listdir(cache_dir + '/bin/versions'))
+
+    def test_archive_not_listed_in_checksums_file_is_not_downloaded(self):
+        with ArtifactsServer({'/checksums.txt': b''}) as server, TemporaryDirectory() as cache_dir:
+            binary = RequiredBinary(server.url('/helper'), checksums_url=server.url('/checksums.txt'))
+
+            with self.assertRaises(DownloadError) as exc:
+                download_required_tools(fs=LocalFilesystem(), io=BufferedSystemIO(), bin_path=cache_dir + '/bin',
+                                        versions_path=cache_dir + '/bin/versions', binaries=[binary])
+
+            self.assertIn("No sha256 digest of 'helper'", str(exc.exception))
+            self.assertEqual(['/checksums.txt'], [request['path'] for request in server.requests])
+
+    def test_missing_checksums_file_does_not_prevent_download(self):
+        """
+        The checksums file is optional - a release that does not publish it is downloaded without verification
+        """
+
+        with ArtifactsServer({'/helper': b'#!/bin/sh\n'}) as server, TemporaryDirectory() as cache_dir:
+            binary = RequiredBinary(server.url('/helper'), checksums_url=server.url('/checksums.txt'))
+            io = BufferedSystemIO()
+
+            download_required_tools(fs=LocalFilesystem(), io=io, bin_path=cache_dir + '/bin',
+                                    versions_path=cache_dir + '/bin/versions', binaries=[binary])
+
+            self.assertIn('Cannot download checksums file', io.get_value())
+            self.assertEqual(['vunknown-helper'], os.listdir(cache_dir + '/bin/versions'))
+
+    def test_failed_download_is_reported(self):
+        with ArtifactsServer({}) as server, TemporaryDirectory() as cache_dir:
+            with self.assertRaises(DownloadError) as exc:
+                LocalFilesystem().download(server.url('/not-existing'), cache_dir + '/helper')
+
+            self.assertIn('after 3 attempts', str(exc.exception))
+
+
 class TestEncryptionKeysCopying(BasicTestingCase):
     """
     Covers copy_encryption_keys_from_controller_to_target_env()
@@ -263,10 +518,10 @@ class TestToolsTransferFromLocalCacheToTargetFilesystem(BasicTestingCase):
 
         # versions are unpacked at target filesystem
         self.assertIn("copy_to", str(dst_fs.callstack))
-        self.assertIn(
-            ['unpack', ('/tmp/.backup-tools.tar.gz', '/opt/bin/.versions'), {}],
-            dst_fs.callstack
-        )
+        unpack = [call for call in dst_fs.callstack if call[0] == 'unpack'][0]
+        self.assertRegex(unpack[1][0], r'^/tmp/\.backup-tools\.[0-9a-f]{32}\.tar\.gz$')
+        self.assertEqual('/opt/bin/.versions', unpack[1][1])
+        self.assertIn(['delete_file', (unpack[1][0],), {}], dst_fs.callstack)
 
         # files are linked
         self.assertIn(
@@ -277,3 +532,128 @@ class TestToolsTransferFromLocalCacheToTargetFilesystem(BasicTestingCase):
             ['link', ('/opt/bin/.versions/v2.1.3.7-br-backup-maker', '/opt/bin/br-backup-maker'), {}],
             dst_fs.callstack
         )
+
+    def test_nothing_is_copied_when_manifest_at_target_is_current(self):
+        """
+        Warm run: only the manifest is read from the target filesystem
+        """
+
+        local_cache_fs: Union[FilesystemInterface, FSMock] = FSMock()
+        local_cache_fs.checksum = lambda path: 'sha256-of-' + os.path.basename(path)
+        dst_fs: Union[FilesystemInterface, FSMock] = FSMock()
+        dst_fs.read_file = lambda path: json.dumps(create_tools_manifest('/opt/bin', {
+            'v1.6.1-tracexit': 'sha256-of-v1.6.1-tracexit'
+        }))
+        io = BufferedSystemIO()
+
+        copy_required_tools_from_controller_cache_to_target_env(
+            local_cache_fs=local_cache_fs, dst_fs=dst_fs, bin_path="/opt/bin", versions_path="/opt/bin/.versions",
+            local_versions_path="/tmp/.versions",
+            binaries=[RequiredBinaryFromGithubRelease("riotkit-org/tracexit", "1.6.1", "tracexit")],
+            io=io
+        )
+
+        self.assertEqual([], dst_fs.callstack)
+        self.assertIn("All binaries are up-to-date", io.get_value())
+
+    def test_only_changed_binaries_are_copied_and_manifest_is_updated(self):
+        local_cache_fs: Union[FilesystemInterface, FSMock] = FSMock()
+        local_cache_fs.checksum = lambda path: 'sha256-of-' + os.path.basename(path)
+        dst_fs: Union[FilesystemInterface, FSMock] = FSMock()
+        dst_fs.read_file = lambda path: json.dumps(create_tools_manifest('/opt/bin', {
+            'v1.6.1-tracexit': 'sha256-of-v1.6.1-tracexit',
+            'v1.0.0-br-backup-maker': 'sha256-of-v1.0.0-br-backup-maker'
+        }))
+
+        copy_required_tools_from_controller_cache_to_target_env(
+            local_cache_fs=local_cache_fs, dst_fs=dst_fs, bin_path="/opt/bin", versions_path="/opt/bin/.versions",
+            local_versions_path="/tmp/.versions",
+            binaries=[
+                RequiredBinaryFromGithubRelease("riotkit-org/tracexit", "1.6.1", "tracexit"),
+                RequiredBinaryFromGithubRelease("riotkit-org/br-backup-maker", "2.0.0", "br-backup-maker")
+            ],
+            io=BufferedSystemIO()
+        )
+
+        # only the new version is packed
+        self.assertIn("['v2.0.0-br-backup-maker']", str(local_cache_fs.callstack))
+
+        # manifest is put in place as the last step
+        self.assertEqual('move', dst_fs.callstack[-1][0])
+        self.assertRegex(dst_fs.callstack[-1][1][0], r'^/tmp/\.backup-tools-manifest\.[0-9a-f]{32}\.json$')
+        self.assertEqual('/opt/bin/.versions/.manifest.json', dst_fs.callstack[-1][1][1])
+
+    def test_definitions_with_different_binaries_do_not_invalidate_each_other(self):
+        with TemporaryDirectory() as local_dir, TemporaryDirectory() as target_dir:
+            os.mkdir(local_dir + '/versions')
+
+            for name in ['v1.6.1-tracexit', 'v1.0.0-pg-helper']:
+                with open(local_dir + '/versions/' + name, 'wb') as f:
+                    f.write(b'#!/bin/sh\n# ' + name.encode('utf-8'))
+
+            first = [RequiredBinaryFromGithubRelease("riotkit-org/tracexit", "1.6.1", "tracexit")]
+            second = first + [RequiredBinaryFromGithubRelease("riotkit-org/pg-helper", "1.0.0", "pg-helper")]
+            outputs = []
+
+            for binaries in [first, second, first, second]:
+                io = BufferedSystemIO()
+                outputs.append(io)
+
+                copy_required_tools_from_controller_cache_to_target_env(
+                    local_cache_fs=LocalFilesystem(), dst_fs=LocalFilesystem(), bin_path=target_dir + '/bin',
+                    versions_path=target_dir + '/bin/versions', local_versions_path=local_dir + '/versions',
+                    binaries=binaries, io=io
+                )
+
+            self.assertIn("Missing binaries: ['v1.0.0-pg-helper']", outputs[1].get_value())
+            self.assertIn("All binaries are up-to-date", outputs[2].get_value())
+            self.assertIn("All binaries are up-to-date", outputs[3].get_value())
+
+            with open(target_dir + '/bin/versions/.manifest.json') as f:
+                self.assertEqual(['v1.0.0-pg-helper', 'v1.6.1-tracexit'], sorted(json.load(f)['binaries'].keys()))
+
+    def test_local_digest_is_taken_from_binaries_cache_blob_name(self):
+        with TemporaryDirectory() as local_dir, TemporaryDirectory() as target_dir:
+            os.mkdir(local_dir + '/versions')
+            os.mkdir(local_dir + '/blobs')
+            digest = sha256(b'#!/bin/sh\n')
+
+            with open(local_dir + '/blobs/' + digest, 'wb') as f:
+                f.write(b'#!/bin/sh\n')
+
+            os.symlink('../blobs/' + digest, local_dir + '/versions/v1.6.1-tracexit')
+
+            local_cache_fs = LocalFilesystem()
+            local_cache_fs.checksum = None  # not called
+
+            copy_required_tools_from_controller_cache_to_target_env(
+                local_cache_fs=local_cache_fs, dst_fs=LocalFilesystem(), bin_path=target_dir + '/bin',
+                versions_path=target_dir + '/bin/versions', local_versions_path=local_dir + '/versions',
+                binaries=[RequiredBinaryFromGithubRelease("riotkit-org/tracexit", "1.6.1", "tracexit")],
+                io=BufferedSystemIO()
+            )
+
+            with open(target_dir + '/bin/versions/.manifest.json') as f:
+                self.assertEqual({'v1.6.1-tracexit': digest}, json.load(f)['binaries'])
+
+    def test_second_run_on_local_filesystem_does_not_copy_anything(self):
+        with TemporaryDirectory() as local_dir, TemporaryDirectory() as target_dir:
+            os.mkdir(local_dir + '/versions')
+
+            with open(local_dir + '/versions/v1.6.1-tracexit', 'wb') as f:
+                f.write(b'#!/bin/sh\n')
+
+            binaries = [RequiredBinaryFromGithubRelease("riotkit-org/tracexit", "1.6.1", "tracexit")]
+
+            for run in range(0, 2):
+                io = BufferedSystemIO()
+
+                copy_required_tools_from_controller_cache_to_target_env(
+                    local_cache_fs=LocalFilesystem(), dst_fs=LocalFilesystem(), bin_path=target_dir + '/bin',
+                    versions_path=target_dir + '/bin/versions', local_versions_path=local_dir + '/versions',
+                    binaries=binaries, io=io
+                )
+
+            self.assertIn("All binaries are up-to-date", io.get_value())
+            self.assertTrue(os.access(target_dir + '/bin/tracexit', os.X_OK))
+
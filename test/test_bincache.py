@@ -0,0 +1,81 @@
+import os
+from tempfile import TemporaryDirectory
+from rkd.api.testing import BasicTestingCase
+from bahub.bincache import BinariesCache, parse_size
+
+
+def create_version(versions_path: str, name: str, content: bytes):
+    os.makedirs(versions_path, exist_ok=True)
+
+    with open(versions_path + '/' + name, 'wb') as f:
+        f.write(content)
+
+
+class TestBinariesCache(BasicTestingCase):
+    def test_versions_with_same_content_share_one_blob(self):
+        with TemporaryDirectory() as cache_dir:
+            cache = BinariesCache(cache_dir + '/versions', cache_dir + '/blobs')
+            create_version(cache_dir + '/versions', 'v1.0.0-tracexit', b'tracexit')
+            create_version(cache_dir + '/versions', 'v1.0.1-tracexit', b'tracexit')
+
+            first = cache.store('v1.0.0-tracexit')
+            second = cache.store('v1.0.1-tracexit')
+
+            self.assertEqual(first, second)
+            self.assertEqual([first], os.listdir(cache_dir + '/blobs'))
+
+            # versions are still readable at the same paths
+            with open(cache_dir + '/versions/v1.0.1-tracexit', 'rb') as f:
+                self.assertEqual(b'tracexit', f.read())
+
+            stats = cache.stats()
+            self.assertEqual((2, 1, 8, 8), (stats.versions, stats.blobs, stats.size, stats.deduplicated_size))
+
+    def test_store_is_idempotent_and_ignores_missing_versions(self):
+        with TemporaryDirectory() as cache_dir:
+            cache = BinariesCache(cache_dir + '/versions', cache_dir + '/blobs')
+            create_version(cache_dir + '/versions', 'v1.0.0-tracexit', b'tracexit')
+
+            self.assertEqual(cache.store('v1.0.0-tracexit'), cache.store('v1.0.0-tracexit'))
+            self.assertIsNone(cache.store('v2.0.0-tracexit'))
+
+    def test_least_recently_used_versions_are_removed_over_the_limit(self):
+        with TemporaryDirectory() as cache_dir:
+            versions_path = cache_dir + '/versions'
+            cache = BinariesCache(versions_path, cache_dir + '/blobs')
+
+            for num, name in enumerate(['v1-maker', 'v2-maker', 'v3-maker', 'v1-tracexit']):
+                create_version(versions_path, name, name.encode('utf-8') * 100)
+                cache.store(name)
+                os.utime(versions_path + '/' + name, (1000 + num, 1000 + num), follow_symlinks=False)
+
+            # v1-maker is the least recently used, but it is required by current run
+            collected = cache.collect_garbage(max_size=2000, keep=['v1-maker'])
+
+            self.assertEqual(['v2-maker', 'v3-maker'], collected.removed_versions)
+            self.assertEqual(1600, collected.freed_size)
+            self.assertEqual(['v1-maker', 'v1-tracexit'], sorted(os.listdir(versions_path)))
+            self.assertEqual(2, len(os.listdir(cache_dir + '/blobs')))
+
+    def test_broken_versions_are_removed(self):
+        with TemporaryDirectory() as cache_dir:
+            versions_path = cache_dir + '/versions'
+            cache = BinariesCache(versions_path, cache_dir + '/blobs')
+            create_version(versions_path, 'v1-maker', b'maker')
+            digest = cache.store('v1-maker')
+
+            os.unlink(cache_dir + '/blobs/' + digest)
+            collected = cache.collect_garbage(max_size=1024)
+
+            self.assertEqual(['v1-maker'], collected.removed_versions)
+            self.assertEqual([], os.listdir(versions_path))
+
+
+class TestParseSize(BasicTestingCase):
+    def test_parse_size(self):
+        self.assertEqual(1024, parse_size('1024'))
+        self.assertEqual(512 * 1024 * 1024, parse_size('512M'))
+        self.assertEqual(1024 ** 3, parse_size('1gb'))
+
+        with self.assertRaises(ValueError):
+            parse_size('much')
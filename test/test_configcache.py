@@ -0,0 +1,62 @@
+import os
+import shutil
+from tempfile import TemporaryDirectory
+from unittest.mock import patch
+from rkd.api.inputoutput import IO
+from rkd.api.testing import BasicTestingCase
+from rkd.yaml_parser import YamlFileLoader
+from bahub.configcache import CompiledConfigurationCache
+from bahub.configurationfactory import ConfigurationFactory
+
+TEST_DIR = os.path.dirname(os.path.realpath(__file__))
+SCHEMA_DIR = TEST_DIR + '/../bahub/internal'
+CONFIG_PATH = TEST_DIR + '/env/config_factory_test/bahub.test.conf.yaml'
+
+
+class TestCompiledConfigurationCache(BasicTestingCase):
+    def test_warm_load_skips_yaml_parsing_and_validation(self):
+        with TemporaryDirectory() as cache_dir:
+            cache = CompiledConfigurationCache(cache_dir, IO())
+            parser = YamlFileLoader([SCHEMA_DIR])
+
+            cold = cache.load(CONFIG_PATH, 'org.riotkit.bahub', parser)
+
+            with patch.object(YamlFileLoader, 'load') as load:
+                warm = cache.load(CONFIG_PATH, 'org.riotkit.bahub', parser)
+
+            load.assert_not_called()
+            self.assertEqual(cold, warm)
+
+    def test_cache_is_invalidated_when_file_changes(self):
+        with TemporaryDirectory() as cache_dir, TemporaryDirectory() as config_dir:
+            config_path = config_dir + '/config.yaml'
+            shutil.copy(CONFIG_PATH, config_path)
+
+            cache = CompiledConfigurationCache(cache_dir, IO())
+            parser = YamlFileLoader([SCHEMA_DIR])
+            cache.load(config_path, 'org.riotkit.bahub', parser)
+
+            with open(config_path, 'a') as f:
+                f.write('\nnotifiers:\n    slack:\n        type: slack\n        url: "http://localhost"\n')
+
+            changed = cache.load(config_path, 'org.riotkit.bahub', parser)
+
+            self.assertIn('notifiers', changed)
+            self.assertEqual(1, len(os.listdir(cache_dir)), msg='Expected that previous entry is replaced')
+
+    def test_secrets_from_environment_are_not_stored(self):
+        with TemporaryDirectory() as cache_dir, self.environment({'COLLECTION_ID': 'secret-collection-id'}):
+            cache = CompiledConfigurationCache(cache_dir, IO())
+            conf = ConfigurationFactory(CONFIG_PATH, debug=True, parser=YamlFileLoader([SCHEMA_DIR]), io=IO(),
+                                        cache=cache)
+
+            self.assertEqual('secret-collection-id', conf.get_definition('fs').get_collection_id())
+
+            cache_file = cache_dir + '/' + os.listdir(cache_dir)[0]
+
+            with open(cache_file) as f:
+                content = f.read()
+
+            self.assertIn('${COLLECTION_ID}', content)
+            self.assertNotIn('secret-collection-id', content)
+            self.assertEqual(0o600, os.stat(cache_file).st_mode & 0o777)
@@ -81,3 +81,47 @@ class TestConfigurationFactory(BasicTestingCase):
                                         parser=YamlFileLoader(YAML_DIR), io=IO())
 
             self.assertEqual('1111-2222-3333-4444', conf.get_definition('fs').get_collection_id())
+
+    def test_sensitive_data_redactor_is_built_once_and_covers_tokens_and_passphrases(self):
+        with self.environment({'COLLECTION_ID': 'Rudolf Rocker'}):
+            conf = ConfigurationFactory('bahub.test.conf.yaml', debug=True,
+                                        parser=YamlFileLoader(YAML_DIR), io=IO())
+
+            redactor = conf.get_sensitive_data_redactor()
+
+            self.assertIs(redactor, conf.get_sensitive_data_redactor())
+            self.assertEqual('passphrase=********', redactor.redact('passphrase=riotkit'))
+            self.assertNotIn('eyJ0eXAiOiJKV1QiLCJhbGci', redactor.redact(conf._accesses['secured'].get_token()))
+
+    def test_transports_and_definitions_are_constructed_on_first_access(self):
+        conf = ConfigurationFactory('bahub.lazy.conf.yaml', debug=False, parser=YamlFileLoader(YAML_DIR), io=IO())
+
+        self.assertEqual({}, conf._transports)
+        self.assertEqual({}, conf._backups)
+        self.assertEqual(['fs', 'db', 'broken'], conf.get_definition_names())
+
+        definition = conf.get_definition('fs')
+
+        self.assertIs(definition, conf.get_definition('fs'))
+        self.assertEqual(['local'], list(conf._transports.keys()))
+        self.assertEqual(['fs'], list(conf._backups.keys()))
+
+    def test_validate_all_constructs_everything_eagerly(self):
+        with self.assertRaisesRegex(ConfigurationFactoryException, 'transports.broken'):
+            ConfigurationFactory('bahub.lazy.conf.yaml', debug=False, parser=YamlFileLoader(YAML_DIR), io=IO(),
+                                 lazy=False)
+
+    def test_secrets_of_lazily_constructed_definition_are_added_to_redactor(self):
+        conf = ConfigurationFactory('bahub.lazy.conf.yaml', debug=False, parser=YamlFileLoader(YAML_DIR), io=IO())
+        redactor = conf.get_sensitive_data_redactor()
+
+        self.assertEqual('mutual-aid-is-a-factor-of-evolution', redactor.redact('mutual-aid-is-a-factor-of-evolution'))
+
+        conf.get_definition('db')
+
+        self.assertEqual('********', redactor.redact('mutual-aid-is-a-factor-of-evolution'))
+
+    def test_unresolved_variables_are_reported_with_yaml_path(self):
+        with self.assertRaisesRegex(ConfigurationFactoryException,
+                                    r'COLLECTION_ID \(at backups\.fs\.meta\.collection_id\)'):
+            ConfigurationFactory('bahub.test.conf.yaml', debug=True, parser=YamlFileLoader(YAML_DIR), io=IO())
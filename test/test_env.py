@@ -0,0 +1,98 @@
+import os
+from json import dumps as json_encode, loads as json_decode
+from time import perf_counter
+from rkd.api.testing import BasicTestingCase
+from bahub.env import substitute_env_variables
+
+
+def legacy_process_env_variables(content, env: dict):
+    """
+    Previous implementation: one str.replace() per environment variable on JSON-encoded configuration
+    """
+
+    content_as_str = json_encode(content)
+    env_list = list(env.items())
+    env_list.sort(key=lambda item: (-len(item[0]), item[0]))
+
+    for env_item in env_list:
+        content_as_str = content_as_str.replace('${' + env_item[0] + '}', env_item[1])
+
+    return json_decode(content_as_str)
+
+
+class TestSubstituteEnvVariables(BasicTestingCase):
+    def test_variables_are_substituted_in_nested_structure(self):
+        content = {
+            'backups': {
+                'fs': {
+                    'meta': {'collection_id': '${COLLECTION_ID}', 'retries': 3, 'enabled': True},
+                    'spec': {'paths': ['${CONFIG_DIR}/data', '/var/${APP}/${APP}-files']}
+                }
+            }
+        }
+
+        result, unresolved = substitute_env_variables(content, {'COLLECTION_ID': '1111', 'CONFIG_DIR': '/etc/bahub',
+                                                                'APP': 'wiki'})
+
+        self.assertEqual([], unresolved)
+        self.assertEqual({
+            'backups': {
+                'fs': {
+                    'meta': {'collection_id': '1111', 'retries': 3, 'enabled': True},
+                    'spec': {'paths': ['/etc/bahub/data', '/var/wiki/wiki-files']}
+                }
+            }
+        }, result)
+
+    def test_values_with_special_characters_are_kept_as_is(self):
+        value = 'pa"ss\\word ${NOT_A_VARIABLE} \n'
+        result, unresolved = substitute_env_variables({'password': '${PASSWORD}'}, {'PASSWORD': value})
+
+        self.assertEqual({'password': value}, result)
+        self.assertEqual([], unresolved)
+
+    def test_all_unresolved_variables_are_reported_with_paths(self):
+        content = {'accesses': {'secured': {'token': '${API_TOKEN}'}},
+                   'backups': {'fs': {'spec': {'paths': ['/ok', '${DATA_DIR}/a', '${DATA_DIR}/b']}}}}
+
+        result, unresolved = substitute_env_variables(content, {})
+
+        self.assertEqual([
+            ('API_TOKEN', 'accesses.secured.token'),
+            ('DATA_DIR', 'backups.fs.spec.paths[1]'),
+            ('DATA_DIR', 'backups.fs.spec.paths[2]')
+        ], unresolved)
+
+    def test_substitution_cost_on_large_config_and_environment(self):
+        """
+        Benchmark: previous JSON + str.replace() per variable approach vs single pass
+        (run pytest with -s to see the results, BAHUB_BENCHMARK_DEFINITIONS sets configuration size)
+        """
+
+        definitions_num = int(os.getenv('BAHUB_BENCHMARK_DEFINITIONS', 400))
+        env = {'SOME_VARIABLE_{}'.format(num): 'value-{}'.format(num) for num in range(0, 2000)}
+        env['COLLECTION_PREFIX'] = 'c'
+
+        content = {'backups': {
+            'def_{}'.format(num): {
+                'meta': {'type': 'bahub.adapters.filesystem', 'access': 'secured', 'encryption': 'strong',
+                         'collection_id': '${COLLECTION_PREFIX}-' + str(num), 'transport': 'local'},
+                'spec': {'paths': ['/var/www/${SOME_VARIABLE_%i}' % num, '/etc']}
+            } for num in range(0, definitions_num)
+        }}
+
+        started_at = perf_counter()
+        legacy_result = legacy_process_env_variables(content, env)
+        legacy_time = perf_counter() - started_at
+
+        started_at = perf_counter()
+        result, unresolved = substitute_env_variables(content, env)
+        single_pass_time = perf_counter() - started_at
+
+        print('')
+        print('{} definitions, {} environment variables: legacy={:.4f}s, single-pass={:.4f}s'.format(
+            definitions_num, len(env), legacy_time, single_pass_time
+        ))
+
+        self.assertEqual(legacy_result, result)
+        self.assertEqual([], unresolved)
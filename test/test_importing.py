@@ -1,6 +1,7 @@
+from unittest.mock import patch
 from rkd.api.testing import BasicTestingCase
 from bahub.exception import ParsingException
-from bahub.importing import Importing
+from bahub.importing import Importing, TRANSPORTS_ENTRY_POINT_GROUP
 
 
 class TestImporting(BasicTestingCase):
@@ -24,3 +25,23 @@ class TestImporting(BasicTestingCase):
         transport = Importing.import_transport('bahub.transports.sh')
 
         self.assertEqual('Transport', transport.__name__)
+
+    def test_short_names_of_builtin_plugins(self):
+        adapter, definition = Importing.import_adapter('mysql')
+
+        self.assertEqual('bahub.adapters.mysql', adapter.__module__)
+        self.assertEqual('bahub.transports.sh', Importing.import_transport('sh').__module__)
+
+    def test_short_names_are_resolved_through_entry_points(self):
+        with patch.dict(Importing._entry_points, {TRANSPORTS_ENTRY_POINT_GROUP: {'local': 'bahub.transports.sh'}}):
+            self.assertEqual('bahub.transports.sh', Importing.import_transport('local').__module__)
+
+    def test_modules_are_imported_once(self):
+        Importing.import_transport('bahub.transports.sh')
+
+        with patch('importlib.import_module') as import_module:
+            transport = Importing.import_transport('bahub.transports.sh')
+
+        import_module.assert_not_called()
+        self.assertEqual('Transport', transport.__name__)
+        self.assertIn('bahub.transports.sh', Importing.get_import_times())
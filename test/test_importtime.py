@@ -0,0 +1,49 @@
+import os
+import subprocess
+import sys
+from typing import Dict
+from rkd.api.testing import BasicTestingCase
+
+HEAVY_MODULES = ['docker', 'kubernetes', 'pycurl', 'requests']
+
+
+def measure_import(module: str) -> Dict[str, int]:
+    """
+    Imports a module in a fresh interpreter, returns cumulative import time in microseconds of each imported module
+    """
+
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import ' + module],
+                            stderr=subprocess.PIPE, stdout=subprocess.DEVNULL, check=True,
+                            cwd=os.path.dirname(os.path.realpath(__file__)) + '/..')
+    times = {}
+
+    for line in result.stderr.decode('utf-8').splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+
+        self_time, cumulative, name = line[len('import time:'):].split('|')
+        times[name.strip()] = int(cumulative)
+
+    return times
+
+
+class TestImportTime(BasicTestingCase):
+    """
+    Startup time regression test - CLI should not load SDKs of transports and notifiers that are not used
+    """
+
+    def test_heavy_sdks_are_not_imported_on_startup(self):
+        for module in ['bahub.tasks', 'bahub.transports.sh', 'bahub.configurationfactory']:
+            with self.subTest(module):
+                imported = measure_import(module)
+
+                self.assertEqual([], [name for name in HEAVY_MODULES if name in imported])
+
+    def test_tasks_import_time_is_within_budget(self):
+        budget_ms = int(os.getenv('BAHUB_IMPORT_TIME_BUDGET_MS', 1500))
+        imported = measure_import('bahub.tasks')
+
+        print('')
+        print('bahub.tasks import time: {:.1f}ms (budget {}ms)'.format(imported['bahub.tasks'] / 1000, budget_ms))
+
+        self.assertLess(imported['bahub.tasks'] / 1000, budget_ms)
@@ -1,10 +1,15 @@
 import os
-from io import BytesIO
+from io import BytesIO, StringIO
+from tempfile import NamedTemporaryFile
+from time import monotonic
+from unittest.mock import patch
 
-from rkd.api.inputoutput import IO
+from rkd.api.inputoutput import IO, StandardOutputReplication
 from rkd.api.testing import BasicTestingCase
 from bahub.exception import BufferingError
-from bahub.inputoutput import StreamableBuffer
+from bahub.inputoutput import StreamableBuffer, TransferMeter, ReadAheadReader, copy_fd, set_pipe_size, \
+    LineFramer, BatchedLineWriter
+from bahub.transports.sh import Transport as ShellTransport
 
 
 class TestStreamableBuffer(BasicTestingCase):
@@ -19,7 +24,7 @@ class TestStreamableBuffer(BasicTestingCase):
             has_exited_with_failure=lambda: True,  # read() should be checking this - we rely on this in this test
             description='Test stream via BytesIO',
             eof_callback=buf.closed,
-            pre_validation_sleep=1
+            pre_validation_timeout=1
         )
 
         # we expect that after first bytes the stream pipe breaks
@@ -75,7 +80,7 @@ class TestStreamableBuffer(BasicTestingCase):
             has_exited_with_failure=lambda: True,
             description='Test stream via BytesIO',
             eof_callback=parent_stream.closed,
-            pre_validation_sleep=0
+            pre_validation_timeout=0
         )
 
         # Current stream
@@ -89,13 +94,164 @@ class TestStreamableBuffer(BasicTestingCase):
             has_exited_with_failure=lambda: False,
             description='Test stream via BytesIO',
             eof_callback=buf.closed,
-            pre_validation_sleep=0,
+            pre_validation_timeout=0,
             parent=parent_stream_obj
         )
 
         # technically it should fail, because parent_stream_obj has has_exited_with_failure = True
         self.assertTrue(buf_obj.has_exited_with_failure())
 
+    def test_read_does_not_wait_when_data_is_flowing(self):
+        """
+        Pre-validation should not delay a healthy stream - first bytes are returned immediately
+        """
+
+        stream = ShellTransport(spec={}, io=IO())._exec_command('echo "No gods, no masters"; sleep 3')
+        started_at = monotonic()
+
+        try:
+            self.assertIn('No gods, no masters', stream.read(19))
+            self.assertLess(monotonic() - started_at, 2)
+        finally:
+            stream.close()
+
+    def test_read_detects_premature_exit_without_data(self):
+        """
+        When process exits with failure before producing any output, then the first read() raises an error
+        """
+
+        stream = ShellTransport(spec={}, io=IO())._exec_command('exit 3')
+
+        with self.assertRaises(BufferingError):
+            stream.read()
+
+    def test_wait_for_exit_waits_for_parent_chain(self):
+        parent = ShellTransport(spec={}, io=IO())._exec_command('exit 1')
+        child = ShellTransport(spec={}, io=IO())._exec_command('sleep 0.1', stdin=parent)
+
+        self.assertTrue(child.wait_for_exit(5))
+        self.assertTrue(child.has_exited_with_failure())
+        self.assertEqual(parent._description, child.find_failure_cause())
+
+    def test_copy_to_keeps_binary_data_intact(self):
+        """
+        In binary mode the data is not decoded, so bytes that are not valid UTF-8 pass through unchanged
+        """
+
+        payload = os.urandom(4 * 1024 * 1024)
+
+        with NamedTemporaryFile() as src, NamedTemporaryFile() as dst:
+            src.write(payload)
+            src.flush()
+
+            stream = ShellTransport(spec={}, io=IO())._exec_command(['cat', src.name], binary=True)
+            stream.copy_to(dst)
+            stream.close()
+
+            self.assertTrue(stream.finished_with_success())
+
+            with open(dst.name, 'rb') as f:
+                self.assertEqual(payload, f.read())
+
+    def test_copy_to_writes_into_in_memory_buffer_when_there_is_no_file_descriptor(self):
+        stream = ShellTransport(spec={}, io=IO())._exec_command(['printf', '\\377\\376IWW'], binary=True)
+        destination = BytesIO()
+
+        stream.copy_to(destination)
+        stream.close()
+
+        self.assertEqual(b'\xff\xfeIWW', destination.getvalue())
+
+    def test_copy_to_decodes_data_written_into_text_stream(self):
+        """
+        RKD's replication of sys.stderr accepts text. Data is copied in chunks of 2 bytes,
+        so the multi-byte characters are split between them
+        """
+
+        stream = ShellTransport(spec={'chunk_size': 2}, io=IO())._exec_command(['printf', 'Jaźń'], binary=True)
+        destination = StringIO()
+
+        stream.copy_to(StandardOutputReplication([destination], fileno=2))
+        stream.close()
+
+        self.assertEqual('Jaźń', destination.getvalue())
+
+    def test_copy_fd_between_regular_files(self):
+        payload = os.urandom(3 * 1024 * 1024 + 7)
+
+        with NamedTemporaryFile() as src, NamedTemporaryFile() as dst:
+            src.write(payload)
+            src.flush()
+            src.seek(0)
+
+            self.assertEqual(len(payload), copy_fd(src.fileno(), dst.fileno()))
+
+            with open(dst.name, 'rb') as f:
+                self.assertEqual(payload, f.read())
+
+    def test_copy_fd_throughput_on_synthetic_stream(self):
+        """
+        Benchmark: pushes a synthetic stream from a process through a pipe into /dev/null.
+        Set BAHUB_BENCHMARK_STREAM_MB to e.g. 4096 to measure a multi-GB transfer (run pytest with -s to see result)
+        """
+
+        size = int(os.getenv('BAHUB_BENCHMARK_STREAM_MB', '64')) * 1024 * 1024
+        stream = ShellTransport(spec={}, io=IO())._exec_command(['head', '-c', str(size), '/dev/zero'], binary=True)
+
+        with open(os.devnull, 'wb') as sink:
+            started_at = monotonic()
+            copied = copy_fd(stream.get_buffer().fileno(), sink.fileno())
+            elapsed = max(monotonic() - started_at, 1e-9)
+
+        stream.close()
+
+        print('copy_fd(): {mb}MB in {elapsed:.3f}s ({throughput:.1f}MB/s)'.format(
+            mb=size // 1024 // 1024, elapsed=elapsed, throughput=size / elapsed / 1024 / 1024))
+
+        self.assertEqual(size, copied)
+
+    def test_stats_count_bytes_actually_returned(self):
+        buf_obj = self._create_successful_example()
+
+        buf_obj.read(10)
+        buf_obj.read(1024)  # only remaining 73 bytes will be returned
+
+        self.assertEqual(83, buf_obj.stats().total_bytes)
+
+    def test_stats_include_parent_chain(self):
+        parent = self._create_successful_example()
+        parent.read()
+
+        child = ShellTransport(spec={}, io=IO())._exec_command(['printf', 'Durruti'], binary=True, stdin=parent)
+        child.copy_to(BytesIO())
+        child.close()
+
+        stats = child.stats()
+
+        self.assertEqual(7, stats.total_bytes)
+        self.assertIsNotNone(stats.time_to_first_byte)
+        self.assertEqual(83, stats.parent.total_bytes)
+        self.assertIsNone(stats.parent.parent)
+
+    def test_transport_spec_configures_chunk_size_pipe_size_and_read_ahead(self):
+        payload = os.urandom(2 * 1024 * 1024)
+        transport = ShellTransport(spec={'chunk_size': 65536, 'pipe_size': 1048576, 'read_ahead_buffers': 3}, io=IO())
+
+        with NamedTemporaryFile() as src:
+            src.write(payload)
+            src.flush()
+
+            stream = transport._exec_command(['cat', src.name], binary=True)
+            first = stream.read()
+            destination = BytesIO()
+            stream.copy_to(destination)
+            stream.close()
+
+        # read() without size reads at most a configured chunk, the rest is copied through read-ahead buffers
+        self.assertLessEqual(len(first), 65536)
+        self.assertEqual(payload, first + destination.getvalue())
+        self.assertEqual(len(payload), stream.stats().total_bytes)
+
     @staticmethod
     def _create_successful_example() -> StreamableBuffer:
         """
@@ -113,5 +269,146 @@ class TestStreamableBuffer(BasicTestingCase):
             has_exited_with_failure=lambda: False,
             description='Test stream via BytesIO',
             eof_callback=buf.closed,
-            pre_validation_sleep=0
+            pre_validation_timeout=0
         )
+
+
+class TestTransferMeter(BasicTestingCase):
+    @patch('bahub.inputoutput.monotonic')
+    def test_records_time_to_first_byte_and_stalls(self, monotonic_mock):
+        monotonic_mock.return_value = 100.0
+        meter = TransferMeter(stall_threshold=2.0)
+
+        monotonic_mock.return_value = 100.5
+        meter.record(1024)
+
+        monotonic_mock.return_value = 101.0
+        meter.record(1024)
+
+        # no data for 5 seconds
+        monotonic_mock.return_value = 106.0
+        meter.record(1024)
+
+        stats = meter.stats()
+
+        self.assertEqual(3072, stats.total_bytes)
+        self.assertEqual(0.5, stats.time_to_first_byte)
+        self.assertEqual(1, stats.stalls)
+        self.assertEqual(5.0, stats.longest_stall)
+
+    @patch('bahub.inputoutput.monotonic')
+    def test_rate_is_moving_average_of_samples(self, monotonic_mock):
+        monotonic_mock.return_value = 0.0
+        meter = TransferMeter(rate_sample_interval=1.0, ewma_alpha=0.5)
+
+        monotonic_mock.return_value = 1.0
+        meter.record(1000)   # first sample: 1000 b/s
+
+        monotonic_mock.return_value = 2.0
+        meter.record(3000)   # second sample: 3000 b/s, averaged with previous
+
+        self.assertEqual(2000.0, meter.stats().bytes_per_second)
+
+    @patch('bahub.inputoutput.monotonic')
+    def test_progress_is_reported_not_more_often_than_interval(self, monotonic_mock):
+        reports = []
+        monotonic_mock.return_value = 0.0
+        meter = TransferMeter(on_progress=reports.append, report_interval=10.0)
+
+        for second in range(0, 35):
+            monotonic_mock.return_value = float(second)
+            meter.record(100)
+
+        self.assertEqual(3, len(reports))
+        self.assertEqual(1100, reports[0].total_bytes)
+
+
+class TestReadAheadReader(BasicTestingCase):
+    def test_reads_whole_stream_in_parts(self):
+        source = BytesIO(b'Anarchism is democracy taken seriously')
+        reader = ReadAheadReader(source.readinto, chunk_size=8, buffers=2)
+
+        data = b''
+
+        while True:
+            part = reader.read(5)
+
+            if not part:
+                break
+
+            self.assertLessEqual(len(part), 5)
+            data += part
+
+        self.assertEqual(b'Anarchism is democracy taken seriously', data)
+        self.assertEqual(b'', reader.read())
+
+    def test_copy_to_writes_all_chunks(self):
+        payload = os.urandom(100000)
+        destination = BytesIO()
+        copied = []
+
+        ReadAheadReader(BytesIO(payload).readinto, chunk_size=4096, buffers=3)\
+            .copy_to(destination.write, on_copied=copied.append)
+
+        self.assertEqual(payload, destination.getvalue())
+        self.assertEqual(len(payload), sum(copied))
+
+    def test_error_in_background_thread_is_raised_to_consumer(self):
+        def failing_readinto(view):
+            raise IOError('Broken pipe to the Paris Commune')
+
+        reader = ReadAheadReader(failing_readinto, chunk_size=16)
+
+        with self.assertRaises(IOError):
+            reader.read()
+
+
+class TestSetPipeSize(BasicTestingCase):
+    def test_set_pipe_size_returns_applied_capacity(self):
+        read_fd, write_fd = os.pipe()
+
+        try:
+            self.assertGreaterEqual(set_pipe_size(read_fd, 256 * 1024), 256 * 1024)
+        finally:
+            os.close(read_fd)
+            os.close(write_fd)
+
+
+class TestLineFramer(BasicTestingCase):
+    def test_lines_split_between_chunks_are_joined(self):
+        framer = LineFramer()
+
+        self.assertEqual([], framer.feed(b'Solidarity is '))
+        self.assertEqual(['Solidarity is not charity', 'Mutual'], framer.feed(b'not charity\nMutual\n aid'))
+        self.assertEqual([' aid'], framer.flush())
+
+    def test_multibyte_character_split_between_chunks(self):
+        encoded = 'Żółć i łódź\n'.encode('utf-8')
+        framer = LineFramer()
+        lines = []
+
+        for position in range(0, len(encoded)):
+            lines += framer.feed(encoded[position:position + 1])
+
+        self.assertEqual(['Żółć i łódź'], lines)
+        self.assertEqual([], framer.flush())
+
+    def test_carriage_return_is_removed_and_invalid_bytes_are_replaced(self):
+        framer = LineFramer()
+
+        self.assertEqual(['first', 'second \ufffd'], framer.feed(b'first\r\nsecond \xff\n'))
+
+
+class TestBatchedLineWriter(BasicTestingCase):
+    def test_lines_are_written_in_batches(self):
+        written = []
+        writer = BatchedLineWriter(written.append, max_lines=3)
+
+        writer.write_lines(['1', '2'])
+        self.assertEqual([], written)
+
+        writer.write_lines(['3', '4', '5', '6', '7'])
+        writer.flush()
+
+        self.assertEqual(['1\n2\n3', '4\n5\n6', '7'], written)
+
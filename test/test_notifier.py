@@ -0,0 +1,330 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Event, Thread
+from time import perf_counter, monotonic, sleep
+from unittest.mock import patch, MagicMock
+from rkd.api.inputoutput import IO, BufferedSystemIO
+from rkd.api.testing import BasicTestingCase
+from bahub.notifier import NotifierInterface, MultiplexedNotifiers, SlackNotifier, SlackDigestNotifier, \
+    NotifierFactory, calculate_backoff, parse_retry_after
+from bahub.security import SensitiveDataRedactor
+
+
+class TestNotifierInterface(BasicTestingCase):
+    def test_filter_out_sensitive_data_uses_shared_redactor(self):
+        redactor = SensitiveDataRedactor(['api-token', 'gpg-passphrase'])
+        first = NotifierInterface({}, IO())
+        second = NotifierInterface({}, IO())
+
+        first.set_redactor(redactor)
+        second.set_redactor(redactor)
+
+        self.assertIs(first.redactor, second.redactor)
+        self.assertEqual('Failed: ******** rejected, key ********',
+                         first.filter_out_sensitive_data('Failed: api-token rejected, key gpg-passphrase'))
+
+    def test_set_sensitive_data_to_strip_out_is_backwards_compatible(self):
+        notifier = NotifierInterface({}, IO())
+        notifier.set_sensitive_data_to_strip_out(['root'])
+
+        self.assertEqual('mysql -u ******** -p********', notifier.filter_out_sensitive_data('mysql -u root -proot'))
+
+    def test_filter_out_sensitive_data_cost_per_message(self):
+        """
+        Benchmark: cost of filtering a single notification as the number of secrets grows
+        (run pytest with -s to see the results)
+        """
+
+        message = ':x: Failed to upload the backup for Definition<name=db_mysql,collection_id=1111-2222-3333>, ' \
+                  'Process exited with code 1 - secret-7-xyz'
+
+        for secrets_num in [10, 100, 1000]:
+            notifier = NotifierInterface({}, IO())
+            notifier.set_redactor(SensitiveDataRedactor(['secret-{}-xyz'.format(num) for num in range(0, secrets_num)]))
+
+            iterations = 2000
+            started_at = perf_counter()
+
+            for i in range(0, iterations):
+                result = notifier.filter_out_sensitive_data(message)
+
+            print('filter_out_sensitive_data(): {} secrets, {:.2f}us per message'.format(
+                secrets_num, (perf_counter() - started_at) / iterations * 1000000))
+
+            self.assertNotIn('secret-7-xyz', result)
+
+
+class RecordingNotifier(NotifierInterface):
+    def __init__(self, delay: float = 0):
+        super().__init__({}, BufferedSystemIO())
+        self.delay = delay
+        self.received = []
+        self.released = Event()
+
+    def starting_backup_creation(self, definition) -> None:
+        sleep(self.delay)
+        self.received.append(('starting_backup_creation', definition))
+
+    def backup_was_uploaded(self, definition) -> None:
+        self.received.append(('backup_was_uploaded', definition))
+
+    def exception_occurred(self, exception: BaseException):
+        self.released.wait(5)
+        raise exception
+
+
+class TestMultiplexedNotifiers(BasicTestingCase):
+    def test_slow_notifier_does_not_block_the_caller(self):
+        slow = RecordingNotifier(delay=1)
+        fast = RecordingNotifier()
+        notifiers = MultiplexedNotifiers({'slow': slow, 'fast': fast})
+
+        started_at = monotonic()
+        notifiers.starting_backup_creation('db')
+        notifiers.backup_was_uploaded('db')
+
+        self.assertLess(monotonic() - started_at, 0.5)
+        self.assertTrue(notifiers.flush(timeout=5))
+
+        # each notifier receives notifications in the same order as they were sent
+        expected = [('starting_backup_creation', 'db'), ('backup_was_uploaded', 'db')]
+        self.assertEqual(expected, slow.received)
+        self.assertEqual(expected, fast.received)
+
+    def test_flush_respects_deadline(self):
+        notifiers = MultiplexedNotifiers({'slow': RecordingNotifier(delay=2)})
+        notifiers.starting_backup_creation('db')
+
+        started_at = monotonic()
+
+        self.assertFalse(notifiers.flush(timeout=0.2))
+        self.assertLess(monotonic() - started_at, 1)
+
+    def test_slow_flush_of_notifier_respects_deadline(self):
+        notifier = RecordingNotifier()
+        notifier.flush = lambda: sleep(5)
+        notifiers = MultiplexedNotifiers({'digest': notifier})
+
+        started_at = monotonic()
+
+        self.assertFalse(notifiers.flush(timeout=0.2))
+        self.assertLess(monotonic() - started_at, 1)
+
+    def test_concurrent_submits_start_single_consumer_thread(self):
+        notifier = RecordingNotifier()
+        notifiers = MultiplexedNotifiers({'recording': notifier})
+        started = []
+
+        class SlowlyStartingThread(Thread):
+            def __init__(self, *args, **kwargs):
+                sleep(0.05)  # makes the race between submitting threads visible
+                super().__init__(*args, **kwargs)
+
+            def start(self):
+                started.append(self)
+                super().start()
+
+        with patch('bahub.notifier.Thread', SlowlyStartingThread), ThreadPoolExecutor(max_workers=16) as executor:
+            list(executor.map(notifiers.backup_was_uploaded, range(0, 64)))
+
+        self.assertTrue(notifiers.flush(timeout=5))
+        self.assertEqual(1, len(started))
+        self.assertEqual(64, len(notifier.received))
+
+    def test_queue_is_bounded_and_errors_are_reported(self):
+        notifier = RecordingNotifier()
+        notifiers = MultiplexedNotifiers({'blocked': notifier}, queue_size=1)
+
+        notifiers.exception_occurred(Exception('Durruti lives'))  # taken by the worker, blocks it
+        sleep(0.1)
+        notifiers.exception_occurred(Exception('queued'))
+        notifiers.exception_occurred(Exception('dropped'))
+
+        notifier.released.set()
+        notifiers.flush(timeout=5)
+
+        self.assertIn('Notifications queue is full', notifier.io.get_value())
+        self.assertIn('Durruti lives', notifier.io.get_value())
+        self.assertIn('queued', notifier.io.get_value())
+        self.assertNotIn('dropped', notifier.io.get_value())
+
+    def test_synchronous_mode_calls_notifiers_directly(self):
+        notifier = RecordingNotifier()
+        MultiplexedNotifiers({'sync': notifier}, asynchronous=False).backup_was_uploaded('db')
+
+        self.assertEqual([('backup_was_uploaded', 'db')], notifier.received)
+
+
+class TestSlackNotifier(BasicTestingCase):
+    def test_calculate_backoff_is_exponential_and_capped(self):
+        for i in range(0, 50):
+            self.assertLessEqual(calculate_backoff(0, base=1, cap=60), 1)
+            self.assertLessEqual(calculate_backoff(3, base=1, cap=60), 8)
+            self.assertLessEqual(calculate_backoff(20, base=1, cap=60), 60)
+
+    @patch('bahub.notifier.sleep')
+    @patch('requests.Session.post')
+    def test_send_retries_with_backoff(self, post: MagicMock, sleep_mock: MagicMock):
+        post.side_effect = [MagicMock(status_code=500, text='down', headers={}),
+                            MagicMock(status_code=502, text='down', headers={}),
+                            MagicMock(status_code=200)]
+
+        io = BufferedSystemIO()
+        SlackNotifier({'url': 'http://localhost', 'max_retry_num': 3, 'retry_backoff': 2}, io)._send('Hello')
+
+        self.assertEqual(3, post.call_count)
+        self.assertEqual(2, sleep_mock.call_count)
+        self.assertLessEqual(sleep_mock.call_args_list[0][0][0], 2)
+        self.assertLessEqual(sleep_mock.call_args_list[1][0][0], 4)
+        self.assertNotIn('unrecoverable', io.get_value())
+
+    @patch('bahub.notifier.sleep')
+    @patch('requests.Session.post')
+    def test_send_gives_up_after_max_retries(self, post: MagicMock, sleep_mock: MagicMock):
+        post.return_value = MagicMock(status_code=500, text='down', headers={})
+
+        io = BufferedSystemIO()
+        SlackNotifier({'url': 'http://localhost', 'max_retry_num': 2}, io)._send('Hello')
+
+        self.assertEqual(3, post.call_count)
+        self.assertIn('unrecoverable error occurred', io.get_value())
+
+    @patch('bahub.notifier.sleep')
+    @patch('requests.Session.post')
+    def test_send_honors_retry_after_header(self, post: MagicMock, sleep_mock: MagicMock):
+        post.side_effect = [MagicMock(status_code=429, text='rate limited', headers={'Retry-After': '7'}),
+                            MagicMock(status_code=503, text='down', headers={'Retry-After': '3600'}),
+                            MagicMock(status_code=200)]
+
+        SlackNotifier({'url': 'http://localhost', 'max_retry_num': 3, 'max_retry_after': 30}, IO())._send('Hello')
+
+        self.assertEqual([7.0, 30.0], [call[0][0] for call in sleep_mock.call_args_list])
+
+    def test_parse_retry_after(self):
+        self.assertEqual(5.0, parse_retry_after('5'))
+        self.assertEqual(0.0, parse_retry_after('Wed, 21 Oct 2015 07:28:00 GMT'))
+        self.assertIsNone(parse_retry_after('soon'))
+        self.assertIsNone(parse_retry_after(None))
+
+    @patch('requests.Session.post')
+    def test_connect_and_read_timeouts_are_passed_separately(self, post: MagicMock):
+        post.return_value = MagicMock(status_code=200)
+
+        SlackNotifier({'url': 'http://localhost', 'connect_timeout': 3, 'read_timeout': 15}, IO())._send('Hello')
+
+        self.assertEqual((3.0, 15.0), post.call_args[1]['timeout'])
+
+    def test_connections_are_reused_between_notifications(self):
+        """
+        Sends notifications to a local stand-in webhook server, which counts opened TCP connections
+        """
+
+        server = WebhookStandInServer()
+
+        try:
+            first = SlackNotifier({'url': server.url + '/hooks/first'}, IO())
+            second = SlackNotifier({'url': server.url + '/hooks/second'}, IO())
+
+            for i in range(0, 25):
+                first.backup_was_uploaded('db-{}'.format(i))
+                second.backup_was_uploaded('db-{}'.format(i))
+
+            self.assertEqual(50, len(server.messages))
+            self.assertEqual(1, server.connections_opened)
+        finally:
+            server.stop()
+
+
+class WebhookStandInServer(object):
+    """
+    Mattermost/Slack incoming webhook stand-in, that records messages and counts connections
+    """
+
+    def __init__(self):
+        self.messages = []
+        self.connections_opened = 0
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # keep-alive
+            disable_nagle_algorithm = True
+
+            def setup(self):
+                super().setup()
+                stand_in.connections_opened += 1
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers['Content-Length']))
+                stand_in.messages.append(json.loads(body)['text'])
+
+                self.send_response(200)
+                self.send_header('Content-Length', '2')
+                self.end_headers()
+                self.wfile.write(b'ok')
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._thread = Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        self.url = 'http://127.0.0.1:{}'.format(self._server.server_address[1])
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class TestSlackDigestNotifier(BasicTestingCase):
+    def test_events_are_aggregated_into_single_message(self):
+        notifier = SlackDigestNotifier({'url': 'http://localhost', 'window': 60}, IO())
+        sent = []
+
+        with patch.object(notifier, '_send', side_effect=sent.append):
+            notifier.starting_backup_creation('fs')
+            notifier.starting_backup_creation('db')
+            notifier.backup_was_uploaded('fs', transferred_bytes=5 * 1024 * 1024)
+            notifier.failed_to_upload_backup('db', 'Process exited with code 1')
+            notifier.starting_backup_creation('other')
+
+            self.assertEqual([], sent, msg='Expected that nothing is sent before window ends')
+            notifier.flush()
+
+        self.assertEqual(1, len(sent))
+        self.assertIn('3 definitions - 1 succeeded, 1 failed', sent[0])
+        self.assertRegex(sent[0], r':white_check_mark: fs - backup uploaded, [0-9.]+s, 5.00 MB')
+        self.assertRegex(sent[0], r':x: db - backup failed, [0-9.]+s: Process exited with code 1')
+        self.assertIn(':hourglass_flowing_sand: other - creating backup', sent[0])
+
+    def test_message_is_sent_after_window(self):
+        notifier = SlackDigestNotifier({'url': 'http://localhost', 'window': 0.05}, IO())
+        sent = Event()
+
+        with patch.object(notifier, '_send', side_effect=lambda msg: sent.set()):
+            notifier.backup_was_restored('fs')
+
+            self.assertTrue(sent.wait(5))
+
+    def test_nothing_is_sent_when_there_were_no_events(self):
+        notifier = SlackDigestNotifier({'url': 'http://localhost'}, IO())
+
+        with patch.object(notifier, '_send') as send:
+            notifier.flush()
+
+        send.assert_not_called()
+
+    def test_multiplexer_flush_sends_digest(self):
+        notifier = SlackDigestNotifier({'url': 'http://localhost', 'window': 60}, IO())
+
+        with patch.object(notifier, '_send') as send:
+            multiplexed = MultiplexedNotifiers({'digest': notifier})
+            multiplexed.backup_was_uploaded('fs')
+            multiplexed.flush(timeout=5)
+
+        send.assert_called_once()
+
+    def test_factory_creates_digest_notifier(self):
+        notifier = NotifierFactory.create('mattermost-digest', {'url': 'http://localhost'}, IO())
+
+        self.assertIsInstance(notifier, SlackDigestNotifier)
@@ -0,0 +1,102 @@
+from datetime import datetime, timedelta
+from threading import Event
+from rkd.api.inputoutput import IO, BufferedSystemIO
+from rkd.api.testing import BasicTestingCase
+from bahub.exception import ConfigurationError
+from bahub.scheduler import CronSchedule, Scheduler, ScheduledJob
+
+
+class TestCronSchedule(BasicTestingCase):
+    def test_next_after(self):
+        moment = datetime(2021, 3, 14, 23, 58, 30)  # Sunday
+
+        cases = [
+            ('* * * * *', datetime(2021, 3, 14, 23, 59)),
+            ('*/15 * * * *', datetime(2021, 3, 15, 0, 0)),
+            ('0 2 * * *', datetime(2021, 3, 15, 2, 0)),
+            ('@daily', datetime(2021, 3, 15, 0, 0)),
+            ('30 4 1 * *', datetime(2021, 4, 1, 4, 30)),
+            ('0 0 * * sat', datetime(2021, 3, 20, 0, 0)),
+            ('0 0 * * 7', datetime(2021, 3, 21, 0, 0)),
+            ('0 12 * jun-aug mon-fri', datetime(2021, 6, 1, 12, 0)),
+            ('0 0 29 feb *', datetime(2024, 2, 29, 0, 0)),
+            ('0 0 13 * 5', datetime(2021, 3, 19, 0, 0)),  # day of month OR day of week (Friday)
+            ('5,10 1-3/2 * * *', datetime(2021, 3, 15, 1, 5)),
+        ]
+
+        for expression, expected in cases:
+            with self.subTest(expression):
+                self.assertEqual(expected, CronSchedule(expression).next_after(moment))
+
+    def test_invalid_expressions_are_reported(self):
+        for expression in ['* * * *', '60 * * * *', '*/0 * * * *', '5-1 * * * *', 'every day']:
+            with self.subTest(expression):
+                with self.assertRaises(ConfigurationError):
+                    CronSchedule(expression)
+
+
+class TestScheduler(BasicTestingCase):
+    def test_due_jobs_are_dispatched_and_planned_again(self):
+        clock = {'now': datetime(2021, 3, 14, 23, 59, 30)}
+        done = Event()
+        jobs = [ScheduledJob('fs', CronSchedule('@daily')), ScheduledJob('db', CronSchedule('@hourly'))]
+
+        scheduler = Scheduler(jobs, run=lambda name: done.set(), workers=2, io=IO(), now=lambda: clock['now'])
+
+        self.assertEqual([], scheduler.tick())
+        self.assertEqual(30, scheduler.seconds_to_next_run())
+
+        clock['now'] = datetime(2021, 3, 15, 0, 0, 1)
+        self.assertEqual(['fs', 'db'], scheduler.tick())
+        self.assertEqual(datetime(2021, 3, 16, 0, 0), scheduler.get_planned_runs()['fs'])
+        self.assertEqual(datetime(2021, 3, 15, 1, 0), scheduler.get_planned_runs()['db'])
+
+        self.assertTrue(done.wait(5))
+
+    def test_jitter_delays_runs_within_limit(self):
+        now = datetime(2021, 3, 14, 12, 0, 0)
+        jobs = [ScheduledJob('def_{}'.format(i), CronSchedule('@midnight')) for i in range(0, 20)]
+        scheduler = Scheduler(jobs, run=lambda name: None, workers=1, io=IO(), jitter=600, now=lambda: now)
+
+        planned = list(scheduler.get_planned_runs().values())
+        midnight = datetime(2021, 3, 15, 0, 0)
+
+        for run_at in planned:
+            self.assertGreaterEqual(run_at, midnight)
+            self.assertLessEqual(run_at, midnight + timedelta(seconds=600))
+
+        self.assertGreater(len(set(planned)), 1, msg='Expected that not all runs start at the same time')
+
+    def test_job_is_not_run_twice_at_the_same_time(self):
+        clock = {'now': datetime(2021, 3, 14, 12, 0, 0)}
+        release = Event()
+        io = BufferedSystemIO()
+
+        scheduler = Scheduler([ScheduledJob('fs', CronSchedule('* * * * *'))], run=lambda name: release.wait(5),
+                              workers=2, io=io, now=lambda: clock['now'])
+
+        clock['now'] = datetime(2021, 3, 14, 12, 1, 0)
+        self.assertEqual(['fs'], scheduler.tick())
+
+        clock['now'] = datetime(2021, 3, 14, 12, 2, 0)
+        self.assertEqual([], scheduler.tick())
+        self.assertIn('previous run did not finish yet', io.get_value())
+
+        release.set()
+
+    def test_run_forever_stops_and_waits_for_running_jobs(self):
+        finished = []
+        stop = Event()
+
+        def run(name: str):
+            stop.set()
+            finished.append(name)
+
+        scheduler = Scheduler([ScheduledJob('fs', CronSchedule('* * * * *'))], run=run, workers=1, io=IO(),
+                              now=lambda: datetime(2021, 3, 14, 12, 0, 0))
+
+        # make the job due immediately
+        scheduler._jobs[0].run_at = datetime(2021, 3, 14, 11, 0, 0)
+        scheduler.run_forever(stop, max_sleep=0.01)
+
+        self.assertEqual(['fs'], finished)
@@ -1,5 +1,19 @@
+import os
+import yaml
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from unittest.mock import patch
+from jsonschema import validate, draft7_format_checker
+from rkd.api.inputoutput import IO
 from rkd.api.testing import BasicTestingCase
-from bahub.schema import create_example_from_attributes
+from rkd.yaml_parser import YamlFileLoader
+from bahub.adapters.mysql import Definition as MySQLDefinition
+from bahub.configurationfactory import ConfigurationFactory
+from bahub.exception import SpecificationError
+from bahub.schema import create_example_from_attributes, get_specification_validator, find_specification_errors
+from bahub.transports.sh import Transport as ShellTransport
+
+TEST_DIR = os.path.dirname(os.path.realpath(__file__))
 
 
 class TestSchema(BasicTestingCase):
@@ -40,3 +54,83 @@ class TestSchema(BasicTestingCase):
             },
             create_example_from_attributes(example)
         )
+
+
+class TestSpecificationValidation(BasicTestingCase):
+    def test_validator_is_compiled_once_per_class(self):
+        self.assertIs(get_specification_validator(MySQLDefinition), get_specification_validator(MySQLDefinition))
+        self.assertIsNot(get_specification_validator(MySQLDefinition), get_specification_validator(ShellTransport))
+
+    def test_all_errors_are_reported_at_once(self):
+        errors = find_specification_errors(MySQLDefinition, {'host': 127, 'port': 'three-three-zero-six'})
+
+        self.assertEqual(3, len(errors))
+        self.assertIn("'user' is a required property", errors[0])
+        self.assertIn("host: 127 is not of type 'string'", errors[1])
+        self.assertIn("port: 'three-three-zero-six' is not of type 'integer'", errors[2])
+
+        with self.assertRaisesRegex(SpecificationError, 'Invalid "spec" section:\n - .*required property\n - host:'):
+            MySQLDefinition.validate_spec({'host': 127, 'port': 'three-three-zero-six'})
+
+    def test_config_load_time_for_many_definitions(self):
+        """
+        Load and validate configuration with many definitions - the schema is compiled once
+        and reused by every definition (run pytest with -s to see the timings,
+        BAHUB_BENCHMARK_DEFINITIONS sets configuration size)
+        """
+
+        definitions_num = int(os.getenv('BAHUB_BENCHMARK_DEFINITIONS', 1000))
+        spec = {'host': '127.0.0.1', 'port': 3306, 'user': 'bakunin', 'password': 'mutual-aid'}
+
+        started_at = perf_counter()
+
+        for num in range(0, definitions_num):
+            validate(instance=spec, schema=MySQLDefinition.get_specification_schema(),
+                     format_checker=draft7_format_checker)
+
+        uncached_time = perf_counter() - started_at
+        started_at = perf_counter()
+
+        for num in range(0, definitions_num):
+            MySQLDefinition.validate_spec(spec)
+
+        cached_time = perf_counter() - started_at
+
+        with open(TEST_DIR + '/env/config_factory_test/bahub.test.conf.yaml') as f:
+            config = yaml.safe_load(f)
+
+        config['backups'] = {
+            'db_{}'.format(num): {
+                'meta': {'type': 'bahub.adapters.mysql', 'access': 'secured', 'encryption': 'strong',
+                         'collection_id': '1111-2222-3333-{}'.format(num), 'transport': 'local'},
+                'spec': spec
+            } for num in range(0, definitions_num)
+        }
+
+        with TemporaryDirectory() as tmp_dir:
+            with open(tmp_dir + '/config.yaml', 'w') as f:
+                yaml.dump(config, f)
+
+            started_at = perf_counter()
+
+            with patch.object(MySQLDefinition, 'get_specification_schema',
+                              wraps=MySQLDefinition.get_specification_schema) as get_schema, \
+                    patch('bahub.model.find_specification_errors', wraps=find_specification_errors) as validation:
+                factory = ConfigurationFactory(tmp_dir + '/config.yaml', debug=False, io=IO(), lazy=False,
+                                               parser=YamlFileLoader([TEST_DIR + '/../bahub/internal']))
+
+            load_time = perf_counter() - started_at
+
+        print('')
+        print('{} definitions: spec validation uncached={:.4f}s, cached={:.4f}s; '
+              'whole configuration load={:.4f}s'.format(definitions_num, uncached_time, cached_time, load_time))
+
+        self.assertEqual(definitions_num, len(factory.get_definition_names()))
+
+        # validator compiled earlier in this process is reused, the schema is not read again
+        self.assertEqual(definitions_num, validation.call_count)
+        get_schema.assert_not_called()
+        self.assertIs(get_specification_validator(MySQLDefinition), get_specification_validator(MySQLDefinition))
+
+        # compiling the schema for each definition costs a lot more than validating with a compiled one
+        self.assertLess(cached_time, uncached_time)
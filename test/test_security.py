@@ -1,5 +1,6 @@
+from io import BytesIO
 from rkd.api.testing import BasicTestingCase
-from bahub.security import create_sensitive_data_stripping_filter
+from bahub.security import create_sensitive_data_stripping_filter, SensitiveDataRedactor, RedactingWriter
 
 
 class TestSecurity(BasicTestingCase):
@@ -26,3 +27,69 @@ class TestSecurity(BasicTestingCase):
             create_sensitive_data_stripping_filter(words)('fck PiS, Trump and Konfederacja, and all parties.' +
                                                           ' fck them all!')
         )
+
+
+class TestSensitiveDataRedactor(BasicTestingCase):
+    def test_longest_secret_wins(self):
+        redactor = SensitiveDataRedactor(['pass', 'password', 'pa'], mask='***')
+
+        self.assertEqual('*** is *** and ***', redactor.redact('password is pass and pa'))
+
+    def test_redacts_bytes(self):
+        redactor = SensitiveDataRedactor(['zażółć', 'riotkit'])
+
+        self.assertEqual(b'[********] \xff ********', redactor.redact('[zażółć] '.encode('utf-8') + b'\xff riotkit'))
+
+    def test_empty_secrets_are_ignored(self):
+        self.assertEqual('Solidarity', SensitiveDataRedactor(['', None]).redact('Solidarity'))
+
+    def test_secrets_with_special_characters_are_matched_literally(self):
+        redactor = SensitiveDataRedactor(['a.c', '(x|y)*', 'price$'], mask='#')
+
+        self.assertEqual('abc # # (x) #', redactor.redact('abc a.c (x|y)* (x) price$'))
+
+    def test_many_secrets(self):
+        words = ['secret-{}-token'.format(num) for num in range(0, 500)]
+        redactor = SensitiveDataRedactor(words, mask='*')
+
+        self.assertEqual('* and * but not secret-500-token',
+                         redactor.redact('secret-7-token and secret-499-token but not secret-500-token'))
+
+    def test_stream_redacts_secret_split_between_chunks(self):
+        stream = SensitiveDataRedactor(['riotkit', 'riot'], mask='*').create_stream()
+
+        output = stream.feed('passphrase is ri') + stream.feed('otk') + stream.feed('it, no ri') \
+            + stream.feed('ots') + stream.flush()
+
+        self.assertEqual('passphrase is *, no *s', output)
+
+    def test_stream_works_on_bytes(self):
+        stream = SensitiveDataRedactor(['riotkit'], mask='*').create_stream()
+
+        output = b''
+
+        for byte in b'token=riotkit;':
+            output += stream.feed(bytes([byte]))
+
+        self.assertEqual(b'token=*;', output + stream.flush())
+
+    def test_writer_redacts_secret_split_between_writes(self):
+        destination = BytesIO()
+        writer = RedactingWriter(destination, SensitiveDataRedactor(['riotkit'], mask='*'))
+
+        writer.write(memoryview(b'token=riot'))
+        writer.write(b'kit;')
+        writer.flush()
+
+        self.assertEqual(b'token=*;', destination.getvalue())
+
+    def test_words_added_later_are_used_by_existing_output_processor(self):
+        redactor = SensitiveDataRedactor([], mask='*')
+        output_processor = redactor.create_output_processor()
+
+        self.assertEqual('user=root', output_processor('user=root'))
+
+        redactor.add_words(['root', ''])
+
+        self.assertEqual('user=*', output_processor('user=root'))
+        self.assertEqual(b'user=*', redactor.redact(b'user=root'))
@@ -0,0 +1,191 @@
+from unittest.mock import patch, MagicMock
+from docker.errors import APIError, ImageNotFound, NotFound
+from rkd.api.testing import BasicTestingCase
+from bahub.transports.docker_clients import DockerClients
+from bahub.transports.docker import Transport
+
+
+class TestDockerClients(BasicTestingCase):
+    def setUp(self) -> None:
+        super().setUp()
+        DockerClients.reset()
+
+    def tearDown(self) -> None:
+        DockerClients.reset()
+        super().tearDown()
+
+    @patch('bahub.transports.docker_clients.docker.from_env')
+    def test_client_is_shared_per_daemon(self, from_env: MagicMock):
+        from_env.side_effect = lambda: MagicMock()
+
+        with self.environment({'DOCKER_HOST': 'tcp://first:2375'}):
+            first = DockerClients.get_client()
+            self.assertIs(first, DockerClients.get_client())
+
+        with self.environment({'DOCKER_HOST': 'tcp://second:2375'}):
+            self.assertIsNot(first, DockerClients.get_client())
+
+        self.assertEqual(2, from_env.call_count)
+
+    @patch('bahub.transports.docker_clients.monotonic')
+    @patch('bahub.transports.docker_clients.docker.from_env')
+    def test_inspected_container_is_reused_until_ttl_expires(self, from_env: MagicMock, monotonic: MagicMock):
+        client = from_env.return_value
+        monotonic.return_value = 100.0
+
+        DockerClients.get_container('nginx')
+        DockerClients.get_container('nginx')
+
+        monotonic.return_value = 106.0
+        DockerClients.get_container('nginx')
+
+        self.assertEqual(2, client.containers.get.call_count)
+
+        DockerClients.invalidate_container('nginx')
+        DockerClients.get_container('nginx')
+
+        self.assertEqual(3, client.containers.get.call_count)
+
+    @patch('bahub.transports.docker_clients.docker.from_env')
+    def test_many_transports_of_one_daemon_share_connection_and_inspect(self, from_env: MagicMock):
+        """
+        Batch of definitions targeting the same container
+        """
+
+        for num in range(0, 5):
+            transport = Transport({'container': 'nginx'}, MagicMock())
+            self.assertIs(from_env.return_value, transport.client)
+            self.assertIs(from_env.return_value.containers.get.return_value, transport.fs.container)
+
+        self.assertEqual(1, from_env.call_count)
+        self.assertEqual(1, from_env.return_value.containers.get.call_count)
+        self.assertEqual({'clients_created': 1, 'clients_reused': 4, 'containers_inspected': 1,
+                          'containers_from_cache': 4, 'images_pulled': 0, 'image_pulls_skipped': 0,
+                          'api_calls_saved': 8}, Transport.get_metrics())
+
+    @patch('bahub.transports.docker_clients.docker.from_env')
+    def test_image_is_pulled_only_when_registry_digest_changed(self, from_env: MagicMock):
+        client = from_env.return_value
+        client.images.get.return_value.attrs = {'RepoDigests': ['alpine@sha256:aaa']}
+        client.images.get.return_value.id = 'sha256:local'
+        client.images.get_registry_data.return_value.id = 'sha256:aaa'
+
+        self.assertEqual('sha256:local', DockerClients.ensure_image('alpine:3.12', MagicMock(), ttl=0))
+        client.images.pull.assert_not_called()
+
+        client.images.get_registry_data.return_value.id = 'sha256:bbb'
+        client.images.pull.return_value.id = 'sha256:pulled'
+
+        self.assertEqual('sha256:pulled', DockerClients.ensure_image('alpine:3.12', MagicMock(), ttl=0))
+        client.images.pull.assert_called_once_with('alpine:3.12')
+
+        self.assertEqual(1, DockerClients.get_metrics()['images_pulled'])
+        self.assertEqual(1, DockerClients.get_metrics()['image_pulls_skipped'])
+
+    @patch('bahub.transports.docker_clients.docker.from_env')
+    def test_image_is_checked_once_per_ttl(self, from_env: MagicMock):
+        client = from_env.return_value
+        client.images.get.return_value.attrs = {'RepoDigests': ['alpine@sha256:aaa']}
+        client.images.get_registry_data.return_value.id = 'sha256:aaa'
+
+        DockerClients.ensure_image('alpine:3.12', MagicMock())
+        DockerClients.ensure_image('alpine:3.12', MagicMock())
+
+        self.assertEqual(1, client.images.get_registry_data.call_count)
+
+    @patch('bahub.transports.docker_clients.docker.from_env')
+    def test_local_image_is_used_when_registry_is_not_reachable(self, from_env: MagicMock):
+        client = from_env.return_value
+        client.images.get.return_value.id = 'sha256:local'
+        client.images.get_registry_data.side_effect = APIError('registry is down')
+        io = MagicMock()
+
+        self.assertEqual('sha256:local', DockerClients.ensure_image('alpine:3.12', io))
+        client.images.pull.assert_not_called()
+        io.warn.assert_called_once()
+
+    @patch('bahub.transports.docker_clients.docker.from_env')
+    def test_missing_image_is_pulled(self, from_env: MagicMock):
+        client = from_env.return_value
+        client.images.get.side_effect = ImageNotFound('not found')
+        client.images.get_registry_data.return_value.id = 'sha256:aaa'
+        client.images.pull.return_value.id = 'sha256:pulled'
+
+        self.assertEqual('sha256:pulled', DockerClients.ensure_image('alpine:3.12', MagicMock()))
+
+    @patch('bahub.transports.docker_clients.docker.from_env')
+    def test_schedule_on_freshly_created_transport(self, from_env: MagicMock):
+        """
+        Filesystem of the container is available without reading "client" first
+        """
+
+        container = from_env.return_value.containers.get.return_value
+        container.id = 'nginx-id'
+        container.exec_run.return_value = (0, b'/usr/bin')
+        from_env.return_value.api.exec_create.return_value = {'Id': 'exec-id'}
+
+        transport = Transport({'container': 'nginx'}, MagicMock())
+        transport.prepare_environment([])
+        transport.schedule('tar -zcf - /var/www', self._create_definition_mock(), is_backup=True)
+
+        self.assertIs(container, transport.fs.container)
+        self.assertEqual('nginx-id', from_env.return_value.api.exec_create.call_args[0][0])
+        from_env.return_value.api.exec_start.assert_called_once()
+
+    @patch('bahub.transports.docker_clients.monotonic')
+    @patch('bahub.transports.docker_clients.docker.from_env')
+    def test_transport_kept_between_runs_uses_recreated_container(self, from_env: MagicMock, monotonic: MagicMock):
+        """
+        The daemon keeps one transport per definition, while the container is recreated between runs
+        """
+
+        client = from_env.return_value
+        client.containers.get.side_effect = [self._create_container_mock('first'),
+                                             self._create_container_mock('second')]
+        client.api.exec_create.return_value = {'Id': 'exec-id'}
+
+        transport = Transport({'container': 'nginx'}, MagicMock())
+        transport.prepare_environment([])
+
+        monotonic.return_value = 100.0
+        transport.schedule('tar -zcf - /var/www', self._create_definition_mock(), is_backup=True)
+
+        monotonic.return_value = 200.0
+        transport.schedule('tar -zcf - /var/www', self._create_definition_mock(), is_backup=True)
+
+        self.assertEqual(['first', 'second'], [call[0][0] for call in client.api.exec_create.call_args_list])
+        self.assertEqual('second', transport.fs.container.id)
+
+    @patch('bahub.transports.docker_clients.docker.from_env')
+    def test_container_is_inspected_again_after_it_was_not_found(self, from_env: MagicMock):
+        client = from_env.return_value
+        client.containers.get.side_effect = [self._create_container_mock('removed'),
+                                             self._create_container_mock('recreated')]
+        client.api.exec_create.side_effect = [NotFound('No such container: removed'), {'Id': 'exec-id'}]
+
+        transport = Transport({'container': 'nginx'}, MagicMock())
+        transport.prepare_environment([])
+
+        with self.assertRaises(NotFound):
+            transport.schedule('tar -zcf - /var/www', self._create_definition_mock(), is_backup=True)
+
+        transport.schedule('tar -zcf - /var/www', self._create_definition_mock(), is_backup=True)
+
+        self.assertEqual('recreated', client.api.exec_create.call_args[0][0])
+
+    @staticmethod
+    def _create_container_mock(container_id: str) -> MagicMock:
+        container = MagicMock()
+        container.id = container_id
+        container.exec_run.return_value = (0, b'/usr/bin')
+
+        return container
+
+    @staticmethod
+    def _create_definition_mock() -> MagicMock:
+        definition = MagicMock()
+        definition.encryption.return_value.get_public_key_path.return_value = ''
+        definition.encryption.return_value.get_private_key_path.return_value = ''
+        definition.encryption.return_value.get_passphrase.return_value = ''
+
+        return definition
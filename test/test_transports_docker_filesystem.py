@@ -0,0 +1,116 @@
+import os
+import subprocess
+import tarfile
+from tempfile import TemporaryDirectory
+from typing import List
+from rkd.api.testing import BasicTestingCase
+from bahub.transports.docker import DockerFilesystemTransport
+
+
+class LocalContainer(object):
+    """
+    Stand-in for docker.models.containers.Container - executes commands in local shell, counts round trips
+    """
+
+    calls: List[list]
+
+    def __init__(self):
+        self.calls = []
+        self.id = 'local'
+
+    def exec_run(self, cmd: list, workdir: str = None):
+        self.calls.append(cmd)
+        proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, cwd=workdir)
+
+        return proc.returncode, proc.stdout
+
+    def put_archive(self, path: str, data) -> bool:
+        self.calls.append(['put_archive', path])
+
+        with tarfile.open(fileobj=data) as archive:
+            archive.extractall(path)
+
+        return True
+
+
+class TestDockerFilesystemTransport(BasicTestingCase):
+    def test_copy_to_keeps_content_and_permissions(self):
+        container = LocalContainer()
+
+        with TemporaryDirectory() as local_dir, TemporaryDirectory() as target_dir:
+            with open(local_dir + '/key', 'w') as f:
+                f.write('secret')
+
+            os.chmod(local_dir + '/key', 0o600)
+            DockerFilesystemTransport(container).copy_to(local_dir + '/key', target_dir + '/.gpg.key')
+
+            with open(target_dir + '/.gpg.key') as f:
+                self.assertEqual('secret', f.read())
+
+            self.assertEqual(0o600, os.stat(target_dir + '/.gpg.key').st_mode & 0o777)
+            self.assertEqual([['put_archive', '/']], container.calls)
+
+
+class TestDockerFilesystemOperationsBatch(BasicTestingCase):
+    def test_files_are_uploaded_in_one_request_before_operations(self):
+        container = LocalContainer()
+        fs = DockerFilesystemTransport(container)
+
+        with TemporaryDirectory() as local_dir, TemporaryDirectory() as target_dir:
+            for name in ['key', 'pub', 'tools.tar.gz']:
+                with open(local_dir + '/' + name, 'w') as f:
+                    f.write(name)
+
+            with fs.batch() as batch:
+                batch.copy_to(local_dir + '/key', target_dir + '/.gpg.key')
+                batch.copy_to(local_dir + '/pub', target_dir + '/.gpg.pub')
+                batch.force_mkdir(target_dir + '/versions')
+                batch.copy_to(local_dir + '/tools.tar.gz', target_dir + '/tools.tar.gz')
+                batch.move(target_dir + '/tools.tar.gz', target_dir + '/versions/tools.tar.gz')
+
+            self.assertEqual(['put_archive', '/'], container.calls[0])
+            self.assertEqual(2, len(container.calls))
+            self.assertEqual(['.gpg.key', '.gpg.pub', 'versions'], sorted(os.listdir(target_dir)))
+            self.assertEqual(['tools.tar.gz'], os.listdir(target_dir + '/versions'))
+
+    def test_all_operations_are_executed_in_single_exec(self):
+        container = LocalContainer()
+        fs = DockerFilesystemTransport(container)
+
+        with TemporaryDirectory() as target_dir:
+            with open(target_dir + '/tracexit', 'w') as f:
+                f.write('#!/bin/sh\n')
+
+            with fs.batch() as batch:
+                batch.force_mkdir(target_dir + '/bin/versions')
+                batch.move(target_dir + '/tracexit', target_dir + '/bin/versions/v1.0.0-trace exit')
+                batch.delete_file(target_dir + '/bin/tracexit')
+                batch.link(target_dir + '/bin/versions/v1.0.0-trace exit', target_dir + '/bin/tracexit')
+                batch.make_executable(target_dir + '/bin/versions/v1.0.0-trace exit')
+
+            self.assertEqual(1, len(container.calls))
+            self.assertTrue(os.access(target_dir + '/bin/tracexit', os.X_OK))
+
+    def test_failing_step_is_reported_and_next_steps_are_not_executed(self):
+        container = LocalContainer()
+        fs = DockerFilesystemTransport(container)
+
+        with TemporaryDirectory() as target_dir:
+            with self.assertRaises(AssertionError) as exc:
+                with fs.batch() as batch:
+                    batch.force_mkdir(target_dir + '/bin')
+                    batch.move(target_dir + '/not-existing', target_dir + '/bin/tracexit')
+                    batch.force_mkdir(target_dir + '/versions')
+
+            self.assertIn("Cannot move", str(exc.exception))
+            self.assertIn("step 2 of 3", str(exc.exception))
+            self.assertNotIn("@<br-step", str(exc.exception))
+            self.assertFalse(os.path.exists(target_dir + '/versions'))
+
+    def test_empty_batch_does_not_call_container(self):
+        container = LocalContainer()
+
+        with DockerFilesystemTransport(container).batch():
+            pass
+
+        self.assertEqual([], container.calls)
@@ -0,0 +1,164 @@
+from unittest.mock import patch, MagicMock
+from rkd.api.testing import BasicTestingCase
+from bahub.transports.docker_clients import DockerClients
+from bahub.transports.docker_sidecontainer import SideContainerPool, Transport, POOL_CLAIM_PATH
+
+
+def create_container(container_id: str, image_id: str = 'sha256:image', status: str = 'running',
+                     claimed: bool = False) -> MagicMock:
+    """
+    Container fake - "mkdir" of the claim directory fails when the container is already claimed
+    """
+
+    container = MagicMock()
+    container.id = container_id
+    container.status = status
+    container.attrs = {'Image': image_id}
+    container.claimed = claimed
+
+    def exec_run(cmd):
+        if cmd == ['mkdir', POOL_CLAIM_PATH]:
+            if container.claimed:
+                return 1, b'mkdir: File exists'
+
+            container.claimed = True
+            return 0, b''
+
+        container.claimed = False
+        return 0, b''
+
+    container.exec_run.side_effect = exec_run
+
+    return container
+
+
+class TestSideContainerPool(BasicTestingCase):
+    def test_idle_container_is_claimed(self):
+        busy = create_container('busy', claimed=True)
+        idle = create_container('idle')
+        client = MagicMock()
+        client.containers.list.return_value = [busy, idle]
+
+        pool = SideContainerPool(client, 'alpine:3.12', 'original-id', 2)
+
+        self.assertIs(idle, pool.acquire('sha256:image', MagicMock()))
+        self.assertTrue(idle.claimed)
+        busy.remove.assert_not_called()
+
+        client.containers.list.assert_called_once_with(all=True, filters={'label': [
+            'org.riotkit.bahub.side-container=alpine:3.12',
+            'org.riotkit.bahub.volumes-from=original-id'
+        ]})
+
+    def test_outdated_and_stopped_containers_are_removed(self):
+        outdated = create_container('outdated', image_id='sha256:old')
+        outdated_in_use = create_container('outdated-in-use', image_id='sha256:old', claimed=True)
+        stopped = create_container('stopped', status='exited')
+        client = MagicMock()
+        client.containers.list.return_value = [outdated, outdated_in_use, stopped]
+
+        pool = SideContainerPool(client, 'alpine:3.12', 'original-id', 2)
+
+        self.assertIsNone(pool.acquire('sha256:image', MagicMock()))
+        outdated.remove.assert_called_once_with(force=True)
+        stopped.remove.assert_called_once_with(force=True)
+        outdated_in_use.remove.assert_not_called()
+
+    def test_container_is_created_with_labels_and_claimed(self):
+        container = create_container('new')
+        client = MagicMock()
+        client.api.create_container.return_value = {'Id': 'new'}
+        client.containers.get.return_value = container
+
+        pool = SideContainerPool(client, 'alpine:3.12', 'original-id', 1)
+
+        self.assertIs(container, pool.create({'VolumesFrom': ['original-id']}))
+        self.assertTrue(container.claimed)
+        container.start.assert_called_once()
+        self.assertEqual(
+            {'org.riotkit.bahub.side-container': 'alpine:3.12', 'org.riotkit.bahub.volumes-from': 'original-id'},
+            client.api.create_container.call_args[1]['labels']
+        )
+
+    def test_released_container_is_cleaned_up_and_kept_in_pool(self):
+        container = create_container('used', claimed=True)
+        client = MagicMock()
+        client.containers.list.return_value = [container]
+
+        SideContainerPool(client, 'alpine:3.12', 'original-id', 1).release(container, MagicMock())
+
+        self.assertFalse(container.claimed)
+        self.assertIn('/tmp/.gpg.key', container.exec_run.call_args[0][0][2])
+        container.remove.assert_not_called()
+
+    def test_released_container_is_removed_when_pool_is_full(self):
+        container = create_container('used', claimed=True)
+        client = MagicMock()
+        client.containers.list.return_value = [create_container('idle'), container]
+
+        SideContainerPool(client, 'alpine:3.12', 'original-id', 1).release(container, MagicMock())
+
+        container.remove.assert_called_once_with(force=True)
+
+
+class TestSideContainerTransport(BasicTestingCase):
+    def setUp(self) -> None:
+        super().setUp()
+        DockerClients.reset()
+
+    def tearDown(self) -> None:
+        DockerClients.reset()
+        super().tearDown()
+
+    @patch('bahub.transports.docker_clients.docker.from_env')
+    def test_warm_pool_reuses_container_and_keeps_it_after_backup(self, from_env: MagicMock):
+        client = from_env.return_value
+        client.containers.get.return_value.id = 'original-id'
+        client.images.get.return_value.id = 'sha256:image'
+        idle = create_container('idle')
+        client.containers.list.return_value = [idle]
+
+        transport = Transport({'orig_container': 'db', 'temp_container_image': 'alpine:3.12', 'pull': False,
+                               'stop': False, 'warm_pool': 1}, MagicMock())
+
+        with transport:
+            self.assertIs(idle, transport.container)
+            self.assertTrue(idle.claimed)
+
+        self.assertFalse(idle.claimed)
+        idle.remove.assert_not_called()
+        client.api.create_container.assert_not_called()
+
+    @patch('bahub.transports.docker_clients.monotonic')
+    @patch('bahub.transports.docker_clients.docker.from_env')
+    def test_recreated_original_container_is_used_by_next_run(self, from_env: MagicMock, monotonic: MagicMock):
+        """
+        The daemon keeps one transport per definition, while the original container is recreated between runs
+        """
+
+        client = from_env.return_value
+        first, second = MagicMock(id='first-original-id'), MagicMock(id='second-original-id')
+        containers = {'db': first, 'temporary': MagicMock()}
+        client.containers.get.side_effect = lambda name: containers[name]
+        client.api.create_container.return_value = {'Id': 'temporary'}
+
+        transport = Transport({'orig_container': 'db', 'temp_container_image': 'alpine:3.12', 'pull': False},
+                              MagicMock())
+
+        monotonic.return_value = 100.0
+
+        with transport:
+            pass
+
+        containers['db'] = second
+        monotonic.return_value = 200.0
+
+        with transport:
+            pass
+
+        self.assertEqual([['first-original-id'], ['second-original-id']],
+                         [call[1]['volumes_from'] for call in client.api.create_host_config.call_args_list])
+        first.stop.assert_called_once()
+        first.start.assert_called_once()
+        second.stop.assert_called_once()
+        second.start.assert_called_once()
@@ -0,0 +1,43 @@
+from unittest.mock import MagicMock
+from rkd.api.inputoutput import BufferedSystemIO
+from rkd.api.testing import BasicTestingCase
+from bahub.security import SensitiveDataRedactor
+from bahub.transports.docker import Transport
+
+
+class TestDockerTransportWatch(BasicTestingCase):
+    def _create_transport(self, chunks: list, demux: bool = False):
+        io = BufferedSystemIO()
+        transport = Transport({'container': 'nginx', 'demux': demux}, io)
+        transport._client = MagicMock()
+        transport._client.api.exec_inspect.return_value = {'ExitCode': 0}
+        transport._exec_id = 'exec-id'
+        transport._exec_stream = iter(chunks)
+
+        return transport, io
+
+    def test_lines_split_between_chunks_are_logged_once(self):
+        transport, io = self._create_transport([b'Backup of "ws' + 'ą'.encode('utf-8')[0:1],
+                                                'ą'.encode('utf-8')[1:] + b'" started\nUpload',
+                                                b'ed 1 MB'])
+
+        self.assertTrue(transport.watch())
+        self.assertIn('Backup of "wsą" started', io.get_value())
+        self.assertIn('Uploaded 1 MB', io.get_value())
+
+    def test_demultiplexed_streams_are_framed_separately(self):
+        transport, io = self._create_transport([(b'out-', b'err-'), (b'line\n', None), (None, b'line\n')],
+                                               demux=True)
+
+        self.assertTrue(transport.watch())
+        self.assertEqual(18, transport.get_transferred_bytes())
+        self.assertIn('out-line', io.get_value())
+        self.assertIn('err-line', io.get_value())
+
+    def test_secret_split_between_chunks_is_redacted(self):
+        transport, io = self._create_transport([b'token=s3cr', b'3t-t0ken\n'])
+        transport.set_redactor(SensitiveDataRedactor(['s3cr3t-t0ken']))
+
+        self.assertTrue(transport.watch())
+        self.assertIn('token=********', io.get_value())
+        self.assertNotIn('s3cr', io.get_value())
@@ -1,9 +1,16 @@
 import os
+import tarfile
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO, StringIO, TextIOWrapper
+from tempfile import TemporaryDirectory
 from unittest.mock import patch
 from rkd.api.inputoutput import IO, BufferedSystemIO
 from rkd.api.testing import BasicTestingCase
+from bahub.batch import format_summary, DefinitionResult
+from bahub.bin import RequiredBinaryFromGithubRelease
+from bahub.security import SensitiveDataRedactor
 from bahub.testing import create_example_fs_definition, run_transport
-from bahub.transports.sh import Transport
+from bahub.transports.sh import Transport, LocalFilesystem
 
 
 class TestShellTransport(BasicTestingCase):
@@ -21,6 +28,86 @@ class TestShellTransport(BasicTestingCase):
 
         self.assertTrue(run_transport(definition, transport))
 
+    @patch('bahub.transports.sh.create_backup_maker_command')
+    def test_transferred_bytes_are_reported_in_batch_summary(self, create_backup_maker_command):
+        transport = self._create_example_transport(BufferedSystemIO())
+        definition = create_example_fs_definition(transport)
+
+        create_backup_maker_command.return_value = ["printf", "%02048d", "0"]
+
+        self.assertTrue(run_transport(definition, transport))
+        self.assertEqual(2048, transport.get_transferred_bytes())
+
+        summary = format_summary([DefinitionResult(definition_name='fs', success=True, elapsed=1.0,
+                                                   transferred_bytes=transport.get_transferred_bytes())])
+        self.assertIn('| 2.00 KB', summary)
+
+    @patch('bahub.transports.sh.create_backup_maker_command')
+    def test_secrets_are_redacted_in_process_output(self, create_backup_maker_command):
+        """
+        Output is copied in small chunks, so the secret is split between them
+        """
+
+        transport = Transport(spec={'shell': '/bin/bash', 'chunk_size': 4}, io=BufferedSystemIO())
+        transport.set_redactor(SensitiveDataRedactor(['s3cr3t-t0ken']))
+        definition = create_example_fs_definition(transport)
+        stderr = TextIOWrapper(BytesIO())
+
+        create_backup_maker_command.return_value = ["printf", "token=s3cr3t-t0ken;"]
+
+        with definition.transport(binaries=[]):
+            transport.schedule(command="--mocked--", definition=definition, is_backup=True)
+
+            with patch('sys.stderr', stderr):
+                self.assertTrue(transport.watch())
+
+        self.assertEqual(b'token=********;', stderr.buffer.getvalue())
+
+    @patch('bahub.transports.sh.create_backup_maker_command')
+    def test_process_output_is_written_to_log_file_when_output_is_captured(self, create_backup_maker_command):
+        """
+        Under IO().capture_descriptors() the sys.stderr has a file descriptor of the real stderr,
+        but the output must be written through it to reach the log file
+        """
+
+        transport = self._create_example_transport(BufferedSystemIO())
+        definition = create_example_fs_definition(transport)
+
+        create_backup_maker_command.return_value = ["printf", "Zażółć gęślą jaźń\\n"]
+
+        with TemporaryDirectory() as log_dir:
+            with definition.transport(binaries=[]):
+                transport.schedule(command="--mocked--", definition=definition, is_backup=True)
+
+                with IO().capture_descriptors(target_files=[log_dir + '/backup.log'], enable_standard_out=False):
+                    self.assertTrue(transport.watch())
+
+            with open(log_dir + '/backup.log', 'rb') as f:
+                self.assertEqual('Zażółć gęślą jaźń\n'.encode('utf-8'), f.read())
+
+    @patch('bahub.transports.sh.create_backup_maker_command')
+    def test_secrets_are_redacted_in_log_file_when_output_is_captured(self, create_backup_maker_command):
+        transport = Transport(spec={'shell': '/bin/bash', 'chunk_size': 4}, io=BufferedSystemIO())
+        transport.set_redactor(SensitiveDataRedactor(['s3cr3t-t0ken']))
+        definition = create_example_fs_definition(transport)
+
+        create_backup_maker_command.return_value = ["printf", "line one s3cr3t-t0ken\\nline two\\n"]
+
+        output = StringIO()
+
+        with TemporaryDirectory() as log_dir:
+            with definition.transport(binaries=[]):
+                transport.schedule(command="--mocked--", definition=definition, is_backup=True)
+
+                with IO().capture_descriptors(target_files=[log_dir + '/backup.log'], stream=output,
+                                              enable_standard_out=False):
+                    self.assertTrue(transport.watch())
+
+            with open(log_dir + '/backup.log', 'rb') as f:
+                self.assertEqual(b'line one ********\nline two\n', f.read())
+
+        self.assertEqual('line one ********\nline two\n', output.getvalue())
+
     @patch('bahub.transports.sh.create_backup_maker_command')
     def test_executes_command_locally_and_returns_failure_when_command_fails(self, create_backup_maker_command):
         transport = self._create_example_transport(BufferedSystemIO())
@@ -41,9 +128,58 @@ class TestShellTransport(BasicTestingCase):
         self.assertFalse(run_transport(definition, transport))
         self.assertIn("No such file or directory", io.get_value())
 
+    def test_definitions_prepared_in_parallel_install_tools_once(self):
+        """
+        Batch mode: many definitions on the same local shell, cold target
+        """
+
+        with TemporaryDirectory() as local_dir, TemporaryDirectory() as target_dir:
+            os.mkdir(local_dir + '/versions')
+
+            with open(local_dir + '/versions/v1.6.1-tracexit', 'wb') as f:
+                f.write(b'#!/bin/sh\n')
+
+            binaries = [RequiredBinaryFromGithubRelease("riotkit-org/tracexit", "1.6.1", "tracexit")]
+            ios = [BufferedSystemIO() for num in range(0, 8)]
+
+            def prepare(io: IO):
+                transport = self._create_example_transport(io)
+                transport.bin_path = target_dir + '/bin'
+                transport.versions_path = target_dir + '/bin/versions'
+                transport.prepare_environment(binaries)
+
+            with patch('bahub.transports.sh.BIN_VERSION_CACHE_PATH', local_dir + '/versions'):
+                with ThreadPoolExecutor(max_workers=8) as executor:
+                    list(executor.map(prepare, ios))
+
+            self.assertEqual(1, len([io for io in ios if 'Missing binaries' in io.get_value()]))
+            self.assertTrue(os.access(target_dir + '/bin/tracexit', os.X_OK))
+
     @staticmethod
     def _create_example_transport(io: IO) -> Transport:
         return Transport(
             spec={'shell': '/bin/bash'},
             io=io
         )
+
+
+class TestLocalFilesystem(BasicTestingCase):
+    def test_pack_stores_files_behind_symbolic_links(self):
+        """
+        Versions in binaries cache are links to content-addressed blobs
+        """
+
+        with TemporaryDirectory() as cache_dir:
+            os.mkdir(cache_dir + '/versions')
+
+            with open(cache_dir + '/blob', 'wb') as f:
+                f.write(b'tracexit')
+
+            os.symlink('../blob', cache_dir + '/versions/v1.0.0-tracexit')
+            LocalFilesystem().pack(cache_dir + '/archive.tar.gz', cache_dir + '/versions', ['v1.0.0-tracexit'])
+
+            with tarfile.open(cache_dir + '/archive.tar.gz') as archive:
+                member = archive.getmember('v1.0.0-tracexit')
+
+                self.assertTrue(member.isfile())
+                self.assertEqual(b'tracexit', archive.extractfile(member).read())